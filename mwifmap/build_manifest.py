@@ -0,0 +1,140 @@
+"""build manifest to skip rendering of tiles whose inputs did not change
+
+A tile digest hashes everything the output depends on: the cells of the tile region (plus a margin, as
+borders and rails look at the neighbors and rail anchors at theirs), the layer configuration, the scale,
+the source of the modules the layer classes come from, the output options and the versions of the bitmap assets and
+settings. Tiles whose digest matches the manifest entry of the last run are skipped.
+"""
+
+## IMPORTS
+
+import hashlib
+import json
+import os
+import sys
+
+from mwifmap.util import SETTINGS
+
+## CONSTANTS
+
+ASSET_DIRS = [
+    ("Bitmaps", "Terrain Bitmaps"),
+    ("Bitmaps", "Coastal Bitmaps"),
+    ("Bitmaps", "Icon Bitmaps"),
+]
+ASSET_FILES = [
+    ("Bitmaps", "AggregateRiverLake.RVR"),
+]
+
+# rings of cells around a region that its drawing depends on
+CELL_MARGIN = 2
+
+# source digests by module name, a module does not change while the process runs
+_SOURCE_DIGESTS = {}
+
+
+## FUNCTIONS
+
+def cell_digest(hexmap, region, margin=CELL_MARGIN):
+    """digest of the cells inside `region` grown by `margin` cells, across the seam on a wrapped map"""
+
+    q_min, r_min, q_max, r_max = region
+    if hexmap.wrap is True:
+        columns = sorted({q % hexmap.cols for q in range(q_min - margin, q_max + margin + 1)})
+    else:
+        columns = range(max(q_min - margin, 0), min(q_max + margin, hexmap.cols - 1) + 1)
+    digest = hashlib.sha1()
+    for q in columns:
+        for r in range(max(r_min - margin, 0), min(r_max + margin, hexmap.rows - 1) + 1):
+            cell = hexmap[q, r]
+            digest.update(repr((cell.key(), sorted(cell.items()))).encode())
+    return digest.hexdigest()
+
+
+def source_digest(module_name):
+    """digest of the source file of the module `module_name`, None if it has no source file"""
+
+    if module_name not in _SOURCE_DIGESTS:
+        path = getattr(sys.modules.get(module_name), "__file__", None)
+        digest = None
+        if path is not None and os.path.isfile(path):
+            with open(path, "rb") as fp:
+                digest = hashlib.sha1(fp.read()).hexdigest()
+        _SOURCE_DIGESTS[module_name] = digest
+    return _SOURCE_DIGESTS[module_name]
+
+
+def layer_digest(layers):
+    """digest of a layer configuration, a list of (layer class, kwargs) tuples
+
+    The source of the modules defining the layer classes and their bases is part of the digest, so a change to the
+    drawing code invalidates the tiles drawn by it.
+    """
+
+    config = [(layer_cls.__name__, sorted(kwargs.items())) for layer_cls, kwargs in layers]
+    modules = sorted({cls.__module__ for layer_cls, _ in layers for cls in layer_cls.__mro__})
+    sources = [(name, source_digest(name)) for name in modules]
+    return hashlib.sha1(repr((config, sources)).encode()).hexdigest()
+
+
+def asset_digest(base_path=None):
+    """digest of the settings and of size and mtime of the bitmap assets"""
+
+    base_path = base_path or SETTINGS["filesystem"]["basepath"]
+    paths = [os.path.join(base_path, *item) for item in ASSET_FILES]
+    for item in ASSET_DIRS:
+        dir_name = os.path.join(base_path, *item)
+        if os.path.isdir(dir_name):
+            paths.extend(os.path.join(dir_name, file_name) for file_name in os.listdir(dir_name))
+    digest = hashlib.sha1(repr(sorted((k, sorted(v.items())) for k, v in SETTINGS.items())).encode())
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+            digest.update(repr((path, stat.st_size, stat.st_mtime)).encode())
+        except OSError:
+            digest.update(repr((path, None)).encode())
+    return digest.hexdigest()
+
+
+def tile_digest(hexmap, region, scale, layers, assets, options=None):
+    """digest of all inputs of a tile, `assets` as returned by `asset_digest`
+
+    :parameters:
+        options : dict
+            output options the file depends on, e.g. its extension and compression level
+    """
+
+    return hashlib.sha1(repr((
+        cell_digest(hexmap, region),
+        layer_digest(layers),
+        float(scale or 1.0),
+        assets,
+        sorted((options or {}).items()),
+    )).encode()).hexdigest()
+
+
+## CLASSES
+
+class BuildManifest(object):
+    """json file mapping output file names to the digest of their inputs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as fp:
+                self.entries = json.load(fp)
+
+    def is_current(self, file_name, digest):
+        """True if `file_name` exists and was built from inputs with `digest`"""
+
+        return self.entries.get(file_name) == digest and os.path.exists(file_name)
+
+    def update(self, file_name, digest):
+        self.entries[file_name] = digest
+
+    def save(self):
+        with open(self.path, "w") as fp:
+            json.dump(self.entries, fp, indent=1, sort_keys=True)
+
+## EOF
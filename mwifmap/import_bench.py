@@ -0,0 +1,63 @@
+"""import time benchmark of the mwifmap modules
+
+Every module is imported in a fresh interpreter, several times, to report the median wall time of the
+import and the heavy third party packages it pulled in.
+
+    python -m mwifmap.import_bench [module ...]
+"""
+
+## IMPORTS
+
+import statistics
+import subprocess
+import sys
+
+## CONSTANTS
+
+MODULES = [
+    "mwifmap.util",
+    "mwifmap.mwif_hexmap",
+    "mwifmap.mwif_map_reader",
+    "mwifmap.map_daemon",
+    "mwifmap.mwif_map_renderer",
+    "mwifmap.mwif_map_raster",
+]
+HEAVY_PACKAGES = ["PIL", "numpy", "scipy", "svgwrite"]
+
+PROBE = """
+import sys, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(t, ",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+## FUNCTIONS
+
+def time_import(module, repeat=5):
+    """median import time of `module` in seconds and the heavy packages loaded by it"""
+
+    times = []
+    loaded = ""
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        times.append(float(out[0]))
+        loaded = out[1] if len(out) > 1 else ""
+    return statistics.median(times), loaded
+
+
+def run(modules=None, repeat=5):
+    for module in modules or MODULES:
+        seconds, loaded = time_import(module, repeat)
+        print("{:<32} {:8.1f} ms  {}".format(module, seconds * 1000, loaded or "-"))
+
+
+## MAIN
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
+
+## EOF
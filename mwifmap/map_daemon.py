@@ -0,0 +1,253 @@
+"""long running daemon answering map queries over a unix socket
+
+The map is loaded once, so scripts only pay for a socket round trip instead of the full load sequence. The
+protocol is line based: a request is a command and its space separated arguments, the reply is a single json
+line, either {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+
+    ping                    -> "pong"
+    cell Q R [FIELD ...]    -> fields of the cell, all of them if none are given, unknown fields are an error
+    neighbors Q R           -> list of [q, r]
+    distance Q1 R1 Q2 R2    -> hex distance
+    borders Q R             -> border entries of the cell
+    sea_zones Q R           -> ids of the sea zones in or adjacent to the cell
+
+The socket is created in a directory only the user can access, `$XDG_RUNTIME_DIR` or a mode 0700 directory
+in the temp dir, see `socket_path`. Use `MapClient` to talk to a running daemon.
+"""
+
+## IMPORTS
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import tempfile
+
+from mwifmap.mwif_hexmap import CELL_FIELDS
+from mwifmap.mwif_map_reader import MWIFMapReader
+
+## LOGGING
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+## CONSTANTS
+
+SOCKET_NAME = "mwifmap.sock"
+
+
+## HELPERS
+
+def socket_dir():
+    """private directory of the user for the socket, created on first use
+
+    `$XDG_RUNTIME_DIR` if it is set, otherwise a directory in the temp dir named after the user id that has to
+    be owned by the user and not be accessible by anyone else.
+    """
+
+    rval = os.environ.get("XDG_RUNTIME_DIR")
+    if rval and os.path.isdir(rval):
+        return rval
+    rval = os.path.join(tempfile.gettempdir(), "mwifmap-{}".format(os.getuid()))
+    try:
+        os.mkdir(rval, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(rval)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError("unsafe socket directory: {}".format(rval))
+    return rval
+
+
+def socket_path():
+    """default path of the daemon socket"""
+
+    return os.path.join(socket_dir(), SOCKET_NAME)
+
+
+def is_stale_socket(path):
+    """True if `path` is a socket nobody is listening on"""
+
+    if not stat.S_ISSOCK(os.lstat(path).st_mode):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            return True
+    return False
+
+
+def json_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return repr(obj)
+
+
+## CLASSES
+
+class MapQueryError(Exception):
+    pass
+
+
+class MapDaemon(object):
+    """unix socket server for queries against a loaded `MWIFMapReader`"""
+
+    def __init__(self, map_reader, path=None):
+        self.map_reader = map_reader
+        self.map = map_reader.map
+        self.path = path or socket_path()
+        self.fields = set(CELL_FIELDS).union(*(cell.keys() for cell in self.map.values()))
+        # neighbors are the most common query, and the base of the sea zone lookup
+        self.neighbor_table = {q_r: [list(n) for n in self.map.neighbors(q_r)] for q_r in self.map}
+        self.commands = {
+            "ping": self.cmd_ping,
+            "cell": self.cmd_cell,
+            "neighbors": self.cmd_neighbors,
+            "distance": self.cmd_distance,
+            "borders": self.cmd_borders,
+            "sea_zones": self.cmd_sea_zones,
+        }
+
+    ## commands
+
+    def key(self, q, r):
+        q_r = int(q), int(r)
+        if not self.map.valid_cell(q_r):
+            raise MapQueryError("invalid cell: {},{}".format(*q_r))
+        return q_r
+
+    def cmd_ping(self):
+        return "pong"
+
+    def cmd_cell(self, q, r, *fields):
+        cell = self.map[self.key(q, r)]
+        if not fields:
+            return dict(cell)
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise MapQueryError("unknown fields: {}".format(", ".join(unknown)))
+        # known fields the cell does not have are left out
+        return {name: cell[name] for name in fields if name in cell}
+
+    def cmd_neighbors(self, q, r):
+        return self.neighbor_table[self.key(q, r)]
+
+    def cmd_distance(self, q1, r1, q2, r2):
+        return int(self.map.distance(self.key(q1, r1), self.key(q2, r2)))
+
+    def cmd_borders(self, q, r):
+        return self.map[self.key(q, r)].get("borders", [])
+
+    def cmd_sea_zones(self, q, r):
+        q_r = self.key(q, r)
+        rval = set()
+        for n in [q_r] + [tuple(n) for n in self.neighbor_table[q_r]]:
+            if "sz_id" in self.map[n]:
+                rval.add(self.map[n]["sz_id"])
+        return sorted(rval)
+
+    def query(self, line):
+        """json reply line for a request line"""
+
+        try:
+            items = line.split()
+            if not items:
+                raise MapQueryError("empty request")
+            try:
+                command = self.commands[items[0]]
+            except KeyError:
+                raise MapQueryError("unknown command: {}".format(items[0]))
+            try:
+                result = command(*items[1:])
+            except (TypeError, ValueError) as ex:
+                raise MapQueryError("bad arguments for {}: {}".format(items[0], ex))
+            reply = {"ok": True, "result": result}
+        except MapQueryError as ex:
+            reply = {"ok": False, "error": str(ex)}
+        return json.dumps(reply, default=json_default, separators=(",", ":")) + "\n"
+
+    ## server
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(self.query(line.decode("utf-8")).encode("utf-8"))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.lexists(self.path):
+            # only the socket of a daemon that is gone is replaced
+            if not is_stale_socket(self.path):
+                raise FileExistsError("{} exists and is not a stale socket".format(self.path))
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        created = os.lstat(self.path)
+        logger.info("answering map queries on %s", self.path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            try:
+                info = os.lstat(self.path)
+            except FileNotFoundError:
+                info = None
+            # leave the path alone if it was replaced in the meantime
+            if info is not None and (info.st_dev, info.st_ino) == (created.st_dev, created.st_ino):
+                os.unlink(self.path)
+
+    def run(self):
+        asyncio.run(self.serve())
+
+
+class MapClient(object):
+    """client for a running `MapDaemon`, keeps the connection open between queries"""
+
+    def __init__(self, path=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path or socket_path())
+        self.fp = self.sock.makefile("rwb")
+
+    def query(self, command, *args):
+        """result of `command`, raises `MapQueryError` if the daemon reports an error"""
+
+        self.fp.write(" ".join(str(item) for item in (command,) + args).encode("utf-8") + b"\n")
+        self.fp.flush()
+        reply = json.loads(self.fp.readline())
+        if not reply["ok"]:
+            raise MapQueryError(reply["error"])
+        return reply["result"]
+
+    def close(self):
+        self.fp.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+## MAIN
+
+def serve_queries(path=None):
+    m = MWIFMapReader().load_all(verbose=True)
+    daemon = MapDaemon(m, path=path)
+    print("answering map queries on {}".format(daemon.path))
+    daemon.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve_queries()
+
+## EOF
@@ -3,6 +3,32 @@
 ## IMPORTS
 
 import collections
+import collections.abc
+import contextlib
+
+from mwifmap.util import LazyModule
+
+# numpy is only needed for the array views of the map
+np = LazyModule("numpy")
+
+## CONSTANTS
+
+# cube offsets of the neighbors, in hexside bit order
+DIRECTIONS = [
+    (-1, +1, 0),  # W
+    (0, +1, -1),  # NW
+    (+1, 0, -1),  # NE
+    (+1, -1, 0),  # E
+    (0, -1, +1),  # SE
+    (-1, 0, +1),  # SW
+]
+
+# fields held in slots of every `HexMapCell`, as set by the reader: codes and ids are ints, features like
+# `cty` are (kind, clock_pos) tuples. Rare fields like `labels`, `borders` and `hexsides` go to the overflow dict
+CELL_FIELDS = (
+    "ter_code", "wz_id", "sz_id", "country_id", "region", "res", "obj", "cty", "prt", "ice", "fac",
+    "coastal_bitmap", "sz_adj")
+_SLOTTED = frozenset(CELL_FIELDS)
 
 ## HELPERS
 
@@ -21,38 +47,91 @@ def from_cube(x_y_z):
     x, y, z = x_y_z
     return int(x + (z - (z & 1)) / 2), int(z)
 
+
+def feature_kind(value):
+    """kind of a (kind, clock_pos) feature like `cty` or `res`, other values unchanged"""
+
+    return value[0] if isinstance(value, tuple) else value
+
 ## CLASSES
 
 class HexMapError(Exception):
     pass
 
 
-class HexMapCell(collections.MutableMapping):
-    """hexmap cell"""
+class HexMapCell(collections.abc.MutableMapping):
+    """hexmap cell
+
+    The fields of `CELL_FIELDS` are stored in slots, any other field in an overflow dict that is only created
+    for cells that need it. Fields without a value are missing from the mapping like keys of a dict.
+    """
+
+    __slots__ = ("q", "r", "_map", "_extra") + CELL_FIELDS
 
     ## ctor
 
-    def __init__(self, q, r):
+    def __init__(self, q, r, hexmap=None):
         self.q = q
         self.r = r
-        self._data = {}
+        self._map = hexmap
+        self._extra = None
 
     ## MutableMapping abc implementation
 
     def __getitem__(self, key):
-        return self._data[key]
+        if key in _SLOTTED:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
 
     def __setitem__(self, key, value):
-        self._data[key] = value
+        if key in _SLOTTED:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        self.touch(key)
 
     def __delitem__(self, key):
-        del self._data[key]
+        if key in _SLOTTED:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+        self.touch(key)
 
     def __len__(self):
-        return len(self._data)
+        return sum(1 for _ in self)
 
     def __iter__(self):
-        return iter(self._data)
+        for key in CELL_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra is not None:
+            yield from list(self._extra)
+
+    def __contains__(self, key):
+        if key in _SLOTTED:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        if key in _SLOTTED:
+            return getattr(self, key, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
 
     ## special
 
@@ -64,16 +143,35 @@ class HexMapCell(collections.MutableMapping):
     def key(self):
         return self.q, self.r
 
+    def touch(self, key):
+        """flag field `key` as changed, needed after in place changes like `cell["labels"].append(..)`"""
+
+        if self._map is not None:
+            self._map.mark_dirty(self.key(), key)
 
-class HexMap(collections.Mapping):
-    """container for `HexMapCell`s on a PHOR hexagonal grid"""
+
+class HexMap(collections.abc.Mapping):
+    """container for `HexMapCell`s on a PHOR hexagonal grid
+
+    With `wrap` the grid is a cylinder: the last column neighbors the first one, for `neighbors`, `distance`
+    and `neighbor_table`, and so for everything built on them. Keys always stay in 0 <= q < cols.
+    """
 
     ## ctor
 
     def __init__(self, cols, rows, *args, **keywords):
         self.cols = cols
         self.rows = rows
-        self._cell = {(q, r): HexMapCell(q, r) for q in range(self.cols) for r in range(self.rows)}
+        self.wrap = bool(keywords.get("wrap", False))
+        self._cell = {(q, r): HexMapCell(q, r, self) for q in range(self.cols) for r in range(self.rows)}
+        # change tracking: changed fields per cell key, and a counter bumped on every change
+        self._dirty = {}
+        self._tracking = True
+        self.version = 0
+        self._field_version = {}
+        # array views
+        self._neighbor_table = None
+        self._views = {}
 
     ## Mapping abc implementation
 
@@ -95,11 +193,23 @@ class HexMap(collections.Mapping):
         return self.rows, self.cols
 
     def distance(self, orig, dest):
-        """distance between two coordinates"""
+        """distance between two coordinates, the shorter way around on a wrapped map"""
         # checks
         oq_x, oq_y, oq_z = to_cube(orig)
-        dq_x, dq_y, dq_z = to_cube(dest)
-        return max(abs(oq_x - dq_x), abs(oq_y - dq_y), abs(oq_z - dq_z))
+        shifts = (0, -self.cols, self.cols) if self.wrap else (0,)
+        rval = None
+        for shift in shifts:
+            dq_x, dq_y, dq_z = to_cube((dest[0] + shift, dest[1]))
+            dist = max(abs(oq_x - dq_x), abs(oq_y - dq_y), abs(oq_z - dq_z))
+            rval = dist if rval is None else min(rval, dist)
+        return rval
+
+    def column_shift(self, orig, dest):
+        """map widths to add to the column of `dest` to place it next to `orig`, non zero across the seam"""
+
+        if self.wrap is False:
+            return 0
+        return int(round((orig[0] - dest[0]) / float(self.cols)))
 
     def valid_cell(self, q_r):
         q, r = q_r
@@ -112,20 +222,190 @@ class HexMap(collections.Mapping):
     def neighbors(self, cell):
         """valid cells neighboring the provided cell"""
         cell_q = to_cube(cell)
-        rval = map(from_cube, [
-            (cell_q[0] + x, cell_q[1] + y, cell_q[2] + z)
-            for x, y, z in [
-                (-1, +1, 0), #W
-                (0, +1, -1), #NW
-                (+1, 0, -1), #NE
-                (+1, -1, 0), #E
-                (0, -1, +1), #SE
-                (-1, 0, +1), #SW
-            ]
-        ])
-        # TODO: might want to check for negative coordinates and provide a flag for wrapping
+        rval = map(from_cube, [(cell_q[0] + x, cell_q[1] + y, cell_q[2] + z) for x, y, z in DIRECTIONS])
+        if self.wrap is True:
+            rval = [(q % self.cols, r) for q, r in rval]
         return filter(self.valid_cell, rval)
 
+    ## array views
+
+    def index(self, q_r):
+        """position of cell `q_r` in the array views, cells are ordered like the iteration of the map"""
+
+        q, r = q_r
+        return q * self.rows + r
+
+    def key_of(self, idx):
+        """cell key at position `idx` of the array views"""
+
+        return int(idx) // self.rows, int(idx) % self.rows
+
+    def neighbor_table(self):
+        """(n_cells, 6) array of neighbor indices in W, NW, NE, E, SE, SW order, -1 off the map
+
+        Unlike `neighbors`, the columns always correspond to the hexside bits 1, 2, 4, .., 32. On a wrapped
+        map only the neighbors beyond the first and last row are off the map.
+        """
+
+        if self._neighbor_table is None:
+            q, r = np.divmod(np.arange(self.cols * self.rows), self.rows)
+            x = q - (r - (r & 1)) // 2
+            rval = np.empty((len(q), 6), dtype=np.int64)
+            for i, (dx, dy, dz) in enumerate(DIRECTIONS):
+                nr = r + dz
+                nq = x + dx + (nr - (nr & 1)) // 2
+                if self.wrap is True:
+                    nq = nq % self.cols
+                valid = (nq >= 0) & (nq < self.cols) & (nr >= 0) & (nr < self.rows)
+                rval[:, i] = np.where(valid, nq * self.rows + nr, -1)
+            self._neighbor_table = rval
+        return self._neighbor_table
+
+    def field_array(self, name, default=0, dtype=None, convert=None):
+        """array of field `name` over all cells, `default` where the cell lacks it
+
+        The array is cached until the field changes. Pass `convert` to map field values first, e.g.
+        `convert=lambda v: v[0]` for the kind of a (kind, clock_pos) feature.
+        """
+
+        def build(hexmap):
+            missing = object()
+            values = [cell.get(name, missing) for cell in hexmap._cell.values()]
+            values = [
+                default if value is missing else convert(value) if convert is not None else value
+                for value in values]
+            rval = np.array(values, dtype=dtype)
+            rval.flags.writeable = False
+            return rval
+
+        return self.view(("field_array", name, default, dtype, convert), (name,), build)
+
+    def view(self, key, fields, build):
+        """derived data of the map built by `build(self)`, cached under `key` until one of `fields` changes"""
+
+        version = self.field_version(*fields)
+        cached = self._views.get(key)
+        if cached is None or cached[0] != version:
+            cached = version, build(self)
+            self._views[key] = cached
+        return cached[1]
+
+    def query(self, *predicates, output="cells", **conditions):
+        """cells matching the predicates and field conditions, see `mwif_map_query.query`"""
+
+        from mwifmap.mwif_map_query import query
+        return query(self, *predicates, output=output, **conditions)
+
+    ## change tracking
+
+    def mark_dirty(self, q_r, field):
+        """record a change of `field` in cell `q_r`"""
+
+        if self._tracking is True:
+            if q_r not in self._dirty:
+                self._dirty[q_r] = set()
+            self._dirty[q_r].add(field)
+        self.version += 1
+        self._field_version[field] = self.version
+
+    def field_version(self, *fields):
+        """`version` of the last change to any of `fields`, 0 if they never changed"""
+
+        return max([self._field_version.get(field, 0) for field in fields] or [0])
+
+    @contextlib.contextmanager
+    def untracked(self):
+        """suspend recording dirty cells, e.g. while loading the whole map, the versions are still bumped"""
+
+        tracking = self._tracking
+        self._tracking = False
+        try:
+            yield self
+        finally:
+            self._tracking = tracking
+
+    def dirty_cells(self, fields=None, expand=True):
+        """keys of the cells changed since the last `clear_dirty`
+
+        :parameters:
+            fields : iterable or None
+                only consider changes to these fields, None for any field
+            expand : bool or int
+                rings of neighbors of changed cells to include, True for one ring as borders depend on the
+                neighbors, rail anchors depend on the coast of the neighbors and need two
+        """
+
+        if fields is None:
+            rval = set(self._dirty)
+        else:
+            fields = set(fields)
+            rval = {q_r for q_r, changed in self._dirty.items() if changed & fields}
+        frontier = rval
+        for _ in range(int(expand)):
+            frontier = {q_r for key in frontier for q_r in self.neighbors(key)} - rval
+            rval |= frontier
+        return rval
+
+    def clear_dirty(self):
+        self._dirty.clear()
+
+
+class HexsideTable(object):
+    """hexside features of a `HexMap` decoded into one (n_cells, 6) boolean array per kind
+
+    The cells store their hexside features as a list of (kind, bitmask) tuples in `field`. The table holds the
+    same information per kind, rows in `HexMap.index` order and columns in hexside bit order W, NW, NE, E,
+    SE, SW, so a hexside check is a single array read and queries vectorize over the whole map.
+    """
+
+    def __init__(self, hexmap, field="hexsides"):
+        self.hexmap = hexmap
+        self.field = field
+        self.version = hexmap.field_version(field)
+        n_cells = hexmap.cols * hexmap.rows
+        entries = collections.defaultdict(lambda: ([], []))
+        for idx, cell in enumerate(hexmap._cell.values()):
+            for kind, code in cell.get(field, ()):
+                entries[kind][0].append(idx)
+                entries[kind][1].append(code)
+        self.codes = {}
+        self.flags = {}
+        for kind, (indices, codes) in entries.items():
+            rval = np.zeros(n_cells, dtype=np.uint8)
+            np.bitwise_or.at(rval, np.array(indices, dtype=np.int64), np.array(codes, dtype=np.uint8))
+            self.codes[kind] = rval
+            self.flags[kind] = (rval[:, None] >> np.arange(6, dtype=np.uint8)) & 1 == 1
+        self._empty = np.zeros((n_cells, 6), dtype=bool)
+
+    def __getitem__(self, kind):
+        """(n_cells, 6) flags of `kind`, all False for kinds not on the map"""
+
+        return self.flags.get(kind, self._empty)
+
+    def kinds(self):
+        return sorted(self.flags)
+
+    def is_current(self):
+        return self.version == self.hexmap.field_version(self.field)
+
+    def code(self, q_r, kind):
+        """bitmask of the hexsides of cell `q_r` with `kind`"""
+
+        if kind not in self.codes:
+            return 0
+        return int(self.codes[kind][self.hexmap.index(q_r)])
+
+    def has(self, q_r, kind, side):
+        """True if hexside `side` (0 = W .. 5 = SW) of cell `q_r` has `kind`"""
+
+        return bool(self[kind][self.hexmap.index(q_r), side])
+
+    def items(self, q_r):
+        """(kind, bitmask) tuples of cell `q_r`, like the `field` list of the cell with one entry per kind"""
+
+        idx = self.hexmap.index(q_r)
+        return [(kind, int(codes[idx])) for kind, codes in sorted(self.codes.items()) if codes[idx]]
+
 
 ## MAIN
 
@@ -140,4 +420,8 @@ if __name__ == '__main__':
     print("valid_cell", list(map(m.valid_cell, n)))
     print("distance", list(map(m.distance, n, [(2, 2)] * len(n))))
 
+    w = HexMap(10, 5, wrap=True)
+    print("wrapped neighbors((0, 2)):", list(w.neighbors((0, 2))))
+    print("wrapped distance((0, 2), (9, 2)):", w.distance((0, 2), (9, 2)))
+
 ## EOF
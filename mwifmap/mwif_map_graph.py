@@ -0,0 +1,213 @@
+"""graphs derived from the map: sea zone adjacency and the rail/road network
+
+The graphs are built once from the loaded `HexMap` and stored as compact CSR arrays, so neighborhood and
+membership lookups are array slices instead of scans over the map.
+"""
+
+## IMPORTS
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, shortest_path
+
+## CONSTANTS
+
+RAIL_KINDS = ("Ra", "Ro")
+
+
+## HELPERS
+
+def csr_groups(groups, values, n_groups):
+    """CSR (indptr, indices) of `values` grouped by `groups`, both int arrays of the same length"""
+
+    order = np.lexsort((values, groups))
+    indptr = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=n_groups), out=indptr[1:])
+    return indptr, np.asarray(values)[order]
+
+
+## CLASSES
+
+class SeaZoneGraph(object):
+    """sea zone adjacency, coastal hexes and ports per sea zone
+
+    Sea zones are referred to by their `sz_id`, cells by their key. Internally zones are numbered by their
+    position in `zone_ids` and cells by `HexMap.index`.
+    """
+
+    def __init__(self, hexmap):
+        self.hexmap = hexmap
+        self.version = hexmap.version
+        table = hexmap.neighbor_table()
+        sz_id = hexmap.field_array("sz_id", default=-1, dtype=np.int64)
+        self.zone_ids = np.unique(sz_id[sz_id >= 0])
+        self.zone_index = {int(zone): i for i, zone in enumerate(self.zone_ids)}
+        n_zones = len(self.zone_ids)
+        zone_of = np.full(len(sz_id), -1, dtype=np.int64)
+        zone_of[sz_id >= 0] = np.searchsorted(self.zone_ids, sz_id[sz_id >= 0])
+
+        # zone adjacency from neighboring sea cells of different zones
+        src = np.repeat(np.arange(len(table)), 6)
+        dst = table.ravel()
+        keep = dst >= 0
+        a, b = zone_of[src[keep]], zone_of[dst[keep]]
+        keep = (a >= 0) & (b >= 0) & (a != b)
+        self.adjacency = csr_matrix(
+            (np.ones(keep.sum(), dtype=np.int8), (a[keep], b[keep])), shape=(n_zones, n_zones))
+        self.adjacency.sum_duplicates()
+        self.adjacency.data[:] = 1
+
+        # coastal hexes and ports from the sz_adj lists of the land cells
+        cells, zones, ports = [], [], []
+        for cell in hexmap.values():
+            for zone in cell.get("sz_adj", ()):
+                if zone in self.zone_index:
+                    cells.append(hexmap.index(cell.key()))
+                    zones.append(self.zone_index[zone])
+                    ports.append(cell.get("prt", (0, 0))[0] > 0)
+        cells = np.array(cells, dtype=np.int64)
+        zones = np.array(zones, dtype=np.int64)
+        ports = np.array(ports, dtype=bool)
+        self.coastal_indptr, self.coastal_cells = csr_groups(zones, cells, n_zones)
+        self.port_indptr, self.port_cells = csr_groups(zones[ports], cells[ports], n_zones)
+        self._distances = None
+
+    def __len__(self):
+        return len(self.zone_ids)
+
+    def _zone(self, zone):
+        try:
+            return self.zone_index[zone]
+        except KeyError:
+            raise KeyError("unknown sea zone: {}".format(zone))
+
+    def _keys(self, indices):
+        return [self.hexmap.key_of(idx) for idx in indices]
+
+    def adjacent(self, zone):
+        """ids of the sea zones bordering `zone`"""
+
+        i = self._zone(zone)
+        indices = self.adjacency.indices[self.adjacency.indptr[i]:self.adjacency.indptr[i + 1]]
+        return [int(z) for z in self.zone_ids[np.sort(indices)]]
+
+    def is_adjacent(self, zone_a, zone_b):
+        return bool(self.adjacency[self._zone(zone_a), self._zone(zone_b)])
+
+    def coastal_hexes(self, zone):
+        """keys of the land cells bordering `zone`"""
+
+        i = self._zone(zone)
+        return self._keys(self.coastal_cells[self.coastal_indptr[i]:self.coastal_indptr[i + 1]])
+
+    def ports(self, zone):
+        """keys of the port cells bordering `zone`"""
+
+        i = self._zone(zone)
+        return self._keys(self.port_cells[self.port_indptr[i]:self.port_indptr[i + 1]])
+
+    def zones_of(self, q_r):
+        """ids of the sea zones a cell is in or borders"""
+
+        cell = self.hexmap[q_r]
+        if "sz_id" in cell:
+            return [cell["sz_id"]]
+        return sorted(cell.get("sz_adj", ()))
+
+    def distances(self):
+        """(n_zones, n_zones) array of zone to zone steps, -1 if unreachable"""
+
+        if self._distances is None:
+            rval = shortest_path(self.adjacency, method="D", unweighted=True, directed=False)
+            rval[np.isinf(rval)] = -1
+            self._distances = rval.astype(np.int64)
+        return self._distances
+
+    def distance(self, zone_a, zone_b):
+        """number of zone moves from `zone_a` to `zone_b`, -1 if unreachable"""
+
+        return int(self.distances()[self._zone(zone_a), self._zone(zone_b)])
+
+    def reach(self, zone, steps):
+        """ids of the sea zones within `steps` zone moves of `zone`"""
+
+        row = self.distances()[self._zone(zone)]
+        return [int(z) for z in self.zone_ids[(row >= 0) & (row <= steps)]]
+
+
+class RailGraph(object):
+    """rail and road network between cells, sections across coastal hexsides are left out like in `RailLayer`
+
+    Built from the `HexsideTable` of the map. Nodes are the cells in `HexMap.index` order, every rail or road section is an undirected edge of weight 1.
+    """
+
+    def __init__(self, hexmap, hexsides, kinds=RAIL_KINDS):
+        self.hexmap = hexmap
+        self.version = hexsides.version
+        self.kinds = tuple(kinds)
+        table = hexmap.neighbor_table()
+        n_cells = len(table)
+        # (n_cells, 6) sections, off map neighbors and coastal hexsides removed
+        sections = np.zeros((n_cells, 6), dtype=bool)
+        for kind in self.kinds:
+            sections |= hexsides[kind]
+        sections &= ~hexsides["Co"] & (table >= 0)
+        src, side = np.nonzero(sections)
+        dst = table[src, side]
+        graph = csr_matrix(
+            (np.ones(len(src), dtype=np.float64), (src, dst)), shape=(n_cells, n_cells))
+        graph.sum_duplicates()
+        graph.data[:] = 1
+        # sections are drawn from both ends, make the network undirected
+        self.graph = graph.maximum(graph.T).tocsr()
+        _, labels = connected_components(self.graph, directed=False)
+        # compact network ids, cells without any section are in no network
+        railed = np.diff(self.graph.indptr) > 0
+        self.network = np.full(n_cells, -1, dtype=np.int64)
+        ids, self.network[railed] = np.unique(labels[railed], return_inverse=True)
+        self.n_networks = len(ids)
+
+    def _indices(self, keys):
+        return np.array([self.hexmap.index(q_r) for q_r in keys], dtype=np.int64)
+
+    def network_of(self, q_r):
+        """id of the network cell `q_r` is connected to, -1 if it has no rail or road"""
+
+        return int(self.network[self.hexmap.index(q_r)])
+
+    def connected(self, orig, dest):
+        """True if `orig` and `dest` are linked by the network"""
+
+        a, b = self.network_of(orig), self.network_of(dest)
+        return a >= 0 and a == b
+
+    def network_cells(self, network):
+        return [self.hexmap.key_of(idx) for idx in np.flatnonzero(self.network == network)]
+
+    def distances(self, sources, targets=None):
+        """(len(sources), len(targets)) array of sections between the cells, -1 if not connected
+
+        All sources are solved in one batched call, `targets` defaults to all cells in index order.
+        """
+
+        rval = shortest_path(
+            self.graph, method="D", directed=False, unweighted=True, indices=self._indices(sources))
+        if targets is not None:
+            rval = rval[:, self._indices(targets)]
+        rval[np.isinf(rval)] = -1
+        return rval.astype(np.int64)
+
+    def path(self, orig, dest):
+        """cell keys of a shortest route from `orig` to `dest`, None if not connected"""
+
+        i, j = self.hexmap.index(orig), self.hexmap.index(dest)
+        _, predecessors = shortest_path(
+            self.graph, method="D", directed=False, unweighted=True, indices=[i], return_predecessors=True)
+        if i != j and predecessors[0, j] < 0:
+            return None
+        rval = [j]
+        while rval[-1] != i:
+            rval.append(predecessors[0, rval[-1]])
+        return [self.hexmap.key_of(idx) for idx in reversed(rval)]
+
+## EOF
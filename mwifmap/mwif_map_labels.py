@@ -0,0 +1,205 @@
+"""name index of the map labels, for search by prefix and fuzzy search, and label placement
+
+Names are normalised (accents stripped, case folded, punctuation collapsed) before indexing. Prefix search
+bisects a sorted list of every word start of every name, so "york" finds "New York", fuzzy search scores
+names by their shared character trigrams.
+
+`place_labels` drops labels that would overlap larger ones, for drawings at scales where the labels crowd.
+"""
+
+## IMPORTS
+
+import bisect
+import collections
+import re
+import unicodedata
+
+## CONSTANTS
+
+LabelEntry = collections.namedtuple("LabelEntry", "text q_r offset size colour")
+
+MIN_SCORE = 0.3
+
+# average advance of a bold sans serif glyph and the descent, relative to the font size
+CHAR_WIDTH = 0.6
+DESCENT = 0.25
+
+
+## FUNCTIONS
+
+def normalise(text):
+    """search form of a label: accents stripped, case folded, words joined by single blanks"""
+
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+def trigrams(name):
+    """set of the character trigrams of a normalised name, padded at both ends"""
+
+    padded = "  {} ".format(name)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def text_box(x, y, text, font_size, padding=0):
+    """estimated (x0, y0, x1, y1) extent of `text` drawn with its baseline starting at (x, y)"""
+
+    return (
+        x - padding, y - font_size - padding,
+        x + len(text) * font_size * CHAR_WIDTH + padding, y + font_size * DESCENT + padding)
+
+
+def place_labels(labels, padding=0, cell_size=None):
+    """positions in `labels` of the labels kept by a greedy placement without overlaps
+
+    Labels are placed by descending size code, ties in their given order, and a label is dropped if its
+    box overlaps one already placed. The placed boxes are bucketed in a `LabelGrid`.
+
+    :parameters:
+        labels : list
+            (x, y, text, font_size, size_code) tuples, (x, y) being the start of the baseline
+        padding : float
+            extra space kept around every label
+    :returns:
+        list : the kept positions, sorted
+    """
+
+    boxes = [text_box(x, y, text, font_size, padding) for x, y, text, font_size, _ in labels]
+    if cell_size is None:
+        cell_size = max([box[3] - box[1] for box in boxes] or [1]) * 4
+    grid = LabelGrid(cell_size)
+    order = sorted(range(len(labels)), key=lambda i: (-labels[i][4], i))
+    return sorted(i for i in order if grid.insert(boxes[i]))
+
+
+## CLASSES
+
+class LabelGrid(object):
+    """boxes bucketed in a uniform grid, so overlap checks only look at the boxes in the same buckets"""
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.buckets = collections.defaultdict(list)
+
+    def _buckets(self, box):
+        x0, y0, x1, y1 = (int(v // self.cell_size) for v in box)
+        return [(i, j) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1)]
+
+    def overlaps(self, box):
+        x0, y0, x1, y1 = box
+        for bucket in self._buckets(box):
+            for a0, b0, a1, b1 in self.buckets.get(bucket, ()):
+                if a0 < x1 and x0 < a1 and b0 < y1 and y0 < b1:
+                    return True
+        return False
+
+    def insert(self, box):
+        """add `box` unless it overlaps, returns True if it was added"""
+
+        if self.overlaps(box):
+            return False
+        for bucket in self._buckets(box):
+            self.buckets[bucket].append(box)
+        return True
+
+
+class LabelIndex(object):
+    """labels of the map by normalised name
+
+    Filled with `add` while the labels are read, then `build` sorts the prefix list and the trigram
+    postings. Searches return `LabelEntry` tuples of the label text, cell key, offset, size and colour code.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.names = []
+        self._prefixes = []
+        self._trigrams = {}
+        self._n_trigrams = []
+        self._built = True
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, text, q_r, offset, size, colour):
+        self.entries.append(LabelEntry(text, q_r, offset, size, colour))
+        self.names.append(normalise(text))
+        self._built = False
+
+    def build(self):
+        """(re)build the search structures, called automatically by the searches after `add`"""
+
+        prefixes = []
+        postings = collections.defaultdict(list)
+        self._n_trigrams = []
+        for i, name in enumerate(self.names):
+            # every word start, the position tells full name matches from word matches
+            starts = [0] + [m.end() for m in re.finditer(" ", name)]
+            prefixes.extend((name[start:], start, i) for start in starts)
+            grams = trigrams(name)
+            self._n_trigrams.append(len(grams))
+            for gram in grams:
+                postings[gram].append(i)
+        prefixes.sort()
+        self._prefixes = prefixes
+        self._trigrams = dict(postings)
+        self._built = True
+
+    def _check(self):
+        if self._built is False:
+            self.build()
+
+    def find(self, text):
+        """labels named exactly `text`, after normalisation"""
+
+        self._check()
+        name = normalise(text)
+        return [entry for entry, (_, start, i) in self._prefix_range(name) if start == 0 and self.names[i] == name]
+
+    def _prefix_range(self, name):
+        lo = bisect.bisect_left(self._prefixes, (name,))
+        for item in self._prefixes[lo:]:
+            if not item[0].startswith(name):
+                break
+            yield self.entries[item[2]], item
+
+    def prefix(self, text, limit=10):
+        """labels with a word starting with `text`, names starting with it first, then by size and name"""
+
+        self._check()
+        name = normalise(text)
+        if not name:
+            return []
+        found = {}
+        for entry, (_, start, i) in self._prefix_range(name):
+            found[i] = min(found.get(i, start), start)
+        order = sorted(found, key=lambda i: (found[i] > 0, -self.entries[i].size, self.names[i], i))
+        return [self.entries[i] for i in order[:limit]]
+
+    def fuzzy(self, text, limit=10, min_score=MIN_SCORE):
+        """labels most similar to `text`, as (score, entry) by descending dice score of the trigrams"""
+
+        self._check()
+        query = trigrams(normalise(text))
+        shared = collections.Counter()
+        for gram in query:
+            shared.update(self._trigrams.get(gram, ()))
+        scored = []
+        for i, count in shared.items():
+            score = 2.0 * count / (len(query) + self._n_trigrams[i])
+            if score >= min_score:
+                scored.append((-score, self.names[i], i))
+        scored.sort()
+        return [(-score, self.entries[i]) for score, _, i in scored[:limit]]
+
+    def search(self, text, limit=10):
+        """prefix matches, topped up with fuzzy matches for the search box"""
+
+        rval = self.prefix(text, limit)
+        if len(rval) < limit:
+            seen = set(rval)
+            rval.extend(entry for _, entry in self.fuzzy(text, limit) if entry not in seen)
+        return rval[:limit]
+
+## EOF
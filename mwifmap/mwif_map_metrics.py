@@ -0,0 +1,366 @@
+"""per cell metrics over the whole map, computed on the array views of `HexMap`
+
+All results are flat arrays in the order of `HexMap.index`, use `to_grid` to get a (cols, rows) array.
+Totals per country, weather zone or any other field are aggregated with `aggregate` and `histogram`.
+"""
+
+## IMPORTS
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from mwifmap.mwif_hexmap import feature_kind
+from mwifmap.mwif_map_reader import FACTORY_CODE
+
+## CONSTANTS
+
+# named masks by `TER_CODE`, "sea" are the all sea cells, "water" the sea and lake cells and "land" the cells
+# of the land terrains, lakes are neither sea nor land
+MASKS = {
+    "land": lambda hexmap: hexmap.field_array("ter_code", default=0) >= 2,
+    "sea": lambda hexmap: hexmap.field_array("ter_code", default=0) == 0,
+    "water": lambda hexmap: hexmap.field_array("ter_code", default=0) < 2,
+}
+
+# named per cell quantities to aggregate, resources are positive `res` kinds and oil the negative ones
+MEASURES = {
+    "hexes": lambda hexmap: np.ones(hexmap.cols * hexmap.rows, dtype=np.int64),
+    "resources": lambda hexmap: np.maximum(hexmap.field_array("res", default=0, convert=feature_kind), 0),
+    "oil": lambda hexmap: np.maximum(-hexmap.field_array("res", default=0, convert=feature_kind), 0),
+    "red_factories": lambda hexmap: factories(hexmap)[:, 0],
+    "blue_factories": lambda hexmap: factories(hexmap)[:, 1],
+    "factories": lambda hexmap: factories(hexmap).sum(axis=1),
+    "cities": lambda hexmap: hexmap.field_array("cty", default=0, convert=feature_kind) > 0,
+    "capitals": lambda hexmap: hexmap.field_array("cty", default=0, convert=feature_kind) > 1,
+    "ports": lambda hexmap: hexmap.field_array("prt", default=0, convert=feature_kind) > 0,
+    "major_ports": lambda hexmap: hexmap.field_array("prt", default=0, convert=feature_kind) == 2,
+    "objectives": lambda hexmap: hexmap.field_array("obj", default=False),
+}
+
+
+## CLASSES
+
+class Components(object):
+    """connected components of a set of cells, see `components`
+
+    :attributes:
+        labels : np.ndarray
+            component id per cell in index order, -1 for cells not in any component
+        counts : np.ndarray
+            number of cells per component
+        bboxes : np.ndarray
+            (n_components, 4) array of q_min, r_min, q_max, r_max per component. On a wrapped map the
+            columns of a component crossing the seam run from q_min up to a q_max >= cols, modulo cols
+        values : list or None
+            the field value of each component when grouped by a field
+    """
+
+    def __init__(self, hexmap, labels, values=None):
+        self.hexmap = hexmap
+        self.labels = labels
+        self.values = values
+        self.n_components = int(labels.max()) + 1 if len(labels) else 0
+        inside = labels >= 0
+        self.counts = np.bincount(labels[inside], minlength=self.n_components)
+        q, r = np.divmod(np.flatnonzero(inside), hexmap.rows)
+        self.bboxes = np.empty((self.n_components, 4), dtype=np.int64)
+        self.bboxes[:, :2] = np.iinfo(np.int64).max
+        self.bboxes[:, 2:] = -1
+        np.minimum.at(self.bboxes[:, 0], labels[inside], q)
+        np.minimum.at(self.bboxes[:, 1], labels[inside], r)
+        np.maximum.at(self.bboxes[:, 2], labels[inside], q)
+        np.maximum.at(self.bboxes[:, 3], labels[inside], r)
+        if hexmap.wrap is True:
+            self.wrap_bboxes(labels[inside], q)
+
+    def __len__(self):
+        return self.n_components
+
+    def wrap_bboxes(self, labels, q):
+        """start the columns of the components touching both map edges after their widest gap of columns"""
+
+        cols = self.hexmap.cols
+        for component in np.flatnonzero((self.bboxes[:, 0] == 0) & (self.bboxes[:, 2] == cols - 1)):
+            used = np.unique(q[labels == component])
+            gaps = np.diff(np.append(used, used[0] + cols))
+            widest = int(np.argmax(gaps))
+            if gaps[widest] > 1:
+                q_min = used[(widest + 1) % len(used)]
+                self.bboxes[component, 0] = q_min
+                self.bboxes[component, 2] = used[widest] + (cols if used[widest] < q_min else 0)
+
+    def component_of(self, q_r):
+        """component id of cell `q_r`, -1 if it is in none"""
+
+        return int(self.labels[self.hexmap.index(q_r)])
+
+    def cells(self, component):
+        """keys of the cells of `component`"""
+
+        return [self.hexmap.key_of(idx) for idx in np.flatnonzero(self.labels == component)]
+
+    def adjacency(self):
+        """set of (a, b) pairs, a < b, of components with neighboring cells"""
+
+        table = self.hexmap.neighbor_table()
+        src = np.repeat(np.arange(len(table)), 6)
+        dst = table.ravel()
+        keep = dst >= 0
+        a, b = self.labels[src[keep]], self.labels[dst[keep]]
+        keep = (a >= 0) & (b >= 0) & (a < b)
+        return set(zip(a[keep].tolist(), b[keep].tolist()))
+
+
+class GroupIndex(object):
+    """cells grouped by the values of one or more fields, see `group_index`
+
+    Every cell gets the id of its group, so aggregations are single `np.bincount` calls. Cells lacking any of
+    the fields are in no group. Feature fields like `cty` are grouped by their kind.
+
+    :attributes:
+        codes : np.ndarray
+            group id per cell in index order, -1 for cells not in any group
+        keys : list
+            the field value of each group, a tuple of values when grouping by several fields, sorted
+        counts : np.ndarray
+            number of cells per group
+    """
+
+    def __init__(self, hexmap, fields):
+        self.hexmap = hexmap
+        self.fields = tuple(fields)
+        n_cells = hexmap.cols * hexmap.rows
+        columns = [
+            hexmap.field_array(field, default=None, dtype=object, convert=feature_kind) for field in self.fields]
+        inside = np.ones(n_cells, dtype=bool)
+        for column in columns:
+            inside &= np.array([value is not None for value in column])
+        values = list(zip(*[column[inside].tolist() for column in columns]))
+        keys = sorted(set(values))
+        lookup = {key: i for i, key in enumerate(keys)}
+        self.codes = np.full(n_cells, -1, dtype=np.int64)
+        self.codes[inside] = [lookup[value] for value in values]
+        self.keys = keys if len(self.fields) > 1 else [key[0] for key in keys]
+        self.n_groups = len(keys)
+        self.counts = np.bincount(self.codes[inside], minlength=self.n_groups)
+
+    def __len__(self):
+        return self.n_groups
+
+    def group_of(self, q_r):
+        """field value(s) of the group of cell `q_r`, None if it is in none"""
+
+        code = self.codes[self.hexmap.index(q_r)]
+        return self.keys[code] if code >= 0 else None
+
+    def _select(self, cells):
+        selected = self.codes >= 0
+        if cells is not None:
+            selected &= cell_mask(self.hexmap, cells)
+        return selected
+
+    def sum(self, values, cells=None):
+        """per group sums of the per cell `values`, optionally only over `cells` (see `cell_mask`)"""
+
+        selected = self._select(cells)
+        return np.bincount(
+            self.codes[selected], weights=np.asarray(values)[selected], minlength=self.n_groups)
+
+    def count(self, cells=None):
+        """number of `cells` per group"""
+
+        if cells is None:
+            return self.counts
+        return np.bincount(self.codes[self._select(cells)], minlength=self.n_groups)
+
+    def histogram(self, values, cells=None):
+        """occurrences of each distinct per cell value in every group
+
+        :returns:
+            tuple : the sorted distinct values and a (n_groups, n_values) array of counts
+        """
+
+        selected = self._select(cells)
+        bins, inverse = np.unique(np.asarray(values)[selected], return_inverse=True)
+        counts = np.bincount(
+            self.codes[selected] * len(bins) + inverse.ravel(), minlength=self.n_groups * len(bins))
+        return bins, counts.reshape(self.n_groups, len(bins))
+
+    def as_dict(self, totals):
+        """{group value: total} of an array of per group totals"""
+
+        return dict(zip(self.keys, np.asarray(totals).tolist()))
+
+
+## FUNCTIONS
+
+def factories(hexmap):
+    """(n_cells, 2) array of red and blue factories, decoded from the `fac` codes with `FACTORY_CODE`"""
+
+    codes = hexmap.field_array("fac", default=0, convert=feature_kind)
+    lookup = np.zeros((max(max(FACTORY_CODE), int(codes.max())) + 1, 2), dtype=np.int64)
+    for code, counts in FACTORY_CODE.items():
+        lookup[code] = counts
+    return lookup[codes]
+
+
+def cell_mask(hexmap, cells):
+    """boolean array over all cells
+
+    :parameters:
+        cells : None, str, callable, array or iterable
+            None for all cells, a name of `MASKS`, a predicate called with each `HexMapCell`, a boolean
+            array in index order or an iterable of cell keys
+    """
+
+    n_cells = hexmap.cols * hexmap.rows
+    if cells is None:
+        return np.ones(n_cells, dtype=bool)
+    if isinstance(cells, str):
+        return MASKS[cells](hexmap)
+    if isinstance(cells, np.ndarray):
+        if cells.shape != (n_cells,) or cells.dtype != bool:
+            raise ValueError("cell mask needs a boolean array of shape ({},)".format(n_cells))
+        return cells
+    rval = np.zeros(n_cells, dtype=bool)
+    if callable(cells):
+        rval[:] = [bool(cells(cell)) for cell in hexmap.values()]
+    else:
+        rval[[hexmap.index(q_r) for q_r in cells]] = True
+    return rval
+
+
+def to_grid(hexmap, values):
+    """reshape a flat per cell array to (cols, rows), index with [q, r]"""
+
+    return np.asarray(values).reshape(hexmap.cols, hexmap.rows)
+
+
+def distance_field(hexmap, sources, mask=None):
+    """hex distance from every cell to the nearest source, -1 where no source is reachable
+
+    One multi source breadth first search over `HexMap.neighbor_table`, linear in the number of cells.
+
+    :parameters:
+        sources : see `cell_mask`
+            the source cells, e.g. `lambda c: c.get("prt", (0, 0))[0] > 0` for ports
+        mask : see `cell_mask`
+            cells the search may enter, e.g. "land", sources outside of the mask still seed the search
+    :returns:
+        np.ndarray : int distances in index order
+    """
+
+    table = hexmap.neighbor_table()
+    passable = cell_mask(hexmap, mask)
+    rval = np.full(len(table), -1, dtype=np.int64)
+    frontier = np.flatnonzero(cell_mask(hexmap, sources))
+    rval[frontier] = 0
+    step = 0
+    while len(frontier):
+        step += 1
+        nbrs = table[frontier].ravel()
+        nbrs = nbrs[nbrs >= 0]
+        nbrs = np.unique(nbrs[(rval[nbrs] < 0) & passable[nbrs]])
+        rval[nbrs] = step
+        frontier = nbrs
+    return rval
+
+
+def components(hexmap, cells=None, field=None):
+    """label the connected components of `cells`, split by the value of `field` if given
+
+    E.g. `components(m, "land")` for the landmasses, or `components(m, field="country_id")` for the
+    contiguous parts of every country. Cells lacking `field` are in no component.
+
+    :parameters:
+        cells : see `cell_mask`
+            the cells to label
+        field : str or None
+            neighbors are only connected if they have the same value of this field
+    :returns:
+        Components : labels, counts, bounding boxes and adjacency of the components
+    """
+
+    table = hexmap.neighbor_table()
+    inside = cell_mask(hexmap, cells).copy()
+    codes = np.zeros(len(table), dtype=np.int64)
+    values = None
+    if field is not None:
+        raw = hexmap.field_array(field, default=None, dtype=object)
+        inside &= np.array([value is not None for value in raw])
+        lookup = {}
+        codes[inside] = [lookup.setdefault(value, len(lookup)) for value in raw[inside]]
+    src = np.repeat(np.arange(len(table)), 6)
+    dst = table.ravel()
+    keep = dst >= 0
+    src, dst = src[keep], dst[keep]
+    keep = inside[src] & inside[dst] & (codes[src] == codes[dst])
+    graph = coo_matrix(
+        (np.ones(keep.sum(), dtype=np.int8), (src[keep], dst[keep])), shape=(len(table), len(table)))
+    _, raw_labels = connected_components(graph, directed=False)
+    # compact ids for the labelled cells, in the order of their first cell
+    _, first, inverse = np.unique(raw_labels[inside], return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    labels = np.full(len(table), -1, dtype=np.int64)
+    labels[inside] = order[inverse]
+    if field is not None:
+        cell_values = raw[inside]
+        values = [None] * len(first)
+        for component, idx in zip(order, first):
+            values[component] = cell_values[idx]
+    return Components(hexmap, labels, values)
+
+def group_index(hexmap, by):
+    """`GroupIndex` of the cells by field or tuple of fields `by`, cached until one of the fields changes"""
+
+    fields = (by,) if isinstance(by, str) else tuple(by)
+    return hexmap.view(("group_index",) + fields, fields, lambda m: GroupIndex(m, fields))
+
+
+def measure_array(hexmap, measure):
+    """per cell values of `measure`: a name of `MEASURES`, a numeric field name or an array in index order"""
+
+    if isinstance(measure, str):
+        if measure in MEASURES:
+            return MEASURES[measure](hexmap)
+        return hexmap.field_array(measure, default=0, convert=feature_kind)
+    return np.asarray(measure)
+
+
+def aggregate(hexmap, by, measure="hexes", cells=None):
+    """totals of `measure` per group of cells sharing the values of the `by` fields
+
+    E.g. `aggregate(m, "country_id", "oil")` for the oil per country, or
+    `aggregate(m, ("country_id", "ter_code"))` for the hex count per country and terrain.
+
+    :parameters:
+        by : str or tuple
+            field(s) to group by, see `GroupIndex`
+        measure : see `measure_array`
+            the per cell values to sum
+        cells : see `cell_mask`
+            only aggregate over these cells
+    :returns:
+        dict : {group value: total}, integer totals for integer measures
+    """
+
+    groups = group_index(hexmap, by)
+    values = measure_array(hexmap, measure)
+    totals = groups.sum(values, cells)
+    if values.dtype.kind in "biu":
+        totals = totals.round().astype(np.int64)
+    return groups.as_dict(totals)
+
+
+def histogram(hexmap, by, field, cells=None):
+    """{group value: {value: count}} of the values of `field` per group of cells, e.g. the terrain mix"""
+
+    groups = group_index(hexmap, by)
+    bins, counts = groups.histogram(measure_array(hexmap, field), cells)
+    bins = bins.tolist()
+    return {
+        key: {value: count for value, count in zip(bins, row) if count}
+        for key, row in zip(groups.keys, counts.tolist())}
+
+## EOF
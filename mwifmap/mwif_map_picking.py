@@ -0,0 +1,139 @@
+"""pixel to hex picking and viewport queries, the inverse of `BaseLayer.hex_origin`
+
+The map is a pointy top, odd row offset grid. Rows are horizontal bands of height .75 * h: the lower part of
+a band, below the slanted edges, belongs to the cells of that row only, the upper part is split between the
+row and the row above by the zigzag of the slanted top edges. This makes the inverse exact and O(1) per
+point, and all of it is vectorized with numpy so thousands of points are picked at once.
+"""
+
+## IMPORTS
+
+import numpy as np
+
+from mwifmap.util import get_hex_dims, get_hex_proto
+
+
+## CLASSES
+
+class HexPicker(object):
+    """maps pixel positions of a drawing at `scale` to cell keys
+
+    :parameters:
+        scale : float
+            scale of the drawing
+        origin : tuple
+            (q, r) of the top left cell of the drawing, i.e. `region[:2]` of a `MapDrawing`
+        cols, rows : int
+            size of the map, cells outside of it are reported as (-1, -1), None for no limit
+        offset : tuple
+            pixel position of the top left cell origin, `hex_origin` adds a 1 pixel margin
+        wrap : bool
+            the map wraps east-west, columns are taken modulo `cols`
+    """
+
+    def __init__(self, scale=1.0, origin=(0, 0), cols=None, rows=None, offset=(1, 1), wrap=False):
+        self.scale = float(scale)
+        self.origin = tuple(int(v) for v in origin)
+        self.cols = cols
+        self.rows = rows
+        self.offset = tuple(offset)
+        self.wrap = bool(wrap) and cols is not None
+        self.hex_w, self.hex_h = get_hex_dims(self.scale)
+        proto = get_hex_proto(self.scale)
+        # height of the slanted top edges and the row pitch
+        self.edge_h = proto[1][1] - proto[0][1]
+        self.pitch = proto[2][1] - proto[0][1]
+
+    @classmethod
+    def for_drawing(cls, drawing):
+        """picker for the pixel space of a `MapDrawing`"""
+
+        hexmap = drawing.map_reader.map
+        return cls(drawing.scale, drawing.region[:2], hexmap.cols, hexmap.rows, wrap=hexmap.wrap)
+
+    ## picking
+
+    def column(self, x, r):
+        """column index and position inside the column in [0, 1) of pixel x in absolute row r"""
+
+        u = (x - (r % 2) * self.hex_w / 2) / self.hex_w
+        col = np.floor(u)
+        return col, u - col
+
+    def pixel_to_hex(self, x, y):
+        """cell keys for the pixel positions `x`, `y` (scalars or arrays), as arrays q, r"""
+
+        x = np.asarray(x, dtype=float) - self.offset[0]
+        y = np.asarray(y, dtype=float) - self.offset[1]
+        band = np.floor(y / self.pitch)
+        dy = y - band * self.pitch
+        r = band.astype(int) + self.origin[1]
+        col, u = self.column(x, r)
+        # above the zigzag of the top edges the point belongs to the row above
+        above = dy < self.edge_h * np.abs(2 * u - 1)
+        r = np.where(above, r - 1, r)
+        col = np.where(above, self.column(x, r)[0], col)
+        q = col.astype(int) + self.origin[0]
+        if self.wrap is True:
+            q = q % self.cols
+        if self.cols is not None and self.rows is not None:
+            valid = (q >= 0) & (q < self.cols) & (r >= 0) & (r < self.rows)
+            q = np.where(valid, q, -1)
+            r = np.where(valid, r, -1)
+        return q, r
+
+    def pick(self, x, y):
+        """cell key at pixel position (x, y), None outside of the map"""
+
+        q, r = self.pixel_to_hex(x, y)
+        if q < 0:
+            return None
+        return int(q), int(r)
+
+    def hex_origin(self, q, r):
+        """top left pixel of the bounding box of cell (q, r), same as `BaseLayer.hex_origin`"""
+
+        q = np.asarray(q)
+        r = np.asarray(r)
+        left = (r % 2) * self.hex_w / 2 + (q - self.origin[0]) * self.hex_w + self.offset[0]
+        top = (r - self.origin[1]) * self.pitch + self.offset[1]
+        return left, top
+
+    ## viewport
+
+    def viewport_cells(self, x0, y0, x1, y1):
+        """keys of the cells intersecting the pixel box (x0, y0, x1, y1), in the (q, r) order of the map
+
+        On a wrapped map a box reaching past the east or west edge gets the cells across the seam.
+        """
+
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        # candidates from the bounding boxes
+        r_min = int(np.floor((y0 - self.offset[1] - self.hex_h) / self.pitch)) + self.origin[1]
+        r_max = int(np.floor((y1 - self.offset[1]) / self.pitch)) + self.origin[1]
+        q_min = int(np.floor((x0 - self.offset[0] - self.hex_w) / self.hex_w)) + self.origin[0]
+        q_max = int(np.floor((x1 - self.offset[0]) / self.hex_w)) + self.origin[0]
+        if self.cols is not None and self.rows is not None:
+            r_min, r_max = max(r_min, 0), min(r_max, self.rows - 1)
+            if self.wrap is False:
+                q_min, q_max = max(q_min, 0), min(q_max, self.cols - 1)
+        if q_min > q_max or r_min > r_max:
+            return []
+        q, r = np.meshgrid(np.arange(q_min, q_max + 1), np.arange(r_min, r_max + 1), indexing="ij")
+        q, r = q.ravel(), r.ravel()
+        left, top = self.hex_origin(q, r)
+        hit = (left < x1) & (left + self.hex_w > x0) & (top < y1) & (top + self.hex_h > y0)
+        # separating axis test against the normals of the two slanted edge directions
+        proto = np.array(get_hex_proto(self.scale))
+        box = np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+        for normal in ((self.edge_h, self.hex_w / 2), (self.edge_h, -self.hex_w / 2)):
+            hex_proj = proto.dot(normal)
+            box_proj = box.dot(normal)
+            base = left * normal[0] + top * normal[1]
+            hit &= (base + hex_proj.min() < box_proj.max()) & (base + hex_proj.max() > box_proj.min())
+        if self.wrap is True:
+            return sorted({(int(qq) % self.cols, int(rr)) for qq, rr in zip(q[hit], r[hit])})
+        return [(int(qq), int(rr)) for qq, rr in zip(q[hit], r[hit])]
+
+## EOF
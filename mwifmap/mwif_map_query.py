@@ -0,0 +1,342 @@
+"""declarative cell queries over a `HexMap`
+
+Predicates are built from `Field` comparisons combined with `&`, `|` and `~`, and evaluated as vectorized
+tests over the array views of the map. Equality and membership tests on the `INDEXED_FIELDS` are answered
+from a secondary index, and conjunctions start with the most selective indexed term, so only its candidate
+cells are tested against the rest:
+
+    query(m, (Field("ter_code") == "mountain") & (Field("wz_id") == "MED") & (Field("prt") > 0), country_id=12)
+
+Feature fields like `cty` and `prt` compare by their kind. For `ter_code`, `wz_id`, `cty` and `prt` the names
+of the reader code tables may be used instead of the codes.
+"""
+
+## IMPORTS
+
+import abc
+import numbers
+
+import numpy as np
+
+from mwifmap.mwif_hexmap import feature_kind
+from mwifmap.mwif_map_reader import CITY_CODE, PORT_CODE, TER_CODE, WZ_CODE
+
+## CONSTANTS
+
+INDEXED_FIELDS = ("ter_code", "wz_id", "country_id", "sz_id", "cty", "prt")
+
+# fields whose values, or feature kinds, are numbers
+NUMERIC_FIELDS = ("ter_code", "wz_id", "sz_id", "country_id", "region", "res", "obj", "cty", "prt", "ice", "fac")
+
+# field -> {name: code}, to query by the names of the code tables
+NAMED_VALUES = {
+    field: {name: code for code, name in table.items()}
+    for field, table in (("ter_code", TER_CODE), ("wz_id", WZ_CODE), ("cty", CITY_CODE), ("prt", PORT_CODE))}
+
+OUTPUTS = ("cells", "keys", "indices", "mask")
+
+
+## HELPERS
+
+def field_values(hexmap, name):
+    """(present, values) arrays of field `name` in index order, values are int64 where possible"""
+
+    def build(hexmap):
+        raw = hexmap.field_array(name, default=None, dtype=object, convert=feature_kind)
+        present = np.array([value is not None for value in raw], dtype=bool)
+        try:
+            values = np.where(present, raw, 0).astype(np.int64)
+        except (TypeError, ValueError):
+            values = raw
+        return present, values
+
+    return hexmap.view(("query_values", name), (name,), build)
+
+
+def field_index(hexmap, name):
+    """`FieldIndex` of field `name`, rebuilt when the field changes"""
+
+    return hexmap.view(("query_index", name), (name,), lambda m: FieldIndex(m, name))
+
+
+def resolve(name, value):
+    """code of `value` for field `name`, names of `NAMED_VALUES` are translated
+
+    Raises a ValueError for values that cannot be compared with a field of `NUMERIC_FIELDS`.
+    """
+
+    if isinstance(value, str) and name in NAMED_VALUES:
+        try:
+            return NAMED_VALUES[name][value]
+        except KeyError:
+            raise ValueError("unknown {} value: {}".format(name, value))
+    if name in NUMERIC_FIELDS and not isinstance(value, numbers.Real):
+        raise ValueError("{} values are numbers, not {!r}".format(name, value))
+    return value
+
+
+## CLASSES
+
+class FieldIndex(object):
+    """secondary index of a field: the sorted cell indices of every value, as CSR arrays"""
+
+    def __init__(self, hexmap, name):
+        present, values = field_values(hexmap, name)
+        cells = np.flatnonzero(present)
+        order = np.argsort(values[cells], kind="stable")
+        self.values, counts = np.unique(values[cells][order], return_counts=True)
+        self.indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.cells = cells[order]
+
+    def __len__(self):
+        return len(self.values)
+
+    def lookup(self, value):
+        """sorted indices of the cells with `value`"""
+
+        i = np.searchsorted(self.values, value)
+        if i == len(self.values) or self.values[i] != value:
+            return self.cells[:0]
+        return self.cells[self.indptr[i]:self.indptr[i + 1]]
+
+    def count(self, value):
+        return len(self.lookup(value))
+
+
+class Predicate(abc.ABC):
+    """base of the query predicates, combine with `&`, `|` and `~`"""
+
+    @abc.abstractmethod
+    def test(self, hexmap, idx):
+        """boolean array, True where the cells `idx` match"""
+
+    def candidates(self, hexmap):
+        """sorted indices of a superset of the matching cells from an index, None if there is no index"""
+
+        return None
+
+    def select(self, hexmap, idx=None):
+        """sorted indices of the matching cells, optionally only out of `idx`"""
+
+        if idx is None:
+            idx = self.candidates(hexmap)
+            if idx is None:
+                idx = np.arange(hexmap.cols * hexmap.rows)
+        return idx[self.test(hexmap, idx)]
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Compare(Predicate):
+    """comparison of a field with a value, cells lacking the field never match"""
+
+    OPS = {
+        "==": np.equal,
+        "!=": np.not_equal,
+        "<": np.less,
+        "<=": np.less_equal,
+        ">": np.greater,
+        ">=": np.greater_equal,
+    }
+
+    def __init__(self, name, op, value):
+        self.name = name
+        self.op = op
+        if op == "in":
+            self.value = [resolve(name, item) for item in value]
+        else:
+            self.value = resolve(name, value)
+
+    def __repr__(self):
+        return "Field({!r}) {} {!r}".format(self.name, self.op, self.value)
+
+    def test(self, hexmap, idx):
+        present, values = field_values(hexmap, self.name)
+        values = values[idx]
+        if self.op == "in":
+            return present[idx] & np.isin(values, self.value)
+        return present[idx] & self.OPS[self.op](values, self.value)
+
+    def candidates(self, hexmap):
+        if self.name not in INDEXED_FIELDS or self.op not in ("==", "in"):
+            return None
+        index = field_index(hexmap, self.name)
+        if self.op == "==":
+            return index.lookup(self.value)
+        return np.unique(np.concatenate([index.lookup(value) for value in self.value] or [index.cells[:0]]))
+
+
+class Exists(Predicate):
+    """cells that have the field"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Field({!r}).exists()".format(self.name)
+
+    def test(self, hexmap, idx):
+        return field_values(hexmap, self.name)[0][idx]
+
+
+class Where(Predicate):
+    """python predicate called with each `HexMapCell`, slow, for whatever the fields cannot express"""
+
+    def __init__(self, func):
+        self.func = func
+
+    def test(self, hexmap, idx):
+        return np.array([bool(self.func(hexmap[hexmap.key_of(i)])) for i in idx], dtype=bool)
+
+
+class And(Predicate):
+
+    def __init__(self, *terms):
+        self.terms = terms
+
+    def __repr__(self):
+        return "({})".format(" & ".join(map(repr, self.terms)))
+
+    def test(self, hexmap, idx):
+        rval = np.ones(len(idx), dtype=bool)
+        for term in self.terms:
+            rval[rval] = term.test(hexmap, idx[rval])
+        return rval
+
+    def candidates(self, hexmap):
+        rval = None
+        for term in self.terms:
+            found = term.candidates(hexmap)
+            if found is not None and (rval is None or len(found) < len(rval)):
+                rval = found
+        return rval
+
+
+class Or(Predicate):
+
+    def __init__(self, *terms):
+        self.terms = terms
+
+    def __repr__(self):
+        return "({})".format(" | ".join(map(repr, self.terms)))
+
+    def test(self, hexmap, idx):
+        rval = np.zeros(len(idx), dtype=bool)
+        for term in self.terms:
+            rval[~rval] = term.test(hexmap, idx[~rval])
+        return rval
+
+    def candidates(self, hexmap):
+        found = [term.candidates(hexmap) for term in self.terms]
+        if any(item is None for item in found):
+            return None
+        return np.unique(np.concatenate(found))
+
+
+class Not(Predicate):
+
+    def __init__(self, term):
+        self.term = term
+
+    def __repr__(self):
+        return "~{!r}".format(self.term)
+
+    def test(self, hexmap, idx):
+        return ~self.term.test(hexmap, idx)
+
+
+class Field(object):
+    """a cell field in a query, comparisons with it are predicates"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, value):
+        return Compare(self.name, "==", value)
+
+    def __ne__(self, value):
+        return Compare(self.name, "!=", value)
+
+    def __lt__(self, value):
+        return Compare(self.name, "<", value)
+
+    def __le__(self, value):
+        return Compare(self.name, "<=", value)
+
+    def __gt__(self, value):
+        return Compare(self.name, ">", value)
+
+    def __ge__(self, value):
+        return Compare(self.name, ">=", value)
+
+    __hash__ = object.__hash__
+
+    def isin(self, values):
+        return Compare(self.name, "in", values)
+
+    def exists(self):
+        return Exists(self.name)
+
+
+## FUNCTIONS
+
+def condition(name, value):
+    """predicate of a `query` keyword: a list, tuple or set tests membership, True and False test the
+    presence of a non zero value and a callable is called with the field value, anything else tests equality"""
+
+    if value is True:
+        return Field(name) != 0
+    if value is False:
+        return ~(Field(name) != 0)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return Field(name).isin(value)
+    if callable(value):
+        return Where(lambda cell: name in cell and bool(value(feature_kind(cell[name]))))
+    return Field(name) == value
+
+
+def compile_query(*predicates, **conditions):
+    """single predicate of `predicates` and keyword `conditions`, all of which must hold"""
+
+    terms = list(predicates) + [condition(name, value) for name, value in sorted(conditions.items())]
+    if not terms:
+        return And()
+    if len(terms) == 1:
+        return terms[0]
+    return And(*terms)
+
+
+def query(hexmap, *predicates, output="cells", **conditions):
+    """cells matching all `predicates` and keyword `conditions`, see `condition`
+
+    E.g. `query(m, ter_code="mountain", wz_id="MED", country_id=12, prt=True)`.
+
+    :parameters:
+        output : str
+            "cells" for a list of `HexMapCell`, "keys" for their (q, r), "indices" for an array of
+            `HexMap.index` positions or "mask" for a boolean array over all cells
+    """
+
+    if output not in OUTPUTS:
+        raise ValueError("unknown query output: {}".format(output))
+    idx = compile_query(*predicates, **conditions).select(hexmap)
+    if output == "indices":
+        return idx
+    if output == "mask":
+        rval = np.zeros(hexmap.cols * hexmap.rows, dtype=bool)
+        rval[idx] = True
+        return rval
+    keys = [hexmap.key_of(i) for i in idx]
+    if output == "keys":
+        return keys
+    return [hexmap[q_r] for q_r in keys]
+
+## EOF
@@ -0,0 +1,487 @@
+"""render map directly to raster images using `PIL` and `numpy`
+
+The raster layers mirror the svg layers in `mwif_map_renderer` and reuse their geometry, but composite
+into a single RGBA pixel buffer instead of building an svg document. Hex shaped bitmaps are pasted
+through a hex mask that is computed once per size and scale.
+"""
+
+## IMPORTS
+
+import functools
+import logging
+import os
+import numpy as np
+from PIL import ImageDraw, ImageFont
+
+from mwifmap.mwif_map_renderer import (
+    MapDrawing, BaseLayer, TerrainLayer, CoastalLayer, RVRLayer, RailLayer, HexsideLayer, FeatureLayer, GridLayer,
+    LabelLayer, BorderLayer, TER_BMP_FILE)
+from mwifmap.sprites import get_scaled_image
+from mwifmap.util import *
+
+## LOGGING
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+## CONSTANTS
+
+HEXSIDE_POINTS = {
+    # hexside bit: index of start and end point in the hex prototype
+    1: (4, 5),
+    2: (5, 0),
+    4: (0, 1),
+    8: (1, 2),
+    16: (2, 3),
+    32: (3, 4),
+}
+
+
+## HELPERS
+
+@functools.lru_cache(maxsize=32)
+def hex_mask(size, scale=1.0):
+    """PIL "L" mask of the hex shape for an image of `size`, computed vectorized over the pixel centers"""
+
+    w, h = size
+    proto = np.asarray(get_hex_proto(scale), dtype=float)
+    ys, xs = np.mgrid[0:h, 0:w] + .5
+    inside = np.ones((h, w), dtype=bool)
+    for (x0, y0), (x1, y1) in zip(proto, np.roll(proto, -1, axis=0)):
+        # prototype is clockwise in screen coordinates, inside is right of every edge
+        inside &= (x1 - x0) * (ys - y0) - (y1 - y0) * (xs - x0) >= 0
+    return Image.fromarray(inside.astype(np.uint8) * 255, "L")
+
+
+@functools.lru_cache(maxsize=32)
+def get_font(size):
+    """bold truetype font of `size` pixels, at least 1, the default bitmap font if it is not installed"""
+
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", max(int(size), 1))
+    except (IOError, OSError):
+        return ImageFont.load_default()
+
+
+def dashed_line(draw, start, end, dash, fill, width):
+    """draw a line from `start` to `end` with a svg like dasharray of (on, off)"""
+
+    on, off = dash
+    (x0, y0), (x1, y1) = start, end
+    length = ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** .5
+    if length == 0:
+        return
+    ux, uy = (x1 - x0) / length, (y1 - y0) / length
+    pos = 0.0
+    while pos < length:
+        stop = min(pos + on, length)
+        draw.line([(x0 + ux * pos, y0 + uy * pos), (x0 + ux * stop, y0 + uy * stop)], fill=fill, width=width)
+        pos += on + off
+
+
+## CLASSES
+
+class RasterDrawing(MapDrawing):
+    """wrapper to render the map to a png or webp image"""
+
+    EXTENSIONS = (".png", ".webp")
+
+    def __init__(self, *args, **kwargs):
+        self.save_kwargs = kwargs.pop("save_kwargs", {})
+        self.image = None
+        super(RasterDrawing, self).__init__(*args, **kwargs)
+
+    def init_surface(self):
+        self.svg = None
+        self.image = Image.new(
+            "RGBA",
+            (int(math.ceil(self.svg_width)), int(math.ceil(self.svg_height))),
+            self.background or (0, 0, 0, 0))
+
+    def render_background(self):
+        # background colour is set when the surface is created
+        pass
+
+    def update(self, finalise=True):
+        """layers can not be replaced in a pixel buffer, re-render all layers if any of them is dirty"""
+
+        rval = [layer for layer in self.layers if layer.is_dirty()]
+        if rval:
+            self.init_surface()
+            for layer in self.layers:
+                layer.stats.reset()
+            self.render(finalise=finalise)
+        return rval
+
+    def save(self):
+        image = self.image
+        if self.svg_name.endswith(".webp"):
+            image.save(self.svg_name, format="WEBP", **self.save_kwargs)
+        else:
+            image.save(self.svg_name, format="PNG", **self.save_kwargs)
+
+
+class RasterLayer(BaseLayer):
+    """base class of the raster layers, draws into the image of the parent `RasterDrawing`"""
+
+    def __init__(self, parent, *args, **kwargs):
+        super(RasterLayer, self).__init__(parent, *args, **kwargs)
+        self.image = self.parent.image
+        self.draw = None
+
+    def render(self, *args, **kwargs):
+        self.image = self.parent.image
+        self.draw = ImageDraw.Draw(self.image)
+        with self.stats.timer():
+            self._render(*args, **kwargs)
+        self.draw = None
+        logger.debug("%s finished!", self.stats)
+
+    def add(self, element=None):
+        """account for one draw operation"""
+
+        self.stats.elements += 1
+
+    def add_def(self, element=None):
+        self.stats.defs += 1
+
+    def paste_hex(self, image, q, r):
+        """paste `image` onto the hex at (q, r), clipped to the hex shape"""
+
+        left, top = self.hex_origin(q, r)
+        mask = hex_mask(image.size, self.scale)
+        self.image.paste(image, (int(round(left)), int(round(top))), mask)
+        self.add()
+
+    def hexside_lines(self, q, r, sides):
+        """point pairs of the hexsides of (q, r) flagged in the bitmask `sides`"""
+
+        points = self.hex_points(q, r)
+        return [(points[a], points[b]) for bit, (a, b) in sorted(HEXSIDE_POINTS.items()) if sides & bit]
+
+    def text(self, xy, text, fill, size, anchor="ls"):
+        font = get_font(size)
+        try:
+            self.draw.text(xy, text, fill=fill, font=font, anchor=anchor)
+        except ValueError:
+            # bitmap fonts do not support anchors
+            self.draw.text(xy, text, fill=fill, font=font)
+        self.add()
+
+
+class RasterTerrainLayer(RasterLayer):
+    FIELDS = TerrainLayer.FIELDS
+
+    def __init__(self, parent, *args, **kwargs):
+        super(RasterTerrainLayer, self).__init__(parent, *args, **kwargs)
+        self.simple = bool(kwargs.pop("simple", False))
+        self.TER_CODE = {}
+        self.TER_BMP = {}
+        if self.simple is False:
+            for ter_code, file_name in TER_BMP_FILE.items():
+                bmp_path = os.path.join(
+                    SETTINGS["filesystem"]["basepath"],
+                    "Bitmaps", "Terrain Bitmaps",
+                    file_name)
+                self.TER_BMP[ter_code] = get_scaled_image(
+                    (bmp_path, "RGBA"), lambda: Image.open(bmp_path).convert("RGBA"), self.scale)
+        else:
+            for i in range(12):
+                self.TER_CODE[i] = SETTINGS["colour"]["ter{:02d}".format(i)]
+
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            if self.simple is True:
+                self.draw.polygon(self.hex_points(cell.q, cell.r), fill=self.TER_CODE[cell["ter_code"]])
+                self.add()
+            elif "coastal_bitmap" not in cell:
+                self.paste_hex(self.TER_BMP[cell["ter_code"]], cell.q, cell.r)
+
+
+class RasterCoastalLayer(RasterLayer, CoastalLayer):
+    def _render(self, *args, **kwargs):
+        with self.sprites.region_pass():
+            if self.simple is False:
+                self.sprites.prepare((self.map[q_r] for q_r in self.region_keys()), self.scale)
+            for cell in self.region_cells():
+                if "coastal_bitmap" not in cell:
+                    continue
+                if self.simple is True:
+                    points = self.hex_points(cell.q, cell.r)
+                    x = points[0][0]
+                    y = points[1][1] + (points[2][1] - points[1][1]) / 2
+                    self.text((x, y), "C", fill="black", size=36, anchor="ms")
+                else:
+                    self.paste_hex(self.sprites.sprite(*cell["coastal_bitmap"], scale=self.scale), cell.q, cell.r)
+
+
+class RasterRVRLayer(RasterLayer, RVRLayer):
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            if cell.key() not in self.RVR_DATA:
+                continue
+            hex_img = get_scaled_image((self.rvr_file, cell.key()), self.RVR_DATA[cell.key()], self.scale)
+            left, top = self.hex_origin(cell.q, cell.r)
+            # rvr planes carry their own transparency
+            self.image.paste(hex_img, (int(round(left)), int(round(top))), hex_img)
+            self.add()
+
+
+class RasterGridLayer(RasterLayer, GridLayer):
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            points = self.hex_points(cell.q, cell.r)
+            self.draw.polygon(points, outline=self.colour)
+            self.add()
+            if self.coords is True:
+                x, y = self.hex_origin(cell.q, cell.r)
+                # vertical text, rendered horizontal and rotated
+                font = get_font(10)
+                text = "{:03d}-{:03d}".format(cell.q, cell.r)
+                left, top, right, bottom = font.getbbox(text)
+                label = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+                ImageDraw.Draw(label).text((-left, -top), text, fill=self.colour, font=font)
+                label = label.rotate(-90, expand=True)
+                self.image.paste(
+                    label,
+                    (int(x + 125 * self.scale - label.size[0] / 2), int(y + 76 * self.scale - label.size[1] / 2)),
+                    label)
+                self.add()
+
+
+class RasterRailLayer(RasterLayer, RailLayer):
+    def _render(self, *args, **kwargs):
+        base, dash = self.rail_style
+        self.hexsides = self.parent.map_reader.hexside_table()
+        for cell in self.region_cells():
+            if "hexsides" not in cell:
+                continue
+            for kind, side in self.hexsides.items(cell.key()):
+                if kind not in ("Ra", "Ro"):
+                    continue
+                orig = self.find_rail_rout_for_cell(cell)
+                # neighbors in hexside order, -1 off the map
+                for i, nbr in enumerate(self.map.neighbor_table()[self.map.index(cell.key())]):
+                    if nbr < 0 or side & 2 ** i == 0:
+                        continue
+                    if self.hexsides.has(cell.key(), "Co", i):
+                        continue
+                    targ = self.map.key_of(nbr)
+                    targ = self.find_rail_rout_for_cell(self.map[targ], self.seam_offset(cell, targ))
+                    self.draw.line([orig, targ], fill=base[0], width=base[1])
+                    if kind == "Ra":
+                        dashed_line(self.draw, orig, targ, (base[1], base[1]), dash[0], dash[1])
+                    else:
+                        self.draw.line([orig, targ], fill=dash[0], width=dash[1])
+                    self.add()
+
+
+class RasterHexsideLayer(RasterLayer):
+    """layer for hex side features like strait arrows, alpine hexsides, etc."""
+
+    FIELDS = HexsideLayer.FIELDS
+
+    STRAIT = {
+        # hexside bit: (edge start, edge end), arrow vector
+        1: ((4, 5), (28, 0)),
+        2: ((5, 0), (14, 24)),
+        4: ((1, 0), (-14, 24)),
+        8: ((2, 1), (-28, 0)),
+        16: ((3, 2), (-14, -24)),
+        32: ((3, 4), (14, -24)),
+    }
+
+    def _render(self, *args, **kwargs):
+        hexsides = self.parent.map_reader.hexside_table()
+        for cell in self.region_cells():
+            if "hexsides" not in cell:
+                continue
+            points = self.hex_points(cell.q, cell.r)
+            for kind, side in hexsides.items(cell.key()):
+                if kind == "Al":
+                    for edge in self.hexside_lines(cell.q, cell.r, side):
+                        self.draw.line(edge, fill="white", width=20)
+                        self.add()
+                elif kind == "St":
+                    for bit, ((a, b), (dx, dy)) in sorted(self.STRAIT.items()):
+                        if not side & bit:
+                            continue
+                        x0 = points[a][0] + (points[b][0] - points[a][0]) / 3.0
+                        y0 = points[a][1] + (points[b][1] - points[a][1]) / 3.0
+                        x1, y1 = x0 + dx, y0 + dy
+                        self.draw.line([(x0, y0), (x1, y1)], fill="red", width=4)
+                        # arrow head
+                        length = (dx ** 2 + dy ** 2) ** .5
+                        ux, uy = dx / length, dy / length
+                        self.draw.polygon([
+                            (x1 + 8 * ux, y1 + 8 * uy),
+                            (x1 - 6 * uy, y1 + 6 * ux),
+                            (x1 + 6 * uy, y1 - 6 * ux),
+                        ], fill="red")
+                        self.add()
+
+
+class RasterBorderLayer(RasterLayer, BorderLayer):
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            if "borders" not in cell:
+                continue
+            borders = cell["borders"]
+            for bit in sorted(HEXSIDE_POINTS):
+                line_mem = [sides & bit > 0 for kind, sides in borders]
+                if not any(line_mem):
+                    continue
+                edge = self.hexside_lines(cell.q, cell.r, bit)[0]
+                kth_line = 0
+                for (kind, sides), drawn in zip(borders, line_mem):
+                    if not drawn:
+                        continue
+                    kth_line += 1
+                    colour, width = self.render_attr[kind]
+                    if kth_line > 1:
+                        dashed_line(self.draw, edge[0], edge[1], (15, 15 * sum(line_mem)), colour, width)
+                    else:
+                        self.draw.line(edge, fill=colour, width=width)
+                    self.add()
+
+
+class RasterFeatureLayer(RasterLayer):
+    """layer for hex features like cities, ports, resource, factories, etc."""
+
+    FIELDS = FeatureLayer.FIELDS
+
+    def __init__(self, parent, *args, **kwargs):
+        super(RasterFeatureLayer, self).__init__(parent, *args, **kwargs)
+        # minor features: plain cities, minor ports, factories and resources
+        self.minor = bool(kwargs.get("minor", True))
+        self.ICON = {}
+        for name, file_name in [
+            ("fac-red", "FACTORYSTACKRED.bmp"),
+            ("fac-blu", "FACTORYSTACKBLUE.bmp"),
+            ("fac-smk", "FACTORYSMOKE.bmp"),
+            ("res", "RESOURCE1.bmp"),
+            ("oil", "OIL1.bmp"),
+        ]:
+            self.ICON[name] = Image.open(os.path.join(
+                SETTINGS["filesystem"]["basepath"],
+                "Bitmaps", "Icon Bitmaps",
+                file_name)).convert("RGBA")
+
+    def circle(self, x, y, r, fill, outline=None, width=1):
+        self.draw.ellipse((x - r, y - r, x + r, y + r), fill=fill, outline=outline, width=width)
+
+    def icon(self, name, x, y):
+        self.image.paste(self.ICON[name], (int(round(x)), int(round(y))))
+
+    def city(self, kind, x, y):
+        if kind == 1:
+            self.circle(x, y, 10, "yellow", "black", 4)
+        elif kind in (2, 3):
+            self.circle(x, y, 15, "yellow", "black", 4)
+            self.circle(x, y, 5, "gray" if kind == 2 else "red")
+        else:
+            raise ValueError("unknown city code: {}".format(kind))
+
+    def port(self, kind, x, y, ice):
+        if ice is True:
+            self.draw.regular_polygon((x, y, 18), 12, fill="white", outline="gray")
+        if kind == 1:
+            ring, face, anchor = "royalblue", "white", "royalblue"
+        elif kind == 2:
+            ring, face, anchor = "goldenrod", "navy", "white"
+        else:
+            raise ValueError("unknown port code: {}".format(kind))
+        self.circle(x, y, 15, ring, "gray")
+        self.circle(x, y, 12, face)
+        self.draw.rectangle((x - 1, y - 7, x + 1, y + 9), fill=anchor)
+        self.draw.rectangle((x - 4, y - 3, x + 4, y - 1), fill=anchor)
+        self.draw.arc((x - 9, y - 9, x + 9, y + 10), 20, 160, fill=anchor, width=2)
+
+    def factory(self, kind, x, y):
+        stacks = {
+            1: ("red", ["fac-red"]),
+            2: ("blue", ["fac-red"]),
+            4: ("red", ["fac-red", "fac-blu"]),
+            9: ("red", ["fac-red", "fac-blu", "fac-blu"]),
+            15: ("red", ["fac-red", "fac-blu", "fac-blu"]),
+        }
+        if kind not in stacks:
+            raise ValueError("unknown factory code: {}".format(kind))
+        colour, icons = stacks[kind]
+        half_w = 2 + 5 * len(icons)
+        self.draw.rectangle((x - half_w, y - 16, x + half_w, y + 16), fill=colour)
+        for i, name in enumerate(icons):
+            self.icon(name, x - half_w + 2 + 10 * i, y - 4)
+            self.icon("fac-smk", x - half_w + 2 + 10 * i, y - 14)
+
+    def resource(self, kind, x, y):
+        self.icon("res" if kind > 0 else "oil", x - 17, y - 17)
+        if abs(kind) > 1:
+            # handle multiplicity
+            self.draw.rectangle((x + 2, y + 2, x + 14, y + 14), fill="white")
+            self.text((x + 8, y + 12), abs(kind) * "I", fill="black", size=11, anchor="ms")
+
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            if "sz_id" in cell:
+                continue
+            cell_x, cell_y = self.hex_origin(cell.q, cell.r)
+            for field, paint in [
+                ("cty", self.city),
+                ("prt", lambda kind, x, y: self.port(kind, x, y, cell["ice"])),
+                ("fac", self.factory),
+                ("res", self.resource),
+            ]:
+                try:
+                    kind, clock_pos = cell[field]
+                    if self.minor is False and (field in ("fac", "res") or kind == 1):
+                        continue
+                    if kind != 0:
+                        dx, dy = self.clock_offset(clock_pos)
+                        paint(kind, cell_x + dx, cell_y + dy)
+                        self.add()
+                except Exception as ex:
+                    logger.warning("feature.%s issue: [%s] %s", field, cell.key(), ex)
+
+
+class RasterLabelLayer(RasterLayer):
+    FIELDS = LabelLayer.FIELDS
+    COL_CODE = LabelLayer.COL_CODE
+
+    def __init__(self, parent, *args, **kwargs):
+        super(RasterLabelLayer, self).__init__(parent, *args, **kwargs)
+        self.min_size = int(kwargs.get("min_size", 0))
+        self.cull = bool(kwargs.get("cull", False))
+        self.padding = float(kwargs.get("padding", 2))
+        self.kept = kwargs.get("kept")
+        self.margin = int(kwargs.get("margin", 0))
+        self.n_dropped = 0
+
+    label_columns = LabelLayer.label_columns
+    placed_labels = LabelLayer.placed_labels
+
+    def _render(self, *args, **kwargs):
+        drawn = set()
+        for key, x, y, text, font_size, colour in self.placed_labels():
+            self.text((x, y), text, fill=self.COL_CODE[colour + 1], size=font_size)
+            drawn.add(key)
+        self.stats.cells_drawn += len(drawn)
+
+
+## MAIN
+
+def gen_raster(map_reader, file_name, region=None, scale=None, stats_file=None, **kwargs):
+    ms = RasterDrawing(map_reader, file_name, region=region, scale=scale, stats_file=stats_file, **kwargs)
+    ms.add_layer(RasterTerrainLayer, simple=False)
+    ms.add_layer(RasterCoastalLayer, simple=False)
+    ms.add_layer(RasterRVRLayer)
+    ms.add_layer(RasterHexsideLayer)
+    ms.add_layer(RasterGridLayer, coords=True)
+    ms.add_layer(RasterRailLayer)
+    ms.add_layer(RasterBorderLayer)
+    ms.add_layer(RasterFeatureLayer)
+    ms.add_layer(RasterLabelLayer)
+    ms.render()
+    return ms
+
+## EOF
@@ -8,15 +8,17 @@ the back of the Player's Manual Vol. 2, and have been adjusted to match reality
 
 ## IMPORTS
 
+import functools
 import os
-from mwifmap.mwif_hexmap import HexMap
+from mwifmap.mwif_hexmap import HexMap, HexsideTable
+from mwifmap.mwif_map_labels import LabelIndex
+from mwifmap.mwif_map_registry import AdjRecord, AltRecord, CountryRecord, Registry, RlsRecord, SeaRecord
 from mwifmap.util import *
 
 
 ## CONSTANTS
 
-BASE_PATH = SETTINGS["filesystem"]["basepath"]
-MAP_DIR = os.path.join(BASE_PATH, "Data", "Map Data")
+# BASE_PATH and MAP_DIR are resolved on access, see `__getattr__`
 MAP_NAME = "Standard Map"
 CODEC = "iso8859_15"
 
@@ -35,8 +37,22 @@ FILE_CMI = "{map_name} CMi.CSV"  # country data - minor countries
 FILE_CSU = "{map_name} CSu.CSV"  # country data - sub countries
 FILE_CGA = "{map_name} CGA.CSV"  # country data - governed areas
 
+# registry name -> file name, record type and the cell field carrying the record id
+REGISTRY_FILES = {
+    "adj": (FILE_ADJ, AdjRecord, "sz_id"),
+    "alt": (FILE_ALT, AltRecord, "country_id"),
+    "rls": (FILE_RLS, RlsRecord, None),
+    "sea": (FILE_SEA, SeaRecord, "sz_id"),
+    "cma": (FILE_CMA, CountryRecord, "country_id"),
+    "cmi": (FILE_CMI, CountryRecord, "country_id"),
+    "csu": (FILE_CSU, CountryRecord, "country_id"),
+    "cga": (FILE_CGA, CountryRecord, "country_id"),
+}
+
 COLS = 359
 ROWS = 194
+# the world map wraps east-west
+WRAP = True
 
 TER_CODE = {
     0: "all sea",
@@ -81,19 +97,55 @@ FACTORY_CODE = {
     15: (3, 0),
 }
 HST_CODE = {
+    "Al": "alpine",
+    "Ca": "canal",
+    "Co": "coast",
+    "Ra": "rail",
+    "Ri": "river",
+    "Ro": "road",
+    "St": "strait",
 }
 
 
+## HELPERS
+
+def untracked(method):
+    """run a load method of the reader without recording dirty cells, it (re)sets the fields of the whole map"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.map.untracked():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 ## CLASSES
 
 class MWIFMapReader(object):
     """map reader for matrix games MWIF"""
 
     def __init__(self, map_dir=None, map_name=None):
-        self.map_dir = map_dir or MAP_DIR
+        self.map_dir = map_dir or get_map_dir()
         self.map_name = map_name or MAP_NAME
-        self.map = HexMap(COLS, ROWS)
-
+        self.map = HexMap(COLS, ROWS, wrap=WRAP)
+        self.registries = {}
+        self.labels = LabelIndex()
+
+    def load_all(self, verbose=False):
+        """read all map files and generate the borders, returns self"""
+
+        with self.map.untracked():
+            self.load_ter_data(verbose=verbose)
+            self.load_coa_data(verbose=verbose)
+            self.load_hst_data(verbose=verbose)
+            self.load_sea_adj_data(verbose=verbose)
+            self.gen_border_data(verbose=verbose)
+            self.load_registries(verbose=verbose)
+        self.map.clear_dirty()
+        return self
+
+    @untracked
     def load_ter_data(self, map_dir=None, map_name=None, verbose=False):
         """read in TER file"""
 
@@ -103,6 +155,7 @@ class MWIFMapReader(object):
         open_path = os.path.join(dir_name, file_name)
         ter_rec_read = set()
         nam_rec_read = set()
+        self.labels = LabelIndex()
         if verbose:
             print("reading ter and nam data")
 
@@ -190,6 +243,7 @@ class MWIFMapReader(object):
                             if "labels" not in lbl_entry:
                                 lbl_entry["labels"] = []
                             lbl_entry["labels"].append((lbl_text, lbl_offset, lbl_siz_code, lbl_col_code))
+                            self.labels.add(lbl_text, (lbl_q, lbl_r), lbl_offset, lbl_siz_code, lbl_col_code)
                     except LookupError:
                         pass
                     except Exception as ex:
@@ -245,6 +299,7 @@ class MWIFMapReader(object):
                     if "labels" not in entry:
                         entry["labels"] = []
                     entry["labels"].append((lbl_text, lbl_offset, lbl_siz_code, lbl_col_code))
+                    self.labels.add(lbl_text, (q, r), lbl_offset, lbl_siz_code, lbl_col_code)
             except Exception as ex:
                 if read_line == "\x1a":
                     # ascii 26 == EOF
@@ -252,16 +307,49 @@ class MWIFMapReader(object):
                 print("NAM.2 issue (#{}): {}\n{}".format(nam_idx, str(ex), NAM[nam_idx]))
 
         # finish
+        self.labels.build()
         success = len(ter_rec_read) == COLS * ROWS and len(nam_rec_read) == 3754
         if verbose:
             print("read {} ter records".format(len(ter_rec_read)))
             print("read {} nam records".format(len(nam_rec_read)))
+            print("indexed {} labels".format(len(self.labels)))
         return success
 
+    def load_registries(self, map_dir=None, map_name=None, verbose=False):
+        """read the country and sea data files into `self.registries`, see `REGISTRY_FILES`"""
+
+        dir_name = map_dir or self.map_dir
+        success = True
+        for name, (file_fmt, record_type, link_field) in sorted(REGISTRY_FILES.items()):
+            open_path = os.path.join(dir_name, file_fmt.format(map_name=map_name or self.map_name))
+            if not os.path.exists(open_path):
+                success = False
+                if verbose:
+                    print("missing {} data \"{}\"".format(name, open_path))
+                continue
+            registry = Registry(name, record_type, link_field)
+            with open(open_path, "r", encoding=CODEC) as fp:
+                bad_lines = registry.read(fp)
+            self.registries[name] = registry
+            if verbose:
+                print("read {} {} records for {} ids".format(registry.n_records, name, len(registry)))
+                for line_no in bad_lines:
+                    print("{} issue: no id or wrong columns on line #{}".format(name, line_no))
+        return success
+
+    def registry(self, name):
+        """`Registry` of a data file by its name in `REGISTRY_FILES`, e.g. "cma" for the major powers"""
+
+        try:
+            return self.registries[name]
+        except KeyError:
+            raise KeyError("registry {} was not loaded".format(name))
+
+    @untracked
     def load_coa_data(self, coastal_dir=None, verbose=False):
         """read in coastal bitmap info to flag cells when they get a bitmap"""
 
-        dir_name = coastal_dir or os.path.join(BASE_PATH, "Bitmaps", "Coastal Bitmaps")
+        dir_name = coastal_dir or os.path.join(get_base_path(), "Bitmaps", "Coastal Bitmaps")
         cells_read = set()
         success = True
         if verbose:
@@ -290,6 +378,7 @@ class MWIFMapReader(object):
             print("read {} cells:".format(len(cells_read)), end=' ')
         return success
 
+    @untracked
     def load_hst_data(self, map_dir=None, map_name=None, verbose=False):
         """read in HST file"""
 
@@ -324,8 +413,19 @@ class MWIFMapReader(object):
                     if verbose:
                         print("Error reading line #{}: {}".format(i, str(ex)))
                         print("Line was: {}".format(repr(read_line)))
+        # decode into per kind arrays
+        self.hexside_table()
         return success
 
+    def hexside_table(self):
+        """`HexsideTable` of the hexside features, decoded again after the cell hexsides changed"""
+
+        table = getattr(self, "_hexside_table", None)
+        if table is None or not table.is_current():
+            table = self._hexside_table = HexsideTable(self.map)
+        return table
+
+    @untracked
     def load_sea_adj_data(self, map_dir=None, map_name=None, verbose=False):
         """read in COA file"""
 
@@ -363,20 +463,53 @@ class MWIFMapReader(object):
         for cell in self.map.values():
             if "sz_id" in cell:
                 continue
-            for q, r in self.map.neighbors(cell.key()):
-                if "sz_id" in self.map[q, r]:
-                    if "sz_adj" not in cell:
-                        cell["sz_adj"] = []
-                    adj_id = self.map[q, r]["sz_id"]
-                    if adj_id not in cell["sz_adj"]:
-                        cell["sz_adj"].append(adj_id)
+            sz_adj = cell.get("sz_adj", [])
+            seen = set(sz_adj)
+            for q_r in self.map.neighbors(cell.key()):
+                adj_id = self.map[q_r].get("sz_id")
+                if adj_id is not None and adj_id not in seen:
+                    seen.add(adj_id)
+                    sz_adj.append(adj_id)
+            if sz_adj and "sz_adj" not in cell:
+                cell["sz_adj"] = sz_adj
         return success
 
-    def gen_border_data(self, verbose=False):
-        """generate border data, has to be done after input all files have been read!"""
+    def sea_zone_graph(self):
+        """`SeaZoneGraph` of the loaded map, built on first use and rebuilt after the map changed"""
+
+        # imported here, the graph needs numpy and scipy that plain reader use does not
+        from mwifmap.mwif_map_graph import SeaZoneGraph
+
+        graph = getattr(self, "_sea_zone_graph", None)
+        if graph is None or graph.version != self.map.version:
+            graph = self._sea_zone_graph = SeaZoneGraph(self.map)
+        return graph
+
+    def rail_graph(self):
+        """`RailGraph` of the rails and roads of the loaded map, built on first use and after changes"""
+
+        from mwifmap.mwif_map_graph import RailGraph
+
+        hexsides = self.hexside_table()
+        graph = getattr(self, "_rail_graph", None)
+        if graph is None or graph.version != hexsides.version:
+            graph = self._rail_graph = RailGraph(self.map, hexsides)
+        return graph
+
+    def gen_border_data(self, verbose=False, keys=None):
+        """generate border data, has to be done after input all files have been read!
+
+        Pass `keys` to regenerate the borders of these cells only, e.g. `self.map.dirty_cells()` after a patch.
+        """
+
+        if keys is not None:
+            keys = set(keys)
+            for q_r in keys:
+                if "borders" in self.map[q_r]:
+                    del self.map[q_r]["borders"]
 
         # national borderlines
-        nat_border = get_border_line(self.map, "country_id")
+        nat_border = get_border_line(self.map, "country_id", keys=keys)
         for (q, r), sides in nat_border:
             try:
                 entry = self.map[(q, r)]
@@ -388,7 +521,7 @@ class MWIFMapReader(object):
                     print("problem adding national border: {}".format(ex))
 
         # weather borderlines
-        wea_border = get_border_line(self.map, "wz_id")
+        wea_border = get_border_line(self.map, "wz_id", keys=keys)
         for (q, r), sides in wea_border:
             try:
                 entry = self.map[(q, r)]
@@ -400,7 +533,7 @@ class MWIFMapReader(object):
                     print("problem adding weather border: {}".format(ex))
 
         # sea zone borderlines
-        sea_border = get_border_line(self.map, "sz_id")
+        sea_border = get_border_line(self.map, "sz_id", keys=keys)
         for (q, r), sides in sea_border:
             try:
                 entry = self.map[(q, r)]
@@ -414,6 +547,19 @@ class MWIFMapReader(object):
 
 ## FUNCTIONS
 
+def get_map_dir():
+    return os.path.join(get_base_path(), "Data", "Map Data")
+
+
+def __getattr__(name):
+    # path constants depend on the settings, which are only read when needed
+    if name == "BASE_PATH":
+        return get_base_path()
+    if name == "MAP_DIR":
+        return get_map_dir()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 def border_indicator(c, hm, field_name, field_ids):
     if field_name in hm[c]:
         if hm[c][field_name] in field_ids:
@@ -432,19 +578,22 @@ def encode_hexsides(l):
     return rval
 
 
-def get_border_line(hm, field_name, field_ids=None):
+def get_border_line(hm, field_name, field_ids=None, keys=None):
     border = []
-    for cell in hm.values():
+    table = hm.neighbor_table()
+    cells = hm.values() if keys is None else [hm[q_r] for q_r in keys]
+    for cell in cells:
         if field_name not in cell:
             continue
         if field_ids:
             if cell[field_name] not in field_ids:
                 continue
 
-        neighbors = hm.neighbors((cell.q, cell.r))
-        # order:  W,  NW, NE, E,  SE, SW - dir
+        # order:  W,  NW, NE, E,  SE, SW - dir, -1 off the map, which is no border
+        neighbors = table[hm.index(cell.key())]
         check_ids = field_ids or [cell[field_name]]
-        hsc = encode_hexsides([border_indicator(n, hm, field_name, check_ids) for n in neighbors])
+        hsc = encode_hexsides([
+            border_indicator(hm.key_of(n), hm, field_name, check_ids) if n >= 0 else False for n in neighbors])
         if hsc != 0:
             border.append((cell.key(), hsc))
     return border
@@ -461,7 +610,7 @@ if __name__ == "__main__":
     m.load_sea_adj_data(verbose=VERBOSE)
     m.gen_border_data(verbose=VERBOSE)
     print(m.map[10, 0])
-    print(m.map[10, 0]._data)
+    print(dict(m.map[10, 0]))
     print(dir(m.map[10, 0]))
 
 ## EOF
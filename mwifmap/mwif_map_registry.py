@@ -0,0 +1,143 @@
+"""registries for the country and sea zone data files of MWIF
+
+Every file has a record type declaring its columns, and records are indexed by the leading id column. The
+layout of the files is not documented beyond their leading columns, the remaining columns of a record are kept
+as typed values in its `extra` field. A line with fewer columns than declared, or more for a record type
+without `extra`, is rejected. A registry can be linked to the cell field that carries the same id, which has to be
+a column of its records, e.g. the country files to `country_id` and the sea area files to `sz_id`.
+"""
+
+## IMPORTS
+
+import collections
+
+## CONSTANTS
+
+# record types of the data files, see `REGISTRY_FILES` of the reader
+AdjRecord = collections.namedtuple("AdjRecord", ("sz_id", "adj_sz_id"))
+AltRecord = collections.namedtuple("AltRecord", ("country_id", "extra"))
+RlsRecord = collections.namedtuple("RlsRecord", ("rls_id", "extra"))
+SeaRecord = collections.namedtuple("SeaRecord", ("sz_id", "name", "extra"))
+CountryRecord = collections.namedtuple("CountryRecord", ("country_id", "name", "extra"))
+
+
+## FUNCTIONS
+
+def parse_value(text):
+    """`text` as int, float or stripped string"""
+
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text.strip("\"")
+
+
+## CLASSES
+
+class Registry(object):
+    """records of one data file, indexed by their id
+
+    :parameters:
+        record_type : namedtuple class
+            columns of the records, the first is the id, a last column named `extra` takes any further columns
+        link_field : str
+            cell field carrying the record id, one of the columns
+    """
+
+    def __init__(self, name, record_type, link_field=None):
+        if link_field is not None and link_field not in record_type._fields:
+            raise ValueError("link field {} of registry {} is no column of {}".format(
+                link_field, name, record_type.__name__))
+        self.name = name
+        self.record_type = record_type
+        self.link_field = link_field
+        self.rows = collections.OrderedDict()
+        self.n_records = 0
+        self._cells = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __contains__(self, record_id):
+        return record_id in self.rows
+
+    def __getitem__(self, record_id):
+        """records with `record_id`, most ids have a single record"""
+
+        return self.rows[record_id]
+
+    def first(self, record_id, default=None):
+        rval = self.rows.get(record_id)
+        return rval[0] if rval else default
+
+    def make_record(self, values):
+        """`record_type` of a sequence of typed values, raises ValueError if the number of columns is wrong"""
+
+        fields = self.record_type._fields
+        n_fixed = len(fields) - 1 if fields[-1] == "extra" else len(fields)
+        if len(values) < n_fixed or (n_fixed == len(fields) and len(values) > n_fixed):
+            raise ValueError("{} needs {}{} columns, got {}".format(
+                self.record_type.__name__, n_fixed, " or more" if n_fixed < len(fields) else "", len(values)))
+        if n_fixed < len(fields):
+            return self.record_type(*values[:n_fixed], tuple(values[n_fixed:]))
+        return self.record_type(*values)
+
+    def add(self, values):
+        """add a record, a sequence of typed values starting with the id"""
+
+        record = values if isinstance(values, self.record_type) else self.make_record(values)
+        self.rows.setdefault(record[0], []).append(record)
+        self.n_records += 1
+
+    def read(self, fp):
+        """read the csv records of the open file `fp`, returns the numbers of the lines that could not be parsed
+
+        Lines without an integer id or with the wrong number of columns are left out.
+        """
+
+        rval = []
+        for line_no, read_line in enumerate(fp):
+            line = read_line.strip()
+            if not line or line == "\x1a":
+                # ascii 26 == EOF
+                continue
+            values = tuple(parse_value(item) for item in line.split(","))
+            if not isinstance(values[0], int):
+                rval.append(line_no)
+                continue
+            try:
+                self.add(values)
+            except ValueError:
+                rval.append(line_no)
+        return rval
+
+    def column(self, name):
+        """{id: value} of column `name` of the first record of every id, raises KeyError for an unknown column"""
+
+        if name not in self.record_type._fields:
+            raise KeyError("{} has no column {}".format(self.record_type.__name__, name))
+        return {record_id: getattr(rows[0], name) for record_id, rows in self.rows.items()}
+
+    def cells(self, hexmap, record_id):
+        """keys of the cells whose `link_field` equals `record_id`"""
+
+        if self.link_field is None:
+            raise ValueError("registry {} is not linked to a cell field".format(self.name))
+        version = hexmap.field_version(self.link_field)
+        if self._cells is None or self._cells[0] is not hexmap or self._cells[1] != version:
+            index = collections.defaultdict(list)
+            for cell in hexmap.values():
+                if self.link_field in cell:
+                    index[cell[self.link_field]].append(cell.key())
+            self._cells = hexmap, version, index
+        return list(self._cells[2].get(record_id, ()))
+
+## EOF
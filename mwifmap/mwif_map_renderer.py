@@ -3,21 +3,57 @@
 ## IMPORTS
 
 import os
+import gzip
+import time
+import logging
 import svgwrite
-# import scipy as sp
-from scipy import interp
+from xml.etree import ElementTree
 
+from mwifmap.build_manifest import BuildManifest, asset_digest, tile_digest
+from mwifmap.mwif_map_labels import place_labels
 from mwifmap.mwif_map_reader import MWIFMapReader
-from mwifmap.rvr_files import process_rvr_line
+from mwifmap.render_stats import LayerStats, RenderStats
+from mwifmap.sprites import get_coastal_sprites, get_rvr_images, get_scaled_image
 from mwifmap.util import *
 
+## LOGGING
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+## CONSTANTS
+
+SVGZ_COMPRESS_LEVEL = 6
+
+# changes of these fields reach two rings of neighbors: the rail anchors check the coast of their neighbors
+WIDE_FIELDS = ("hexsides", "ter_code")
+
+TER_BMP_FILE = {
+    0: "Sea.bmp",
+    1: "Lake.bmp",
+    2: "Clear.bmp",
+    3: "Forest.bmp",
+    4: "Jungle.bmp",
+    5: "Mountain.bmp",
+    6: "swamp.bmp",
+    7: "Desert.bmp",
+    8: "Desert Mountain.bmp",
+    9: "Tundra.bmp",
+    10: "Ice.bmp",
+    11: "Qattara Depression.bmp",
+}
+
 
 ## CLASSES
 
 class MapDrawing(object):
     """wrapper to render the map to svg/png"""
 
-    def __init__(self, map_reader=None, filename=None, scale=None, region=None, background="default"):
+    EXTENSIONS = (".svg", ".svgz")
+
+    def __init__(self, map_reader=None, filename=None, scale=None, region=None, background="default",
+                 stats_file=None, compress_level=SVGZ_COMPRESS_LEVEL):
         # map reader
         self.map_reader = map_reader
         if self.map_reader is None:
@@ -25,8 +61,11 @@ class MapDrawing(object):
 
         # filename
         self.svg_name = filename or "test"
-        if not self.svg_name.endswith(".svg"):
-            self.svg_name += ".svg"
+        if not self.svg_name.endswith(self.EXTENSIONS):
+            self.svg_name += self.EXTENSIONS[0]
+
+        # gzip compression level of .svgz output
+        self.compress_level = int(compress_level)
 
         # scale
         self.scale = float(scale or 1.0)
@@ -55,8 +94,13 @@ class MapDrawing(object):
 
         # other members
         self.layers = []
+        self.stats = RenderStats(self.svg_name, self.region, self.scale)
+        self.stats_file = stats_file
 
         # build svg
+        self.init_surface()
+
+    def init_surface(self):
         self.svg = svgwrite.Drawing(
             filename=self.svg_name,
             size=(self.svg_width, self.svg_height),
@@ -64,32 +108,172 @@ class MapDrawing(object):
             debug=True)
 
     def add_layer(self, layer_cls, index=None, *args, **kwargs):
+        wall, cpu = time.perf_counter(), time.process_time()
+        layer = layer_cls(self, *args, **kwargs)
+        layer.stats.setup_wall = time.perf_counter() - wall
+        layer.stats.setup_cpu = time.process_time() - cpu
         if not index:
-            self.layers.append(layer_cls(self, *args, **kwargs))
+            self.layers.append(layer)
         else:
-            self.layers.insert(index, layer_cls(self, *args, **kwargs))
+            self.layers.insert(index, layer)
 
     def render(self, finalise=True):
-        print("Rendering {} ({}x{})".format(self.svg_name, self.svg_width, self.svg_height))
+        """render all layers, returns the `RenderStats` of this drawing"""
+
+        logger.info("Rendering %s (%sx%s)", self.svg_name, self.svg_width, self.svg_height)
+        with self.stats.timer():
+            self.render_background()
+            for renderer in self.layers:
+                renderer.render()
+        self.stats.layers = [renderer.stats for renderer in self.layers]
+        if finalise is True:
+            self.finalise()
+        return self.stats
+
+    def render_background(self):
         if self.background is not None:
             bg = self.svg.rect(
                 id="background",
                 size=("100%", "100%"),
                 fill=self.background)
             self.svg.add(bg)
-        for renderer in self.layers:
-            renderer.render()
+
+    def register_image(self, layer, node, source_id, image):
+        """hook called for every bitmap a layer embeds, see `MultiScaleDrawing`"""
+
+        pass
+
+    def forget_images(self, layer):
+        """hook called before `layer` is rendered again, its embedded bitmaps are replaced"""
+
+        pass
+
+    def save(self):
+        self.write_svg(self.svg_name)
+
+    def write_svg(self, file_name):
+        """write the svg to `file_name`, gzip compressed if it ends with .svgz
+
+        The document is serialized one top level element at a time into the (compressing) stream, so the
+        complete xml string is never held in memory.
+        """
+
+        if file_name.endswith(".svgz"):
+            fp = gzip.open(file_name, "wt", compresslevel=self.compress_level, encoding="utf-8")
+        else:
+            fp = open(file_name, "w", encoding="utf-8")
+        with fp:
+            root = self.svg.get_xml()
+            children = list(root)
+            del root[:]
+            head = ElementTree.tostring(root, encoding="unicode", short_empty_elements=False)
+            fp.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+            fp.write(head[:-len("</svg>")])
+            for child in children:
+                fp.write(ElementTree.tostring(child, encoding="unicode"))
+            fp.write("</svg>")
+
+    def output_files(self):
+        return [self.svg_name]
+
+    def finalise(self):
+        logger.info("finalising %s", self.svg_name)
+        with self.stats.timer("finalise"):
+            self.save()
+        self.stats.output_bytes = sum(os.path.getsize(file_name) for file_name in self.output_files())
+        if self.stats_file is not None:
+            with open(self.stats_file, "a") as fp:
+                self.stats.write_jsonl(fp)
+        logger.info("%s", self.stats)
+
+    def update(self, finalise=True):
+        """re-render the layers that depend on cells changed inside the region, reuse the output of the others
+
+        :returns:
+            list : the re-rendered layers
+        """
+
+        rval = [layer for layer in self.layers if layer.is_dirty()]
+        if not rval:
+            return rval
+        logger.info("Updating %s: %s", self.svg_name, ", ".join(layer.__class__.__name__ for layer in rval))
+        with self.stats.timer():
+            for layer in rval:
+                layer.rerender()
         if finalise is True:
             self.finalise()
+        return rval
 
-    def finalise(self):
-        print("finalising..", end=' ')
-        print()
-        self.svg.saveas(self.svg_name)
-        print("DONE!")
+
+class MultiScaleDrawing(MapDrawing):
+    """render the map once and write it at several scales
+
+    The layers walk the region a single time and build their geometry at unit scale. Each output only
+    differs in its size and viewBox, and in the embedded bitmaps, which are swapped for versions resampled
+    to the output scale. Bitmaps without a source id and bitmaps whose size does not change are encoded
+    once and shared by all outputs. Layers that choose what to draw by scale, like the label rules of
+    `LabelLayer`, see scale 1.0 for all outputs.
+    """
+
+    def __init__(self, map_reader=None, filename=None, scales=(1.0,), region=None, background="default",
+                 stats_file=None, compress_level=SVGZ_COMPRESS_LEVEL):
+        self.scales = sorted(set(float(scale) for scale in scales), reverse=True)
+        self.images = []
+        super(MultiScaleDrawing, self).__init__(
+            map_reader, filename, scale=1.0, region=region, background=background, stats_file=stats_file,
+            compress_level=compress_level)
+        self.outputs = [(scale, scaled_file_name(self.svg_name, scale)) for scale in self.scales]
+
+    def register_image(self, layer, node, source_id, image):
+        self.images.append((layer, node, source_id, image))
+
+    def forget_images(self, layer):
+        self.images = [item for item in self.images if item[0] is not layer]
+
+    def scaled_hrefs(self, scale, encoded):
+        """image hrefs for output `scale`, `encoded` caches the data urls of all outputs by (source_id, size)"""
+
+        rval = []
+        for layer, node, source_id, image in self.images:
+            if source_id is None or scale == 1.0:
+                rval.append(node["xlink:href"])
+                continue
+            scaled = get_scaled_image(source_id, image, scale)
+            if scaled.size == image.size:
+                rval.append(node["xlink:href"])
+                continue
+            key = source_id, scaled.size
+            if key not in encoded:
+                img_data, img_dims = layer.encode_png(scaled)
+                encoded[key] = "data:image/png;base64,{}".format(img_data)
+            rval.append(encoded[key])
+        return rval
+
+    def save(self):
+        unit_hrefs = [node["xlink:href"] for _, node, _, _ in self.images]
+        encoded = {}
+        self.svg.viewbox(0, 0, self.svg_width, self.svg_height)
+        try:
+            for scale, file_name in self.outputs:
+                self.svg["width"] = self.svg_width * scale
+                self.svg["height"] = self.svg_height * scale
+                for (_, node, _, _), href in zip(self.images, self.scaled_hrefs(scale, encoded)):
+                    node["xlink:href"] = href
+                self.write_svg(file_name)
+        finally:
+            self.svg["width"] = self.svg_width
+            self.svg["height"] = self.svg_height
+            for (_, node, _, _), href in zip(self.images, unit_hrefs):
+                node["xlink:href"] = href
+
+    def output_files(self):
+        return [file_name for _, file_name in self.outputs]
 
 
 class BaseLayer(object):
+    # cell fields the layer output depends on, None for any field
+    FIELDS = None
+
     def __init__(self, parent, *args, **kwargs):
         # set parent
         self.parent = parent
@@ -99,16 +283,105 @@ class BaseLayer(object):
         self.layer = None
         self.scale = self.parent.scale
         self.region = self.parent.region
+        self.stats = LayerStats(self.__class__.__name__)
+        self.render_defs = []
 
     def render(self, *args, **kwargs):
-        self.layer = self.svg.g(id=self.__class__.__name__)
-        self._render(*args, **kwargs)
+        self.render_group(*args, **kwargs)
         self.svg.add(self.layer)
-        print("{} finished!".format(self.__class__.__name__))
+
+    def render_group(self, *args, **kwargs):
+        self.layer = self.svg.g(id=self.__class__.__name__)
+        self.render_defs = []
+        with self.stats.timer():
+            self._render(*args, **kwargs)
+        logger.debug("%s finished!", self.stats)
+
+    def rerender(self, *args, **kwargs):
+        """render the layer again, replacing its group and the defs created while rendering"""
+
+        old_group = self.layer
+        for element in self.render_defs:
+            self.svg.defs.elements.remove(element)
+        self.parent.forget_images(self)
+        self.stats.reset()
+        self.render_group(*args, **kwargs)
+        self.svg.elements[self.svg.elements.index(old_group)] = self.layer
+
+    def is_dirty(self):
+        """True if cells inside the region changed in any of `FIELDS`"""
+
+        if self.FIELDS is not None and len(self.FIELDS) == 0:
+            return False
+        q_min, r_min, q_max, r_max = self.region
+        return any(
+            q_min <= q <= q_max and r_min <= r <= r_max
+            for q, r in self.map.dirty_cells(self.FIELDS, self.dirty_rings()))
+
+    def dirty_rings(self):
+        """rings of neighbors a change reaches, two for fields rail anchors read from their neighbors"""
+
+        if self.FIELDS is None or set(self.FIELDS) & set(WIDE_FIELDS):
+            return 2
+        return 1
 
     def _render(self, *args, **kwargs):
         raise NotImplementedError
 
+    def region_keys(self):
+        """keys of the cells inside the region of the parent, in the (q, r) order of the map"""
+
+        q_min, r_min, q_max, r_max = self.region
+        q_max = min(q_max, self.map.cols - 1)
+        r_max = min(r_max, self.map.rows - 1)
+        return ((q, r) for q in range(q_min, q_max + 1) for r in range(r_min, r_max + 1))
+
+    def region_cells(self):
+        """cells inside the region of the parent, counts visited and drawn cells"""
+
+        for cell in (self.map[q_r] for q_r in self.region_keys()):
+            self.stats.cells_visited += 1
+            n_elements = self.stats.elements
+            yield cell
+            if self.stats.elements > n_elements:
+                self.stats.cells_drawn += 1
+
+    def add(self, element):
+        """add `element` to the layer group"""
+
+        self.layer.add(element)
+        self.stats.elements += 1
+
+    def add_def(self, element):
+        """add `element` to the svg defs"""
+
+        self.svg.defs.add(element)
+        self.stats.defs += 1
+        if self.layer is not None:
+            self.render_defs.append(element)
+
+    def embed_image(self, image, source_id=None, **kwargs):
+        """svg image element embedding `image` as png
+
+        :parameters:
+            source_id : hashable
+                identifies the unscaled source bitmap for `get_scaled_image`, None if the image is the
+                same at every scale
+        """
+
+        img_data, img_dims = self.encode_png(image)
+        node = self.svg.image("data:image/png;base64,{}".format(img_data), size=img_dims, **kwargs)
+        self.parent.register_image(self, node, source_id, image)
+        return node
+
+    def encode_png(self, image):
+        """`pil_img_to_b64_png` with accounting of the encode time and the embedded bytes"""
+
+        start = time.perf_counter()
+        img_data, img_dims = pil_img_to_b64_png(image)
+        self.stats.add_image(len(img_data), time.perf_counter() - start)
+        return img_data, img_dims
+
     def hex_points(self, q, r, scale=None):
         left, top = self.hex_origin(q, r, scale)
         return [(x + left, y + top) for x, y in get_hex_proto(scale or self.scale)]
@@ -120,224 +393,148 @@ class BaseLayer(object):
         top = .75 * (r - self.parent.region[1]) * hex_h + 1
         return left, top
 
+    def clock_offset(self, clock_pos):
+        """offset of `clock_pos` from the hex origin, the positions are given in pixels of the full scale"""
+
+        return get_hex_clock_pos(clock_pos, center=(68 * self.scale, 76 * self.scale), radius=68 * self.scale)
+
 
 class TerrainLayer(BaseLayer):
+    FIELDS = ("ter_code", "coastal_bitmap")
+
     def __init__(self, parent, *args, **kwargs):
         super(TerrainLayer, self).__init__(parent, *args, **kwargs)
         self.simple = bool(kwargs.pop("simple", False))
         self.TER_CODE = {}
         if self.simple is False:
-            self.TER_BMP = {
-                0: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Sea.bmp")),
-                1: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Lake.bmp")),
-                2: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Clear.bmp")),
-                3: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Forest.bmp")),
-                4: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Jungle.bmp")),
-                5: Image.open(os.path.join(
+            self.TER_BMP = {}
+            for i, file_name in TER_BMP_FILE.items():
+                bmp_path = os.path.join(
                     SETTINGS["filesystem"]["basepath"],
                     "Bitmaps", "Terrain Bitmaps",
-                    "Mountain.bmp")),
-                6: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "swamp.bmp")),
-                7: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Desert.bmp")),
-                8: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Desert Mountain.bmp")),
-                9: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Tundra.bmp")),
-                10: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Ice.bmp")),
-                11: Image.open(os.path.join(
-                    SETTINGS["filesystem"]["basepath"],
-                    "Bitmaps", "Terrain Bitmaps",
-                    "Qattara Depression.bmp")),
-            }
-            for i in range(len(self.TER_BMP)):
-                if self.scale != 1.0:
-                    self.TER_BMP[i] = pil_img_resize(self.TER_BMP[i], self.scale)
+                    file_name)
+                self.TER_BMP[i] = get_scaled_image(bmp_path, lambda: Image.open(bmp_path), self.scale)
                 # create pattern
-                img_data, img_dims = pil_img_to_b64_png(self.TER_BMP[i])
-                img_node = self.svg.image(
-                    "data:image/png;base64,{}".format(img_data),
-                    size=img_dims,
-                    id="TI{:02d}".format(i))
+                img_node = self.embed_image(self.TER_BMP[i], bmp_path, id="TI{:02d}".format(i))
                 pat_node = self.svg.pattern(
                     size=(1, 1),
                     id="TP{:02d}".format(i),
                     patternUnits="objectBoundingBox")
                 pat_node.add(img_node)
-                self.svg.defs.add(pat_node)
+                self.add_def(pat_node)
         else:
             for i in range(12):
                 self.TER_CODE[i] = SETTINGS["colour"]["ter{:02d}".format(i)]
 
     def _render(self, *args, **kwargs):
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 9999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 9999):
-                continue
+        for cell in self.region_cells():
 
             if self.simple is True:
                 # draw the polygon onto the surface
                 this_hex = self.svg.polygon(
                     points=self.hex_points(cell.q, cell.r),
                     fill=self.TER_CODE[cell["ter_code"]])
-                self.layer.add(this_hex)
+                self.add(this_hex)
             else:
                 if not "coastal_bitmap" in cell:
                     this_hex = self.svg.polygon(
                         points=self.hex_points(cell.q, cell.r),
                         fill="url(#TP{:02d})".format(cell["ter_code"]))
-                    self.layer.add(this_hex)
+                    self.add(this_hex)
 
 
 class CoastalLayer(BaseLayer):
+    FIELDS = ("coastal_bitmap",)
+
     def __init__(self, parent, *args, **kwargs):
         super(CoastalLayer, self).__init__(parent, *args, **kwargs)
         self.simple = bool(kwargs.pop("simple", False))
-        if self.simple is False:
-            # load data files
-            self.PAGE_DATA = {}
-            for page in range(1, 9):
-                self.PAGE_DATA[page] = Image.open(
-                    os.path.join(
-                        SETTINGS["filesystem"]["basepath"],
-                        "Bitmaps", "Coastal Bitmaps",
-                        "Page{:02d}.bmp".format(page)))
+        # pages are loaded on demand by the shared sprite service
+        self.sprites = get_coastal_sprites()
 
     def _render(self, *args, **kwargs):
-        if self.simple is True:
-            self.layer.style = \
-                "font-size:36;" \
-                "font-family:Verdana, Helvetica, Arial, sans-serif;" \
-                "font-weight:bold;" \
-                "font-style:oblique;" \
-                "fill:black"
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 9999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 9999):
-                continue
-
-            if "coastal_bitmap" in cell:
-                if self.simple is True:
-                    # draw a "C" into the coastal hexes
-                    points = self.hex_points(cell.q, cell.r)
-                    x = points[0][0]
-                    y = points[1][1] + (points[2][1] - points[1][1]) / 2
-                    txt = self.svg.text("C", insert=(x, y), text_anchor="middle")
-                    self.layer.add(txt)
-                else:
-                    # get the hex image
-                    page, row, idx = cell["coastal_bitmap"]
-                    hex_w, hex_h = get_hex_dims(1.0)
-                    dx1_pat = int((hex_w / 2 if row % 2 else 0) + idx * hex_w)
-                    dx2_pat = int(dx1_pat + hex_w)
-                    dy1_pat = int(.75 * row * hex_h)
-                    dy2_pat = int(dy1_pat + hex_h)
-                    hex_img = self.PAGE_DATA[page].crop(
-                        (dx1_pat, dy1_pat, dx2_pat, dy2_pat))
-                    if self.scale != 1.0:
-                        hex_img = pil_img_resize(hex_img, self.scale)
-                    hex_img_data, hex_img_dims = pil_img_to_b64_png(hex_img)
-                    del hex_img
-                    # create pattern
-                    img_node = self.svg.image(
-                        "data:image/png;base64,{}".format(hex_img_data),
-                        size=hex_img_dims,
-                        id="CI{}{:02d}{:02d}".format(page, row, idx))
-                    pat_node = self.svg.pattern(
-                        size=(1, 1),
-                        id="CP{}{:02d}{:02d}".format(page, row, idx),
-                        patternUnits="objectBoundingBox")
-                    pat_node.add(img_node)
-                    self.svg.defs.add(pat_node)
-                    # create hex
-                    hex = self.svg.polygon(
-                        points=self.hex_points(cell.q, cell.r),
-                        fill="url(#CP{}{:02d}{:02d})".format(page, row, idx))
-                    self.layer.add(hex)
+        with self.sprites.region_pass():
+            if self.simple is False:
+                self.sprites.prepare((self.map[q_r] for q_r in self.region_keys()), self.scale)
+            else:
+                self.layer.style = \
+                    "font-size:36;" \
+                    "font-family:Verdana, Helvetica, Arial, sans-serif;" \
+                    "font-weight:bold;" \
+                    "font-style:oblique;" \
+                    "fill:black"
+            for cell in self.region_cells():
+
+                if "coastal_bitmap" in cell:
+                    if self.simple is True:
+                        # draw a "C" into the coastal hexes
+                        points = self.hex_points(cell.q, cell.r)
+                        x = points[0][0]
+                        y = points[1][1] + (points[2][1] - points[1][1]) / 2
+                        txt = self.svg.text("C", insert=(x, y), text_anchor="middle")
+                        self.add(txt)
+                    else:
+                        # get the hex image
+                        page, row, idx = cell["coastal_bitmap"]
+                        hex_img = self.sprites.sprite(page, row, idx, self.scale)
+                        # create pattern
+                        img_node = self.embed_image(
+                            hex_img, ("coastal", page, row, idx), id="CI{}{:02d}{:02d}".format(page, row, idx))
+                        pat_node = self.svg.pattern(
+                            size=(1, 1),
+                            id="CP{}{:02d}{:02d}".format(page, row, idx),
+                            patternUnits="objectBoundingBox")
+                        pat_node.add(img_node)
+                        self.add_def(pat_node)
+                        # create hex
+                        hex = self.svg.polygon(
+                            points=self.hex_points(cell.q, cell.r),
+                            fill="url(#CP{}{:02d}{:02d})".format(page, row, idx))
+                        self.add(hex)
 
 
 class RVRLayer(BaseLayer):
+    FIELDS = ()
+
     def __init__(self, parent, *args, **kwargs):
         super(RVRLayer, self).__init__(parent, *args, **kwargs)
-        file_name = os.path.join(
+        self.rvr_file = os.path.join(
             SETTINGS["filesystem"]["basepath"],
             "Bitmaps",
             "AggregateRiverLake.RVR")
-        self.RVR_DATA = {}
-        with open(file_name, "r") as fp:
-            for line in fp.readlines():
-                (q, r), img = process_rvr_line(line)
-                self.RVR_DATA[q, r] = img
+        self.RVR_DATA = get_rvr_images(self.rvr_file)
 
     def _render(self, *args, **kwargs):
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        for cell in self.region_cells():
 
             if (cell.q, cell.r) in self.RVR_DATA:
                 # get the hex image
-                hex_img = self.RVR_DATA[cell.q, cell.r]
-                hex_img = pil_img_resize(hex_img, self.scale)
-                hex_img_data, hex_img_dims = pil_img_to_b64_png(hex_img)
-                del hex_img
+                hex_img = get_scaled_image((self.rvr_file, cell.key()), self.RVR_DATA[cell.key()], self.scale)
                 # create pattern
-                img_node = self.svg.image(
-                    "data:image/png;base64,{}".format(hex_img_data),
-                    size=hex_img_dims,
-                    id="RLI{:03d}{:02d}".format(*cell.key()))
+                img_node = self.embed_image(
+                    hex_img, (self.rvr_file, cell.key()), id="RLI{:03d}{:02d}".format(*cell.key()))
                 pat_node = self.svg.pattern(
                     size=(1, 1),
                     id="RLP{:03d}{:02d}".format(*cell.key()),
                     patternUnits="objectBoundingBox")
                 pat_node.add(img_node)
-                self.svg.defs.add(pat_node)
+                self.add_def(pat_node)
                 # create hex
                 hex = self.svg.polygon(
                     points=self.hex_points(cell.q, cell.r),
                     fill="url(#RLP{:03d}{:02d})".format(*cell.key()))
-                self.layer.add(hex)
+                self.add(hex)
 
 
 class RailLayer(BaseLayer):
     """layer for rails and roads, features connecting two hexes across their common hexside"""
 
+    FIELDS = ("hexsides", "ter_code", "cty", "prt", "res")
+
     def __init__(self, parent, *args, **kwargs):
         super(RailLayer, self).__init__(parent, *args, **kwargs)
         self.rail_style = kwargs.get("base_rail", (("#555555", 6), ("#d7d7d7", 4)))
+        self.hexsides = self.parent.map_reader.hexside_table()
 
     def find_rail_rout_for_cell(self, cell, off=None):
         if off is None:
@@ -358,13 +555,13 @@ class RailLayer(BaseLayer):
 
         ## non icon-gravity
         if clock_pos == -1:
-            ## check surround of the hex for all-sea hexsides
-            surround = [self.map[coord] for coord in self.map.neighbors(cell.key())]
-            has_coast = [c["ter_code"] < 2 for c in surround]
-            for hs_kind, hs_code in cell["hexsides"]:
-                if hs_kind == "Co":
-                    for side in range(6):
-                        has_coast[side] = has_coast[side] or hs_code & 2 ** side > 0
+            ## check surround of the hex for all-sea hexsides, in hexside order, off map sides are no coast
+            idx = self.map.index(cell.key())
+            surround = self.map.neighbor_table()[idx]
+            coast = self.hexsides["Co"][idx]
+            has_coast = [
+                bool(coast[side]) or (nbr >= 0 and self.map[self.map.key_of(nbr)]["ter_code"] < 2)
+                for side, nbr in enumerate(surround)]
 
             # coastal hex without icon gravity
             if any(has_coast):
@@ -426,16 +623,12 @@ class RailLayer(BaseLayer):
                             clock_pos = sum(land_sides) + 3
                 else:
                     # should not happen
-                    print("issue routing rail for hex {}".format(cell))
+                    logger.warning("issue routing rail for hex %s", cell)
 
             ## handle landlocked hexes
             else:
-                rail_sides = [False] * 6
-                for k, s in cell["hexsides"]:
-                    if k in ["Ra", "Ro"]:
-                        rail_sides = [rail_sides[side] or s & 2 ** side > 0 for side in range(6)]
-                # rail_sides = sp.argwhere(sp.asarray(rail_sides) == True).flatten().tolist()
-                rail_sides = [i for i, v in enumerate(rail_sides) if v is True]
+                rail_sides = self.hexsides["Ra"][idx] | self.hexsides["Ro"][idx]
+                rail_sides = [i for i, v in enumerate(rail_sides) if v]
                 if len(rail_sides) == 0:
                     clock_pos = 0
                 elif len(rail_sides) == 1:
@@ -481,29 +674,34 @@ class RailLayer(BaseLayer):
                     clock_pos = 0
 
         # return
-        dx, dy = get_hex_clock_pos(clock_pos, center=(68, 76), radius=68)
+        dx, dy = self.clock_offset(clock_pos)
         x += dx + off[0]
         y += dy + off[1]
         return x, y
 
+    def seam_offset(self, cell, targ):
+        """`off` of the rail anchor of neighbor `targ` of `cell`, moves it next to `cell` across the seam"""
+
+        hex_w, _ = get_hex_dims(self.scale)
+        return self.map.column_shift(cell.key(), targ) * self.map.cols * hex_w, 0.0
+
     def _render(self, *args, **kwargs):
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        self.hexsides = self.parent.map_reader.hexside_table()
+        for cell in self.region_cells():
 
             if "hexsides" in cell:
-                for kind, side in cell["hexsides"]:
+                for kind, side in self.hexsides.items(cell.key()):
                     if kind in ("Ra", "Ro"):
                         sections = []
                         orig_x, orig_y = self.find_rail_rout_for_cell(cell)
-                        for i, targ in enumerate(self.map.neighbors((cell.q, cell.r))):
-                            if side & 2 ** i > 0:
-                                if any([k == "Co" and s & 2 ** i > 0 for k, s in cell["hexsides"]]):
+                        # neighbors in hexside order, -1 off the map
+                        for i, nbr in enumerate(self.map.neighbor_table()[self.map.index(cell.key())]):
+                            if nbr >= 0 and side & 2 ** i > 0:
+                                if self.hexsides.has(cell.key(), "Co", i):
                                     continue
-                                targ_x, targ_y = self.find_rail_rout_for_cell(self.map[targ])
+                                targ = self.map.key_of(nbr)
+                                targ_x, targ_y = self.find_rail_rout_for_cell(
+                                    self.map[targ], self.seam_offset(cell, targ))
                                 sections.append((orig_x, orig_y, targ_x, targ_y))
                         for s in sections:
                             base_section = self.svg.line(
@@ -511,7 +709,7 @@ class RailLayer(BaseLayer):
                                 end=(s[2], s[3]),
                                 stroke=self.rail_style[0][0],
                                 stroke_width=self.rail_style[0][1])
-                            self.layer.add(base_section)
+                            self.add(base_section)
                             dash_section = self.svg.line(
                                 start=(s[0], s[1]),
                                 end=(s[2], s[3]),
@@ -519,12 +717,14 @@ class RailLayer(BaseLayer):
                                 stroke_width=self.rail_style[1][1])
                             if kind == "Ra":
                                 dash_section.dasharray((self.rail_style[0][1],))
-                            self.layer.add(dash_section)
+                            self.add(dash_section)
 
 
 class HexsideLayer(BaseLayer):
     """layer for hex side features like strait arrows, alpine hexsides, etc."""
 
+    FIELDS = ("hexsides",)
+
     def __init__(self, parent, *args, **kwargs):
         super(HexsideLayer, self).__init__(parent, *args, **kwargs)
 
@@ -535,19 +735,15 @@ class HexsideLayer(BaseLayer):
             size=(5, 5),
             orient="auto")
         feat.add(self.svg.polygon(points=[(0, 0), (5, 2), (0, 4)], fill="red"))
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
     def _render(self, *args, **kwargs):
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        hexsides = self.parent.map_reader.hexside_table()
+        for cell in self.region_cells():
 
             if "hexsides" in cell:
                 points = self.hex_points(cell.q, cell.r)
-                for kind, side in cell["hexsides"]:
+                for kind, side in hexsides.items(cell.key()):
                     if kind in ["Al", "Ri", "Ca"]:
                         line_points = []
                         if side & 1:
@@ -570,7 +766,7 @@ class HexsideLayer(BaseLayer):
                             }[kind]
                             for edge in line_points:
                                 line = self.svg.line(start=edge[0], end=edge[1], **line_kwargs)
-                                self.layer.add(line)
+                                self.add(line)
                         except:
                             continue
                     elif kind == "St":
@@ -584,66 +780,68 @@ class HexsideLayer(BaseLayer):
                                 lerp(points[4][1], points[5][1], 1.0 / 3.0))
                             line_end = (line_start[0] + dxx, line_start[1])
                             line = self.svg.line(start=line_start, end=line_end, **line_kwargs)
-                            self.layer.add(line)
+                            self.add(line)
                         if side & 2:  # NW
                             line_start = (
                                 lerp(points[5][0], points[0][0], 1.0 / 3.0),
                                 lerp(points[5][1], points[0][1], 1.0 / 3.0))
                             line_end = (line_start[0] + dx, line_start[1] + dy)
                             line = self.svg.line(start=line_start, end=line_end, **line_kwargs)
-                            self.layer.add(line)
+                            self.add(line)
                         if side & 4:  # NE
                             line_start = (
                                 lerp(points[1][0], points[0][0], 1.0 / 3.0),
                                 lerp(points[1][1], points[0][1], 1.0 / 3.0))
                             line_end = (line_start[0] - dx, line_start[1] + dy)
                             line = self.svg.line(start=line_start, end=line_end, **line_kwargs)
-                            self.layer.add(line)
+                            self.add(line)
                         if side & 8:  # E
                             line_start = (
                                 lerp(points[2][0], points[1][0], 1.0 / 3.0),
                                 lerp(points[2][1], points[1][1], 1.0 / 3.0))
                             line_end = (line_start[0] - dxx, line_start[1])
                             line = self.svg.line(start=line_start, end=line_end, **line_kwargs)
-                            self.layer.add(line)
+                            self.add(line)
                         if side & 16:  # SE
                             line_start = (
                                 lerp(points[3][0], points[2][0], 1.0 / 3.0),
                                 lerp(points[3][1], points[2][1], 1.0 / 3.0))
                             line_end = (line_start[0] - dx, line_start[1] - dy)
                             line = self.svg.line(start=line_start, end=line_end, **line_kwargs)
-                            self.layer.add(line)
+                            self.add(line)
                         if side & 32:  # SW
                             line_start = (
                                 lerp(points[3][0], points[4][0], 1.0 / 3.0),
                                 lerp(points[3][1], points[4][1], 1.0 / 3.0))
                             line_end = (line_start[0] + dx, line_start[1] - dy)
                             line = self.svg.line(start=line_start, end=line_end, **line_kwargs)
-                            self.layer.add(line)
+                            self.add(line)
 
 
 class FeatureLayer(BaseLayer):
     """layer for hex features like cities, ports, resource, factories, etc."""
 
+    FIELDS = ("sz_id", "cty", "prt", "ice", "fac", "res")
+
     def __init__(self, parent, *args, **kwargs):
         super(FeatureLayer, self).__init__(parent, *args, **kwargs)
 
         # city dot 22x22
         feat = self.svg.g(id="city")
         feat.add(self.svg.circle(center=(0, 0), r=10, fill="yellow", stroke="black", stroke_width=4))
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # minor capital dot 34x34
         feat = self.svg.g(id="capital-minor")
         feat.add(self.svg.circle(center=(0, 0), r=15, fill="yellow", stroke="black", stroke_width=4))
         feat.add(self.svg.circle(center=(0, 0), r=5, fill="gray"))
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # major capital dot 34x34
         feat = self.svg.g(id="capital-major")
         feat.add(self.svg.circle(center=(0, 0), r=15, fill="yellow", stroke="black", stroke_width=4))
         feat.add(self.svg.circle(center=(0, 0), r=5, fill="red"))
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # minor port dot 30x30
         feat = self.svg.g(id="minor-port")
@@ -663,7 +861,7 @@ class FeatureLayer(BaseLayer):
               " -1.69798,-0.82138 0,-1.18721 -0.13114,-2.9128 -0.13114,-3.27863 0,-0.36582 2.6436,1.82223"
               " 3.83081,1.91196 0,0 -1.09057,1.00084 -0.91111,1.7325 0.17946,0.72474 1.81532,3.47879"
               " 3.36835,4.18973 2.19496,1.00085 4.46584,0.91112 4.46584,0.91112 l 0,2.16734"))
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # major port dot 30x30
         feat = self.svg.g(id="major-port")
@@ -683,7 +881,7 @@ class FeatureLayer(BaseLayer):
               " -1.69798,-0.82138 0,-1.18721 -0.13114,-2.9128 -0.13114,-3.27863 0,-0.36582 2.6436,1.82223"
               " 3.83081,1.91196 0,0 -1.09057,1.00084 -0.91111,1.7325 0.17946,0.72474 1.81532,3.47879"
               " 3.36835,4.18973 2.19496,1.00085 4.46584,0.91112 4.46584,0.91112 l 0,2.16734"))
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # iced in port background 30x30
         feat = self.svg.g(id="port-ice")
@@ -696,39 +894,27 @@ class FeatureLayer(BaseLayer):
         r3 = self.svg.rect(insert=(-13, -13), size=(26, 26), fill="white", stroke="gray")
         r3.rotate(-15, (0, 0))
         feat.add(r3)
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # factory icons
-        img_data = Image.open(os.path.join(
+        img_node = self.embed_image(Image.open(os.path.join(
             SETTINGS["filesystem"]["basepath"],
             "Bitmaps", "Icon Bitmaps",
-            "FACTORYSTACKRED.bmp"))
-        img_data, img_dims = pil_img_to_b64_png(img_data)
-        img_node = self.svg.image(
-            "data:image/png;base64,{}".format(img_data),
-            size=img_dims,
+            "FACTORYSTACKRED.bmp")),
             id="png-fac-red")
-        self.svg.defs.add(img_node)
-        img_data = Image.open(os.path.join(
+        self.add_def(img_node)
+        img_node = self.embed_image(Image.open(os.path.join(
             SETTINGS["filesystem"]["basepath"],
             "Bitmaps", "Icon Bitmaps",
-            "FACTORYSTACKBLUE.bmp"))
-        img_data, img_dims = pil_img_to_b64_png(img_data)
-        img_node = self.svg.image(
-            "data:image/png;base64,{}".format(img_data),
-            size=img_dims,
+            "FACTORYSTACKBLUE.bmp")),
             id="png-fac-blu")
-        self.svg.defs.add(img_node)
-        img_data = Image.open(os.path.join(
+        self.add_def(img_node)
+        img_node = self.embed_image(Image.open(os.path.join(
             SETTINGS["filesystem"]["basepath"],
             "Bitmaps", "Icon Bitmaps",
-            "FACTORYSMOKE.bmp"))
-        img_data, img_dims = pil_img_to_b64_png(img_data)
-        img_node = self.svg.image(
-            "data:image/png;base64,{}".format(img_data),
-            size=img_dims,
+            "FACTORYSMOKE.bmp")),
             id="png-fac-smk")
-        self.svg.defs.add(img_node)
+        self.add_def(img_node)
 
         # factory: r
         feat = self.svg.g(id="factory-r")
@@ -738,7 +924,7 @@ class FeatureLayer(BaseLayer):
         feat.add(stack1)
         smoke1 = self.svg.use("#png-fac-smk", insert=(-5, -14))
         feat.add(smoke1)
-        self.svg.defs.add(feat)
+        self.add_def(feat)
         # factory: b
         feat = self.svg.g(id="factory-b")
         frame = self.svg.rect(insert=(-7, -16), size=(14, 32), fill="blue")
@@ -747,7 +933,7 @@ class FeatureLayer(BaseLayer):
         feat.add(stack1)
         smoke1 = self.svg.use("#png-fac-smk", insert=(-5, -14))
         feat.add(smoke1)
-        self.svg.defs.add(feat)
+        self.add_def(feat)
         # factory: rb
         feat = self.svg.g(id="factory-rb")
         frame = self.svg.rect(insert=(-12, -16), size=(24, 32), fill="red")
@@ -760,7 +946,7 @@ class FeatureLayer(BaseLayer):
         feat.add(stack2)
         smoke2 = self.svg.use("#png-fac-smk", insert=(0, -14))
         feat.add(smoke2)
-        self.svg.defs.add(feat)
+        self.add_def(feat)
         # factory: rbb
         feat = self.svg.g(id="factory-rbb")
         frame = self.svg.rect(insert=(-17, -16), size=(34, 32), fill="red")
@@ -777,38 +963,26 @@ class FeatureLayer(BaseLayer):
         feat.add(stack3)
         smoke3 = self.svg.use("#png-fac-smk", insert=(5, -14))
         feat.add(smoke3)
-        self.svg.defs.add(feat)
+        self.add_def(feat)
 
         # resource icons
-        img_data = Image.open(os.path.join(
+        img_node = self.embed_image(Image.open(os.path.join(
             SETTINGS["filesystem"]["basepath"],
             "Bitmaps", "Icon Bitmaps",
-            "RESOURCE1.bmp"))
-        img_data, img_dims = pil_img_to_b64_png(img_data)
-        img_node = self.svg.image(
-            "data:image/png;base64,{}".format(img_data),
+            "RESOURCE1.bmp")),
             insert=(-17, -17),
-            size=img_dims,
             id="png-res")
-        self.svg.defs.add(img_node)
-        img_data = Image.open(os.path.join(
+        self.add_def(img_node)
+        img_node = self.embed_image(Image.open(os.path.join(
             SETTINGS["filesystem"]["basepath"],
             "Bitmaps", "Icon Bitmaps",
-            "OIL1.bmp"))
-        img_data, img_dims = pil_img_to_b64_png(img_data)
-        img_node = self.svg.image(
-            "data:image/png;base64,{}".format(img_data),
+            "OIL1.bmp")),
             insert=(-17, -17),
-            size=img_dims,
             id="png-oil")
-        self.svg.defs.add(img_node)
+        self.add_def(img_node)
 
     def _render(self, *args, **kwargs):
-        for cell in self.map.values():
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        for cell in self.region_cells():
             if "sz_id" in cell:
                 continue
 
@@ -819,7 +993,7 @@ class FeatureLayer(BaseLayer):
             try:
                 kind, clock_pos = cell["cty"]
                 if kind > 0:
-                    dx, dy = get_hex_clock_pos(clock_pos, center=(68, 76), radius=68)
+                    dx, dy = self.clock_offset(clock_pos)
                     if kind == 1:
                         feature = self.svg.use("#city", insert=(cell_x + dx, cell_y + dy))
                     elif kind == 2:
@@ -828,32 +1002,32 @@ class FeatureLayer(BaseLayer):
                         feature = self.svg.use("#capital-major", insert=(cell_x + dx, cell_y + dy))
                     else:
                         raise ValueError("unknown city code: {}".format(kind))
-                    self.layer.add(feature)
+                    self.add(feature)
             except Exception as ex:
-                print("feature.city issue: [{}] {}".format(cell.key(), ex))
+                logger.warning("feature.city issue: [%s] %s", cell.key(), ex)
 
             # port features
             try:
                 kind, clock_pos = cell["prt"]
                 if kind > 0:
-                    dx, dy = get_hex_clock_pos(clock_pos, center=(68, 76), radius=68)
+                    dx, dy = self.clock_offset(clock_pos)
                     if cell["ice"] is True:
-                        self.layer.add(self.svg.use("#port-ice", insert=(cell_x + dx, cell_y + dy)))
+                        self.add(self.svg.use("#port-ice", insert=(cell_x + dx, cell_y + dy)))
                     if kind == 1:
                         feature = self.svg.use("#minor-port", insert=(cell_x + dx, cell_y + dy))
                     elif kind == 2:
                         feature = self.svg.use("#major-port", insert=(cell_x + dx, cell_y + dy))
                     else:
                         raise ValueError("unknown port code: {}".format(kind))
-                    self.layer.add(feature)
+                    self.add(feature)
             except Exception as ex:
-                print("feature.city issue: [{}] {}".format(cell.key(), ex))
+                logger.warning("feature.city issue: [%s] %s", cell.key(), ex)
 
             # factory features
             try:
                 kind, clock_pos = cell["fac"]
                 if kind > 0:
-                    dx, dy = get_hex_clock_pos(clock_pos, center=(68, 76), radius=68)
+                    dx, dy = self.clock_offset(clock_pos)
                     if kind == 1:
                         feature = self.svg.use("#factory-r", insert=(cell_x + dx, cell_y + dy))
                     elif kind == 2:
@@ -866,24 +1040,24 @@ class FeatureLayer(BaseLayer):
                         feature = self.svg.use("#factory-rbb", insert=(cell_x + dx, cell_y + dy))
                     else:
                         raise ValueError("unknown factory code: {}".format(kind))
-                    self.layer.add(feature)
+                    self.add(feature)
             except Exception as ex:
-                print("feature.factory issue: [{}] {}".format(cell.key(), ex))
+                logger.warning("feature.factory issue: [%s] %s", cell.key(), ex)
 
             # resource features
             try:
                 kind, clock_pos = cell["res"]
                 if kind != 0:
-                    dx, dy = get_hex_clock_pos(clock_pos, center=(68, 76), radius=68)
+                    dx, dy = self.clock_offset(clock_pos)
                     if kind > 0:
                         feature = self.svg.use("#png-res", insert=(cell_x + dx, cell_y + dy))
                     if kind < 0:
                         feature = self.svg.use("#png-oil", insert=(cell_x + dx, cell_y + dy))
-                    self.layer.add(feature)
+                    self.add(feature)
                     if (abs(kind)) > 1:
                         # handle multiplicity
                         feature = self.svg.rect(insert=(cell_x + dx + 2, cell_y + dy + 2), size=(12, 12), fill="white")
-                        self.layer.add(feature)
+                        self.add(feature)
                         feature = self.svg.text(
                             abs(kind) * "I",
                             insert=(cell_x + dx + 8, cell_y + dy + 12),
@@ -891,13 +1065,15 @@ class FeatureLayer(BaseLayer):
                             stroke_width=2,
                             font_size="11px",
                             text_anchor="middle")
-                        self.layer.add(feature)
+                        self.add(feature)
 
             except Exception as ex:
-                print("feature.factory issue: [{}] {}".format(cell.key(), ex))
+                logger.warning("feature.factory issue: [%s] %s", cell.key(), ex)
 
 
 class GridLayer(BaseLayer):
+    FIELDS = ()
+
     def __init__(self, parent, *args, **kwargs):
         super(GridLayer, self).__init__(parent, *args, **kwargs)
         self.colour = SETTINGS["colour"]["grid"]
@@ -905,12 +1081,7 @@ class GridLayer(BaseLayer):
 
     def _render(self, *args, **kwargs):
         self.layer.style = "font-family:Verdana, Helvetica, Arial, sans-serif;font-size:10;font-weight:bold;"
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        for cell in self.region_cells():
 
             points = self.hex_points(cell.q, cell.r)
             grid = self.svg.polygon(points=points, fill="none", stroke=self.colour)
@@ -918,17 +1089,19 @@ class GridLayer(BaseLayer):
                 x, y = self.hex_origin(cell.q, cell.r)
                 coord = self.svg.text(
                     "{:03d}-{:03d}".format(cell.q, cell.r),
-                    insert=(x + 125, y + 76),
+                    insert=(x + 125 * self.scale, y + 76 * self.scale),
                     writing_mode="tb",
                     text_anchor="middle",
                     fill=self.colour)
-                self.layer.add(coord)
-            self.layer.add(grid)
+                self.add(coord)
+            self.add(grid)
 
 
 class LabelLayer(BaseLayer):
     """layer for hex features like cities, ports, resource, factories, etc."""
 
+    FIELDS = ("labels",)
+
     COL_CODE = {
         1: "#000000",  # black
         2: "#8B0000",  # dark red
@@ -948,38 +1121,133 @@ class LabelLayer(BaseLayer):
         16: "#FFFFFF",  # white
     }
 
+    # per drawing scale: the rule with the largest minimum scale not above it applies. Below full scale the
+    # labels crowd, as the font sizes do not scale, so overlapping labels are dropped by size code. A
+    # `MultiScaleDrawing` draws at scale 1.0 and scales its outputs as a whole, labels included, so they do not
+    # crowd and all its outputs get the full scale rule, pass `min_size` or `cull` to thin them out
+    RULES = [
+        # minimum scale, rule
+        (1.0, {"min_size": 0, "cull": False}),
+        (0.75, {"min_size": 0, "cull": True}),
+        (0.0, {"min_size": 6, "cull": True}),
+    ]
+
     def __init__(self, parent, *args, **kwargs):
         super(LabelLayer, self).__init__(parent, *args, **kwargs)
-        self.svg.defs.add(self.svg.style(
+        self.add_def(self.svg.style(
             "@import url('https://fonts.googleapis.com/css?family=Droid+Sans:700');"))
+        rule = self.rule(self.scale, kwargs.get("rules", self.RULES))
+        self.min_size = int(kwargs.get("min_size", rule["min_size"]))
+        self.cull = bool(kwargs.get("cull", rule["cull"]))
+        self.padding = float(kwargs.get("padding", 2))
+        self.kept = kwargs.get("kept")
+        self.margin = int(kwargs.get("margin", 0))
+        self.n_dropped = 0
+
+    @staticmethod
+    def rule(scale, rules):
+        """label rule for the drawing `scale`"""
+
+        for min_scale, rule in sorted(rules, key=lambda item: item[0], reverse=True):
+            if scale >= min_scale:
+                return rule
+        return {"min_size": 0, "cull": False}
+
+    @staticmethod
+    def label_items(cells, hex_origin, min_size=0):
+        """(key, pos, x, y, text, font_size, size, colour) of the labels of `cells` of at least `min_size`
+
+        `pos` is the position of the label in the `labels` of its cell, (x, y) the start of the baseline.
+        """
+
+        rval = []
+        for cell in cells:
+            if "labels" not in cell:
+                continue
+            # cell origin
+            x, y = hex_origin(cell.q, cell.r)
+            for pos, (text, (dx, dy), size, colour) in enumerate(cell["labels"]):
+                if size < min_size:
+                    continue
+                rval.append((
+                    cell.key(), pos, x + 2 * dx + 2, y + 2 * dy + 2 + size * 3, text, size * 3, size, colour))
+        return rval
+
+    @staticmethod
+    def kept_labels(items, padding):
+        """set of the (key, pos) of the `label_items` kept by `place_labels`"""
+
+        kept = place_labels([item[2:7] for item in items], padding)
+        return {items[i][:2] for i in kept}
+
+    def label_columns(self):
+        """(column, q) of the columns whose labels are drawn, in the order of q
+
+        `q` is the column the cells are drawn at, the region grown by `margin` columns. On a wrapped map the
+        margin columns past an edge are the columns of the other edge, each column is drawn once.
+        """
+
+        q_min, _, q_max, _ = self.region
+        q_max = min(q_max, self.map.cols - 1)
+        rval = {q: q for q in range(q_min, q_max + 1)}
+        for step in range(1, self.margin + 1):
+            for q in (q_min - step, q_max + step):
+                column = q % self.map.cols if self.map.wrap else q
+                if 0 <= column < self.map.cols and column not in rval.values():
+                    rval[q] = column
+        return [(column, q) for q, column in sorted(rval.items())]
+
+    def placed_labels(self):
+        """(key, x, y, text, font_size, colour) of the labels to draw, without the dropped ones
+
+        With `kept` the labels to draw were chosen beforehand, e.g. over a larger area than the region. Labels
+        of the cells up to `margin` hexes around the region are drawn too, as their text may reach into it.
+        The cells looked at are counted as visited.
+        """
+
+        _, r_min, _, r_max = self.region
+        rows = range(max(r_min - self.margin, 0), min(r_max + self.margin, self.map.rows - 1) + 1)
+        cells = []
+        shift = {}
+        for column, q in self.label_columns():
+            for r in rows:
+                cells.append(self.map[column, r])
+                if q != column:
+                    shift[column, r] = q - column
+        self.stats.cells_visited += len(cells)
+
+        def hex_origin(q, r):
+            return self.hex_origin(q + shift.get((q, r), 0), r)
+
+        items = LabelLayer.label_items(cells, hex_origin, self.min_size)
+        kept = self.kept
+        if kept is None and self.cull is True:
+            kept = LabelLayer.kept_labels(items, self.padding)
+        n_labels = len(items)
+        if kept is not None:
+            items = [item for item in items if item[:2] in kept]
+        self.n_dropped = n_labels - len(items)
+        return [(key, x, y, text, font_size, colour) for key, _, x, y, text, font_size, _, colour in items]
 
     def _render(self, *args, **kwargs):
         self.layer.update({
             "style": "font-family:'Droid Sans',sans-serif;"})
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
-
-            # cell origin
-            x, y = self.hex_origin(cell.q, cell.r)
-
-            # render label
-            if "labels" in cell:
-                for text, (dx, dy), size, colour in cell["labels"]:
-                    size *= 3
-                    label = self.svg.text(
-                        text,
-                        insert=(x + 2 * dx + 2, y + 2 * dy + 2 + size),
-                        fill=self.COL_CODE[colour + 1],
-                        # stroke=self.COL_CODE[colour + 1],
-                        font_size=size)
-                    self.layer.add(label)
+        drawn = set()
+        for key, x, y, text, font_size, colour in self.placed_labels():
+            label = self.svg.text(
+                text,
+                insert=(x, y),
+                fill=self.COL_CODE[colour + 1],
+                # stroke=self.COL_CODE[colour + 1],
+                font_size=font_size)
+            self.add(label)
+            drawn.add(key)
+        self.stats.cells_drawn += len(drawn)
 
 
 class BorderLayer(BaseLayer):
+    FIELDS = ("borders",)
+
     def __init__(self, parent, *args, **kwargs):
         super(BorderLayer, self).__init__(parent, *args, **kwargs)
         self.render_attr = kwargs.get("render_attr", {
@@ -989,12 +1257,7 @@ class BorderLayer(BaseLayer):
         })
 
     def _render(self, *args, **kwargs):
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        for cell in self.region_cells():
             if "borders" not in cell:
                 continue
 
@@ -1019,7 +1282,7 @@ class BorderLayer(BaseLayer):
                 line_kwargs = {"stroke": ra[0], "stroke_width": ra[1]}
                 for edge in line_points:
                     line = self.svg.line(start=edge[0], end=edge[1], **line_kwargs)
-                    self.layer.add(line)
+                    self.add(line)
             else:
                 line_points = {
                     1: (points[4], points[5]),
@@ -1046,7 +1309,7 @@ class BorderLayer(BaseLayer):
                                 stroke_width=self.render_attr[line_kind[n]][1])
                             if kth_line > 1:
                                 line.dasharray([15, 15 * sum(line_mem)])
-                            self.layer.add(line)
+                            self.add(line)
 
 
 class InfoLayer(BaseLayer):
@@ -1055,16 +1318,12 @@ class InfoLayer(BaseLayer):
         self.field_names = kwargs.get("field_names", ["country_id"])
         if not isinstance(self.field_names, (list, tuple)):
             self.field_names = [self.field_names]
+        self.FIELDS = tuple(self.field_names)
         self.render_attr = kwargs.get("render_attr", ("#FF0000",))
 
     def _render(self, *args, **kwargs):
         self.layer.style = "font-family:Verdana, Helvetica, Arial, sans-serif;font-size:30;font-weight:bold;"
-        for cell in self.map.values():
-            # region check
-            if cell.q < (self.parent.region[0] or 0) or cell.q > (self.parent.region[2] or 99999):
-                continue
-            if cell.r < (self.parent.region[1] or 0) or cell.r > (self.parent.region[3] or 99999):
-                continue
+        for cell in self.region_cells():
             if not any([n in cell for n in self.field_names]):
                 continue
 
@@ -1075,35 +1334,63 @@ class InfoLayer(BaseLayer):
                 insert=(x + 76, y + 76),
                 text_anchor="middle",
                 fill=self.render_attr[0])
-            self.layer.add(coord)
+            self.add(coord)
 
 
 ## MAIN
 
-def gen_svg(map_reader, file_name, region=None, scale=None):
-    ms = MapDrawing(map_reader, file_name, region=region, scale=scale)
-    ms.add_layer(TerrainLayer, simple=False)
-    ms.add_layer(CoastalLayer, simple=False)
-    ms.add_layer(RVRLayer)
-    ms.add_layer(HexsideLayer)
-    ms.add_layer(GridLayer, coords=True)
-    ms.add_layer(RailLayer)
-    ms.add_layer(BorderLayer)
-    ms.add_layer(FeatureLayer)
-    ms.add_layer(LabelLayer)
-    # ms.add_layer(InfoLayer, field_names=["sz_adj"])
+SVG_LAYERS = [
+    (TerrainLayer, {"simple": False}),
+    (CoastalLayer, {"simple": False}),
+    (RVRLayer, {}),
+    (HexsideLayer, {}),
+    (GridLayer, {"coords": True}),
+    (RailLayer, {}),
+    (BorderLayer, {}),
+    (FeatureLayer, {}),
+    (LabelLayer, {}),
+    # (InfoLayer, {"field_names": ["sz_adj"]}),
+]
+
+
+def scaled_file_name(file_name, scale):
+    """`file_name` with the scale in percent appended, e.g. part01_075.svg"""
+
+    base, ext = os.path.splitext(file_name)
+    return "{}_{:03d}{}".format(base, int(round(scale * 100)), ext)
+
+
+def gen_svg(map_reader, file_name, region=None, scale=None, stats_file=None, layers=None, scales=None,
+            compress_level=SVGZ_COMPRESS_LEVEL):
+    """render `layers` to `file_name`, or with `scales` set to one file per scale in a single pass
+
+    A `file_name` ending with .svgz is written gzip compressed at `compress_level`.
+    """
+
+    if scales is not None:
+        ms = MultiScaleDrawing(map_reader, file_name, scales=scales, region=region, stats_file=stats_file,
+                               compress_level=compress_level)
+    else:
+        ms = MapDrawing(map_reader, file_name, region=region, scale=scale, stats_file=stats_file,
+                        compress_level=compress_level)
+    for layer_cls, kwargs in layers or SVG_LAYERS:
+        ms.add_layer(layer_cls, **kwargs)
     ms.render()
     return ms
 
 
-def gen_svgs():
+def gen_svgs(stats_file=None, manifest=None, scales=None, ext=".svg", compress_level=SVGZ_COMPRESS_LEVEL,
+             keep=False):
+    """render the map in 24 parts, with `manifest` set parts whose inputs did not change are skipped
+
+    With `scales` set, e.g. (1.0, .75, .5), every part is written at each scale from a single render.
+    With `ext` ".svgz" the parts are written gzip compressed at `compress_level`.
+    With `keep` the part drawings are returned for `update_svgs`, otherwise each one is released once written,
+    as every drawing holds a complete svg document with its embedded images.
+    """
+
     VERBOSE = True
-    m = MWIFMapReader()
-    m.load_ter_data(verbose=VERBOSE)
-    m.load_coa_data(verbose=VERBOSE)
-    m.load_hst_data(verbose=VERBOSE)
-    m.load_sea_adj_data(verbose=VERBOSE)
-    m.gen_border_data(verbose=VERBOSE)
+    m = MWIFMapReader().load_all(verbose=VERBOSE)
 
     # regionALL = None
     # regionBlackSea = (48, 48, 68, 68)
@@ -1126,6 +1413,11 @@ def gen_svgs():
 
     MAX_COL = 359
     MAX_ROW = 195
+    drawings = []
+    if manifest is not None:
+        manifest = BuildManifest(manifest)
+        assets = asset_digest()
+        part_opt = {"ext": ext, "compress_level": compress_level}
     for row in range(4):
         for col in range(6):
             part_idx = row * 6 + col + 1
@@ -1136,12 +1428,46 @@ def gen_svgs():
                 min((row + 1) * 50 + 3, MAX_ROW)
             )
             part_nam = "part{:02d}".format(part_idx)
+            if scales is None:
+                part_out = {part_nam + ext: None}
+            else:
+                part_out = {scaled_file_name(part_nam + ext, scale): scale for scale in scales}
+            if manifest is not None:
+                part_dig = {
+                    file_name: tile_digest(m.map, part_reg, scale, SVG_LAYERS, assets, part_opt)
+                    for file_name, scale in part_out.items()}
+                if all(manifest.is_current(file_name, part_dig[file_name]) for file_name in part_out):
+                    print("SKIPPING: part:", part_idx, part_nam, part_reg, "(unchanged)")
+                    continue
             print()
             print("RENDERING: part:", part_idx, part_nam, part_reg)
             print()
-            part_drw = gen_svg(m, part_nam, region=part_reg, scale=None)
+            part_drw = gen_svg(m, part_nam + ext, region=part_reg, scale=None, stats_file=stats_file, scales=scales,
+                               compress_level=compress_level)
+            if keep is True:
+                drawings.append(part_drw)
+            if manifest is not None:
+                for file_name in part_drw.output_files():
+                    manifest.update(file_name, part_dig[file_name])
+                manifest.save()
 
     #part_drw = gen_svg(m, "layer", region=(0, 0, 65, 53), scale=None)
+    return m, drawings
+
+
+def update_svgs(map_reader, drawings):
+    """re-render the parts of `drawings` (as returned by `gen_svgs(keep=True)`) affected by changed cells
+
+    Patch the cells of `map_reader.map` in place, regenerate the borders of the changed cells with
+    `map_reader.gen_border_data(keys=map_reader.map.dirty_cells())` if needed, then call this.
+    """
+
+    updated = []
+    for drawing in drawings:
+        if drawing.update():
+            updated.append(drawing)
+    map_reader.map.clear_dirty()
+    return updated
 
 
 ## MAIN
@@ -0,0 +1,120 @@
+"""render metrics for `MapDrawing` and its layers"""
+
+## IMPORTS
+
+import json
+import time
+
+
+## CLASSES
+
+class Timer(object):
+    """context manager accumulating wall and cpu time into a stats object"""
+
+    def __init__(self, stats, prefix):
+        self.stats = stats
+        self.prefix = prefix
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = getattr(self.stats, self.prefix + "_wall")
+        cpu = getattr(self.stats, self.prefix + "_cpu")
+        setattr(self.stats, self.prefix + "_wall", wall + time.perf_counter() - self._wall)
+        setattr(self.stats, self.prefix + "_cpu", cpu + time.process_time() - self._cpu)
+        return False
+
+
+class LayerStats(object):
+    """metrics collected for one layer of one tile"""
+
+    def __init__(self, name):
+        self.name = name
+        self.setup_wall = 0.0
+        self.setup_cpu = 0.0
+        self.reset()
+
+    def reset(self):
+        """reset the render counters, the setup times are kept"""
+
+        self.render_wall = 0.0
+        self.render_cpu = 0.0
+        self.cells_visited = 0
+        self.cells_drawn = 0
+        self.elements = 0
+        self.defs = 0
+        self.images = 0
+        self.image_bytes = 0
+        self.png_encode_time = 0.0
+
+    def __str__(self):
+        return "{}: {:.3f}s wall, {}/{} cells drawn, {} elements, {} defs, {} images ({} bytes)".format(
+            self.name, self.setup_wall + self.render_wall, self.cells_drawn, self.cells_visited,
+            self.elements, self.defs, self.images, self.image_bytes)
+
+    def timer(self, prefix="render"):
+        return Timer(self, prefix)
+
+    def add_image(self, n_bytes, encode_time):
+        self.images += 1
+        self.image_bytes += n_bytes
+        self.png_encode_time += encode_time
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class RenderStats(object):
+    """metrics collected for one tile, i.e. one `MapDrawing` render"""
+
+    def __init__(self, name, region, scale):
+        self.name = name
+        self.region = tuple(region)
+        self.scale = scale
+        self.render_wall = 0.0
+        self.render_cpu = 0.0
+        self.finalise_wall = 0.0
+        self.finalise_cpu = 0.0
+        self.output_bytes = 0
+        self.layers = []
+
+    def __str__(self):
+        rval = ["{} {} @ {}: {:.3f}s render, {:.3f}s finalise, {} bytes".format(
+            self.name, self.region, self.scale, self.render_wall, self.finalise_wall, self.output_bytes)]
+        rval.extend("  {}".format(layer) for layer in self.layers)
+        return "\n".join(rval)
+
+    def timer(self, prefix="render"):
+        return Timer(self, prefix)
+
+    def totals(self):
+        """sum of the per layer counters"""
+
+        rval = LayerStats("total")
+        for layer in self.layers:
+            for key, value in layer.to_dict().items():
+                if key != "name":
+                    setattr(rval, key, getattr(rval, key) + value)
+        return rval
+
+    def to_dict(self):
+        rval = {key: value for key, value in self.__dict__.items() if key != "layers"}
+        rval["layers"] = [layer.to_dict() for layer in self.layers]
+        return rval
+
+    def write_jsonl(self, fp):
+        """write one json line per layer and a summary line for the tile to the open file `fp`"""
+
+        for layer in self.layers:
+            record = layer.to_dict()
+            record["tile"] = self.name
+            fp.write(json.dumps(record) + "\n")
+        record = self.to_dict()
+        record["layers"] = [layer.name for layer in self.layers]
+        record["tile"] = record.pop("name")
+        fp.write(json.dumps(record) + "\n")
+
+## EOF
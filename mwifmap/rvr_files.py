@@ -7,12 +7,23 @@ from mwifmap.util import *
 
 __author__ = "pmeier82"
 
-BASE_PATH = SETTINGS["filesystem"]["basepath"]
-RVR_FILE = os.path.join(BASE_PATH, "Bitmaps", "AggregateRiverLake.RVR")
 HEX_HEIGHT = 152
 HEX_WIDTH = 136
 
 
+def get_rvr_file():
+    return os.path.join(get_base_path(), "Bitmaps", "AggregateRiverLake.RVR")
+
+
+def __getattr__(name):
+    # path constants depend on the settings, which are only read when needed
+    if name == "BASE_PATH":
+        return get_base_path()
+    if name == "RVR_FILE":
+        return get_rvr_file()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 def get_px_data(inp, background=None):
     if background is None:
         background = (0, 0, 0, 0)
@@ -90,7 +101,7 @@ def process_rvr_line(line, background=None):
 if __name__ == "__main__":
     ## open file and read in as string
     LINES = None
-    with open(RVR_FILE, "r") as fp:
+    with open(get_rvr_file(), "r") as fp:
         LINES = fp.readlines()
 
     entry = 4000
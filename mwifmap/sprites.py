@@ -0,0 +1,247 @@
+"""shared, memory bounded caches for the bitmaps used by the renderers"""
+
+## IMPORTS
+
+import collections
+import contextlib
+import os
+import threading
+
+from mwifmap.rvr_files import process_rvr_line
+from mwifmap.util import *
+
+# numpy is only needed once a coastal page is cut
+np = LazyModule("numpy")
+
+## CONSTANTS
+
+COASTAL_CACHE_BYTES = 256 * 2 ** 20
+PAGE_CACHE_BYTES = 64 * 2 ** 20
+SCALED_CACHE_BYTES = 256 * 2 ** 20
+
+
+## HELPERS
+
+def image_nbytes(image):
+    """approximate memory footprint of a PIL image"""
+
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+def array_nbytes(data):
+    return data.nbytes
+
+
+## CLASSES
+
+class LRUCache(object):
+    """least recently used cache with a memory budget in bytes"""
+
+    def __init__(self, max_bytes, size_of=None):
+        self.max_bytes = int(max_bytes)
+        self.size_of = size_of or image_nbytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, n_bytes = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, n_bytes=None):
+        """store `value`, evicting least recently used entries until the budget is met"""
+
+        if n_bytes is None:
+            n_bytes = self.size_of(value)
+        with self._lock:
+            if key in self._data:
+                self.n_bytes -= self._data.pop(key)[1]
+            self._data[key] = value, n_bytes
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes and len(self._data) > 1:
+                _, (_, evicted_bytes) = self._data.popitem(last=False)
+                self.n_bytes -= evicted_bytes
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.n_bytes = 0
+
+
+class CoastalSprites(object):
+    """hex sprites cut from the coastal bitmap pages
+
+    Pages are only opened when a requested region has coastal hexes on them. The sprites a region needs
+    from a page are cut in one vectorized pass and kept, scaled, in a LRU cache.
+    The decoded pages are kept in a LRU cache of their own, and held for the duration of a `region_pass`,
+    so sprites evicted before a region is drawn are cut again without decoding their page again.
+    """
+
+    def __init__(self, coastal_dir=None, max_bytes=COASTAL_CACHE_BYTES, max_page_bytes=PAGE_CACHE_BYTES):
+        self.coastal_dir = coastal_dir or os.path.join(
+            SETTINGS["filesystem"]["basepath"], "Bitmaps", "Coastal Bitmaps")
+        self.cache = LRUCache(max_bytes)
+        self.pages = LRUCache(max_page_bytes, size_of=array_nbytes)
+        self.pages_loaded = 0
+        self._held = {}
+        self._n_passes = 0
+        self._lock = threading.RLock()
+
+    def load_page(self, page):
+        self.pages_loaded += 1
+        image = Image.open(os.path.join(self.coastal_dir, "Page{:02d}.bmp".format(page)))
+        return np.asarray(image.convert("RGB"))
+
+    def page_data(self, page):
+        """decoded pixels of `page`, loaded on a miss of the page cache"""
+
+        with self._lock:
+            rval = self._held.get(page)
+            if rval is None:
+                rval = self.pages.get(page)
+                if rval is None:
+                    rval = self.pages.put(page, self.load_page(page))
+                if self._n_passes:
+                    self._held[page] = rval
+            return rval
+
+    @contextlib.contextmanager
+    def region_pass(self):
+        """hold the pages used while the block runs, for the prepare and drawing of a region"""
+
+        with self._lock:
+            self._n_passes += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._n_passes -= 1
+                if not self._n_passes:
+                    self._held.clear()
+
+    def cut_page(self, page, slots, scale):
+        """cut the hexes at `slots`, a list of (row, idx) tuples, from `page` and cache them at `scale`"""
+
+        data = self.page_data(page)
+        hex_w, hex_h = (int(v) for v in get_hex_dims(1.0))
+        rows = np.array([row for row, idx in slots])
+        cols = np.array([idx for row, idx in slots])
+        x0 = ((rows % 2) * (hex_w // 2) + cols * hex_w)
+        y0 = (.75 * rows * hex_h).astype(int)
+        ys = y0[:, None] + np.arange(hex_h)
+        xs = x0[:, None] + np.arange(hex_w)
+        # pixels past the page edge are black, as with a PIL crop
+        inside = ((ys < data.shape[0])[:, :, None] & (xs < data.shape[1])[:, None, :])
+        ys = np.minimum(ys, data.shape[0] - 1)
+        xs = np.minimum(xs, data.shape[1] - 1)
+        # (n, hex_h, hex_w, 3) in one fancy indexing pass
+        hexes = data[ys[:, :, None], xs[:, None, :]]
+        hexes[~inside] = 0
+        for (row, idx), pixels in zip(slots, hexes):
+            sprite = pil_img_resize(Image.fromarray(pixels, "RGB"), scale)
+            self.cache.put((page, row, idx, scale), sprite)
+
+    def prepare(self, cells, scale=1.0):
+        """make sure the sprites for the coastal hexes among `cells` are cached, loading only needed pages"""
+
+        needed = collections.defaultdict(set)
+        for cell in cells:
+            if "coastal_bitmap" in cell:
+                page, row, idx = cell["coastal_bitmap"]
+                if (page, row, idx, scale) not in self.cache:
+                    needed[page].add((row, idx))
+        with self._lock:
+            for page, slots in sorted(needed.items()):
+                self.cut_page(page, sorted(slots), scale)
+
+    def sprite(self, page, row, idx, scale=1.0):
+        """the scaled hex image for a `cell["coastal_bitmap"]` entry"""
+
+        rval = self.cache.get((page, row, idx, scale))
+        if rval is None:
+            with self._lock:
+                self.cut_page(page, [(row, idx)], scale)
+            rval = self.cache.get((page, row, idx, scale))
+        return rval
+
+
+## SERVICES
+
+_COASTAL_SPRITES = None
+_SCALED_IMAGES = LRUCache(SCALED_CACHE_BYTES)
+_SCALED_FILL_LOCK = threading.RLock()
+_RVR_IMAGES = {}
+
+
+def get_coastal_sprites():
+    """process wide `CoastalSprites` instance, shared across tiles and renders"""
+
+    global _COASTAL_SPRITES
+    if _COASTAL_SPRITES is None:
+        _COASTAL_SPRITES = CoastalSprites()
+    return _COASTAL_SPRITES
+
+
+def get_scaled_image(source_id, image, scale=1.0, resample=None):
+    """`image` resized by `scale`, resampled once per process for each (source_id, scale, filter)
+
+    Cache fills are serialised and the stored images fully loaded, as they are shared by the threads of the
+    tile server.
+
+    :parameters:
+        source_id : hashable
+            identifies the source bitmap, e.g. its file path
+        image : PIL.Image or callable
+            the source image, or a callable returning it that is only called on a cache miss
+    """
+
+    if resample is None:
+        resample = pil_img_resample(scale)
+    key = source_id, float(scale), resample
+    rval = _SCALED_IMAGES.get(key)
+    if rval is None:
+        with _SCALED_FILL_LOCK:
+            rval = _SCALED_IMAGES.get(key)
+            if rval is None:
+                if callable(image):
+                    image = image()
+                rval = pil_img_resize(image, scale, resample)
+                # at scale 1 this is the source itself, opened lazily, it must be decoded before it is shared
+                rval.load()
+                rval = _SCALED_IMAGES.put(key, rval)
+    return rval
+
+
+def get_scaled_images_cache():
+    return _SCALED_IMAGES
+
+
+def get_rvr_images(file_name):
+    """the river/lake hex images of the RVR file, parsed once per process, keyed by (q, r)"""
+
+    if file_name not in _RVR_IMAGES:
+        rval = {}
+        with open(file_name, "r") as fp:
+            for line in fp.readlines():
+                (q, r), img = process_rvr_line(line)
+                rval[q, r] = img
+        _RVR_IMAGES[file_name] = rval
+    return _RVR_IMAGES[file_name]
+
+## EOF
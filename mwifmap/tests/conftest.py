@@ -0,0 +1,16 @@
+"""fixtures of the tests"""
+
+## IMPORTS
+
+import pytest
+
+from mwifmap.tests.synthetic import make_map
+
+
+## FIXTURES
+
+@pytest.fixture(params=[False, True], ids=["flat", "wrapped"])
+def hexmap(request):
+    return make_map(wrap=request.param)
+
+## EOF
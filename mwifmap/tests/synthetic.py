@@ -0,0 +1,59 @@
+"""synthetic maps for the tests, random land and sea with countries and ports on the land"""
+
+## IMPORTS
+
+import os
+
+import numpy as np
+
+from mwifmap.mwif_hexmap import HexMap
+from mwifmap.mwif_map_reader import MWIFMapReader
+
+## CONSTANTS
+
+COLS = 12
+ROWS = 8
+
+
+## FUNCTIONS
+
+def make_map(cols=COLS, rows=ROWS, wrap=False, seed=0):
+    """random map, about 60% land"""
+
+    rng = np.random.default_rng(seed)
+    hexmap = HexMap(cols, rows, wrap=wrap)
+    for cell in hexmap.values():
+        if rng.random() < .6:
+            cell["ter_code"] = int(rng.integers(2, 6))
+            cell["country_id"] = int(rng.integers(1, 4))
+            if rng.random() < .25:
+                cell["prt"] = int(rng.integers(1, 3)), 0
+        else:
+            cell["ter_code"] = 0
+    return hexmap
+
+
+def make_reader(hexmap):
+    """`MWIFMapReader` of `hexmap`, for the drawings, without reading any file"""
+
+    reader = MWIFMapReader(map_dir=os.devnull)
+    reader.map = hexmap
+    return reader
+
+
+def bfs(hexmap, sources, passable=lambda q_r: True):
+    """reference breadth first search over `HexMap.neighbors`, {key: distance} of the reached cells"""
+
+    rval = {q_r: 0 for q_r in sources}
+    frontier = list(sources)
+    while frontier:
+        following = []
+        for q_r in frontier:
+            for nbr in hexmap.neighbors(q_r):
+                if nbr not in rval and passable(nbr):
+                    rval[nbr] = rval[q_r] + 1
+                    following.append(nbr)
+        frontier = following
+    return rval
+
+## EOF
@@ -0,0 +1,83 @@
+"""group-by aggregation against loops over the cells"""
+
+## IMPORTS
+
+import collections
+
+import numpy as np
+
+from mwifmap.mwif_hexmap import feature_kind
+from mwifmap.mwif_map_metrics import aggregate, group_index, histogram
+from mwifmap.mwif_map_reader import FACTORY_CODE
+
+
+## HELPERS
+
+def add_features(hexmap, seed=0):
+    """random resources, oil and factories on the land cells"""
+
+    rng = np.random.default_rng(seed)
+    for cell in hexmap.values():
+        if cell["ter_code"] == 0:
+            continue
+        if rng.random() < .3:
+            cell["res"] = int(rng.choice([-2, -1, 1, 2])), 0
+        if rng.random() < .3:
+            cell["fac"] = int(rng.choice(sorted(FACTORY_CODE))), 0
+
+
+def totals(hexmap, by, value):
+    rval = collections.Counter()
+    for cell in hexmap.values():
+        if all(field in cell for field in by):
+            key = tuple(feature_kind(cell[field]) for field in by)
+            rval[key if len(by) > 1 else key[0]] += value(cell)
+    return dict(rval)
+
+
+## TESTS
+
+def test_aggregate_matches_loops(hexmap):
+    add_features(hexmap)
+    res = lambda cell: feature_kind(cell.get("res", 0))
+    fac = lambda cell: FACTORY_CODE[feature_kind(cell.get("fac", 0))]
+    by = ("country_id",)
+    assert aggregate(hexmap, "country_id") == totals(hexmap, by, lambda cell: 1)
+    assert aggregate(hexmap, "country_id", "resources") == totals(hexmap, by, lambda cell: max(res(cell), 0))
+    assert aggregate(hexmap, "country_id", "oil") == totals(hexmap, by, lambda cell: max(-res(cell), 0))
+    assert aggregate(hexmap, "country_id", "red_factories") == totals(hexmap, by, lambda cell: fac(cell)[0])
+    assert aggregate(hexmap, "country_id", "factories") == totals(hexmap, by, lambda cell: sum(fac(cell)))
+    assert aggregate(hexmap, "country_id", "ports") == totals(hexmap, by, lambda cell: "prt" in cell)
+    assert aggregate(hexmap, ("country_id", "ter_code")) == totals(hexmap, ("country_id", "ter_code"), lambda c: 1)
+
+
+def test_aggregate_over_cells(hexmap):
+    keys = [q_r for q_r in hexmap if q_r[1] < 3]
+    expected = collections.Counter(hexmap[q_r]["ter_code"] for q_r in keys)
+    # groups without any of the cells are kept with a total of 0
+    ter_codes = sorted({cell["ter_code"] for cell in hexmap.values()})
+    assert aggregate(hexmap, "ter_code", cells=keys) == {key: expected[key] for key in ter_codes}
+
+
+def test_histogram(hexmap):
+    rval = histogram(hexmap, "country_id", "ter_code")
+    expected = collections.defaultdict(collections.Counter)
+    for cell in hexmap.values():
+        if "country_id" in cell:
+            expected[cell["country_id"]][cell["ter_code"]] += 1
+    assert rval == {key: dict(counter) for key, counter in expected.items()}
+
+
+def test_group_index_is_reused(hexmap):
+    groups = group_index(hexmap, "country_id")
+    assert group_index(hexmap, "country_id") is groups
+    assert group_index(hexmap, ("country_id", "ter_code")) is not groups
+    q_r = next(q_r for q_r, cell in hexmap.items() if "country_id" in cell)
+    assert groups.group_of(q_r) == hexmap[q_r]["country_id"]
+    hexmap[q_r]["ter_code"] = 5
+    assert group_index(hexmap, "country_id") is groups
+    hexmap[q_r]["country_id"] = 7
+    groups = group_index(hexmap, "country_id")
+    assert groups.group_of(q_r) == 7 and 7 in groups.keys
+
+## EOF
@@ -0,0 +1,82 @@
+"""map cells with slotted fields and an overflow dict"""
+
+## IMPORTS
+
+import pytest
+
+from mwifmap.mwif_hexmap import CELL_FIELDS, HexMap, HexMapCell
+
+
+## TESTS
+
+def test_slotted_fields():
+    cell = HexMapCell(0, 0)
+    assert not hasattr(cell, "__dict__")
+    assert len(cell) == 0 and list(cell) == [] and cell._extra is None
+    cell["ter_code"] = 3
+    cell["country_id"] = 7
+    assert cell["ter_code"] == 3 and "country_id" in cell and "wz_id" not in cell
+    # slotted fields do not create the overflow dict
+    assert cell._extra is None
+    assert dict(cell) == {"ter_code": 3, "country_id": 7}
+    with pytest.raises(AttributeError):
+        cell.some_attribute = 1
+
+
+def test_extra_fields():
+    cell = HexMapCell(0, 0)
+    cell["sz_id"] = 12
+    cell["labels"] = ["Paris"]
+    assert cell._extra == {"labels": ["Paris"]}
+    # slotted fields first, in the order of CELL_FIELDS, then the extra fields
+    cell["borders"] = []
+    cell["ter_code"] = 2
+    assert list(cell) == ["ter_code", "sz_id", "labels", "borders"]
+    assert len(cell) == 4
+    del cell["labels"]
+    del cell["borders"]
+    assert cell._extra is None and len(cell) == 2
+
+
+def test_missing_fields():
+    cell = HexMapCell(0, 0)
+    for name in (CELL_FIELDS[0], "labels"):
+        assert name not in cell
+        assert cell.get(name) is None and cell.get(name, -1) == -1
+        with pytest.raises(KeyError):
+            cell[name]
+        with pytest.raises(KeyError):
+            del cell[name]
+    cell["labels"] = []
+    with pytest.raises(KeyError):
+        cell["borders"]
+    assert cell.get("borders", ()) == ()
+    assert cell.pop("ter_code", None) is None
+
+
+def test_changes_are_tracked():
+    hexmap = HexMap(4, 3)
+    cell = hexmap[1, 2]
+    version = hexmap.version
+    cell["ter_code"] = 2
+    cell["labels"] = []
+    assert hexmap.version == version + 2
+    assert hexmap._dirty[1, 2] == {"ter_code", "labels"}
+    cell["labels"].append("x")
+    cell.touch("labels")
+    assert hexmap.field_version("labels") == hexmap.version
+    del cell["ter_code"]
+    assert hexmap.field_version("ter_code") == hexmap.version
+    assert hexmap.field_array("ter_code", default=-1)[hexmap.index((1, 2))] == -1
+
+
+def test_mapping_methods():
+    cell = HexMapCell(2, 1)
+    cell.update({"ter_code": 1, "region": "x", "hexsides": {1: 2}})
+    assert cell.setdefault("ter_code", 5) == 1 and cell.setdefault("ice", 0) == 0
+    assert dict(cell) == {"ter_code": 1, "region": "x", "ice": 0, "hexsides": {1: 2}}
+    assert cell == {"ter_code": 1, "region": "x", "ice": 0, "hexsides": {1: 2}}
+    assert sorted(cell.keys()) == ["hexsides", "ice", "region", "ter_code"]
+    assert cell.key() == (2, 1) and str(cell) == "Cell[2,1]"
+
+## EOF
@@ -0,0 +1,104 @@
+"""queries, socket location and socket handling of the map daemon"""
+
+## IMPORTS
+
+import asyncio
+import json
+import os
+import socket
+import stat
+import threading
+import time
+
+import pytest
+
+from mwifmap import map_daemon
+from mwifmap.map_daemon import MapClient, MapDaemon, MapQueryError
+from mwifmap.tests.synthetic import make_reader
+
+
+## HELPERS
+
+def reply(daemon, line):
+    return json.loads(daemon.query(line))
+
+
+def run_until_cancelled(loop, task):
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+
+
+## TESTS
+
+def test_queries(hexmap):
+    daemon = MapDaemon(make_reader(hexmap), path="unused")
+    assert reply(daemon, "ping") == {"ok": True, "result": "pong"}
+    assert reply(daemon, "cell 3 2 ter_code")["result"] == {"ter_code": hexmap[3, 2]["ter_code"]}
+    assert reply(daemon, "cell 3 2")["result"] == dict(hexmap[3, 2])
+    assert sorted(map(tuple, reply(daemon, "neighbors 0 0")["result"])) == sorted(hexmap.neighbors((0, 0)))
+    assert reply(daemon, "distance 0 0 3 0")["result"] == hexmap.distance((0, 0), (3, 0))
+    for line in ("", "nothing", "cell 1", "cell 99 0", "distance a b c d"):
+        assert reply(daemon, line)["ok"] is False
+
+
+def test_cell_unknown_fields(hexmap):
+    daemon = MapDaemon(make_reader(hexmap), path="unused")
+    assert reply(daemon, "cell 3 2 ter_code tercode") == {"ok": False, "error": "unknown fields: tercode"}
+    # fields of the map a cell does not have are no error
+    sea = next(q_r for q_r, cell in hexmap.items() if cell["ter_code"] == 0)
+    assert reply(daemon, "cell {} {} ter_code country_id".format(*sea))["result"] == {"ter_code": 0}
+
+
+def test_socket_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+    monkeypatch.setattr(map_daemon.tempfile, "gettempdir", lambda: str(tmp_path))
+    path = map_daemon.socket_path()
+    assert os.path.dirname(path) == str(tmp_path / "mwifmap-{}".format(os.getuid()))
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
+    os.chmod(os.path.dirname(path), 0o755)
+    with pytest.raises(PermissionError):
+        map_daemon.socket_dir()
+    (tmp_path / "run").mkdir()
+    assert map_daemon.socket_path() == str(tmp_path / "run" / "mwifmap.sock")
+
+
+def test_serve_and_client(hexmap, tmp_path):
+    path = str(tmp_path / "map.sock")
+    # the socket left behind by a daemon that is gone is replaced
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(path)
+    daemon = MapDaemon(make_reader(hexmap), path=path)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(daemon.serve())
+    thread = threading.Thread(target=run_until_cancelled, args=(loop, task))
+    thread.start()
+    try:
+        for _ in range(100):
+            if not map_daemon.is_stale_socket(path):
+                break
+            time.sleep(.02)
+        with MapClient(path) as client:
+            assert client.query("ping") == "pong"
+            assert client.query("cell", 3, 2, "ter_code") == {"ter_code": hexmap[3, 2]["ter_code"]}
+            with pytest.raises(MapQueryError):
+                client.query("cell", 3, 2, "tercode")
+        # a running daemon is not replaced
+        with pytest.raises(FileExistsError):
+            asyncio.run(MapDaemon(make_reader(hexmap), path=path).serve())
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+    assert not os.path.exists(path)
+
+
+def test_serve_keeps_other_files(hexmap, tmp_path):
+    path = tmp_path / "map.sock"
+    path.write_text("not a socket")
+    with pytest.raises(FileExistsError):
+        asyncio.run(MapDaemon(make_reader(hexmap), path=str(path)).serve())
+    assert path.read_text() == "not a socket"
+
+## EOF
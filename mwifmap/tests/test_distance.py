@@ -0,0 +1,32 @@
+"""neighbor table and distance fields against the cell by cell definitions"""
+
+## IMPORTS
+
+from mwifmap.mwif_map_metrics import distance_field
+from mwifmap.tests.synthetic import bfs
+
+
+## TESTS
+
+def test_neighbor_table_matches_neighbors(hexmap):
+    table = hexmap.neighbor_table()
+    for q_r in hexmap:
+        row = table[hexmap.index(q_r)]
+        assert {hexmap.key_of(idx) for idx in row[row >= 0]} == set(hexmap.neighbors(q_r))
+
+
+def test_distance_field_is_hex_distance(hexmap):
+    source = (1, 3)
+    rval = distance_field(hexmap, [source])
+    for q_r in hexmap:
+        assert rval[hexmap.index(q_r)] == hexmap.distance(source, q_r)
+
+
+def test_distance_field_matches_bfs(hexmap):
+    sources = [(0, 0), (7, 5)]
+    rval = distance_field(hexmap, sources, mask="land")
+    expected = bfs(hexmap, sources, lambda q_r: hexmap[q_r]["ter_code"] >= 2)
+    for q_r in hexmap:
+        assert rval[hexmap.index(q_r)] == expected.get(q_r, -1)
+
+## EOF
@@ -0,0 +1,162 @@
+"""graphs of the map against searches over the cells"""
+
+## IMPORTS
+
+import collections
+
+import numpy as np
+import pytest
+
+from mwifmap.mwif_hexmap import HexsideTable
+from mwifmap.mwif_map_graph import RailGraph, SeaZoneGraph
+
+
+## HELPERS
+
+def add_sea_zones(hexmap, width=3):
+    """sea zones in bands of `width` columns, with the zones bordered by each land cell as its `sz_adj`"""
+
+    for cell in hexmap.values():
+        if cell["ter_code"] == 0:
+            cell["sz_id"] = 10 + cell.q // width
+    for q_r, cell in hexmap.items():
+        if cell["ter_code"] != 0:
+            zones = {hexmap[nbr]["sz_id"] for nbr in hexmap.neighbors(q_r) if "sz_id" in hexmap[nbr]}
+            if zones:
+                cell["sz_adj"] = sorted(zones)
+
+
+def zone_adjacency(hexmap):
+    rval = collections.defaultdict(set)
+    for q_r, cell in hexmap.items():
+        for nbr in hexmap.neighbors(q_r):
+            a, b = cell.get("sz_id"), hexmap[nbr].get("sz_id")
+            if a is not None and b is not None and a != b:
+                rval[a].add(b)
+    return rval
+
+
+def add_rails(hexmap, seed=0):
+    """random rail, road and coastal hexsides, returns the set of (index, index) pairs linked by the network
+
+    A section is drawn from one end, and left out if that end has a coastal hexside there.
+    """
+
+    rng = np.random.default_rng(seed)
+    table = hexmap.neighbor_table()
+    links = set()
+    for q_r, cell in hexmap.items():
+        idx = hexmap.index(q_r)
+        codes = {"Ra": 0, "Ro": 0, "Co": 0}
+        for side, nbr in enumerate(table[idx]):
+            if nbr < 0:
+                continue
+            for kind, p in (("Ra", .3), ("Ro", .15), ("Co", .2)):
+                if rng.random() < p:
+                    codes[kind] |= 1 << side
+            if ((codes["Ra"] | codes["Ro"]) & ~codes["Co"]) >> side & 1:
+                links.add((min(idx, nbr), max(idx, nbr)))
+        cell["hexsides"] = [(kind, code) for kind, code in sorted(codes.items()) if code]
+    return links
+
+
+def graph_bfs(adjacent, source):
+    """{node: steps} of the nodes reached from `source` in the {node: set of nodes} graph `adjacent`"""
+
+    rval = {source: 0}
+    frontier = [source]
+    while frontier:
+        following = []
+        for node in frontier:
+            for nbr in adjacent[node]:
+                if nbr not in rval:
+                    rval[nbr] = rval[node] + 1
+                    following.append(nbr)
+        frontier = following
+    return rval
+
+
+## FIXTURES
+
+@pytest.fixture
+def sea_zones(hexmap):
+    add_sea_zones(hexmap)
+    return SeaZoneGraph(hexmap), zone_adjacency(hexmap)
+
+
+@pytest.fixture
+def network(hexmap):
+    links = add_rails(hexmap)
+    adjacent = collections.defaultdict(set)
+    for a, b in links:
+        adjacent[hexmap.key_of(a)].add(hexmap.key_of(b))
+        adjacent[hexmap.key_of(b)].add(hexmap.key_of(a))
+    return RailGraph(hexmap, HexsideTable(hexmap)), adjacent
+
+
+## TESTS
+
+def test_sea_zone_adjacency(hexmap, sea_zones):
+    graph, adjacent = sea_zones
+    zones = sorted({cell["sz_id"] for cell in hexmap.values() if "sz_id" in cell})
+    assert graph.zone_ids.tolist() == zones and len(graph) == len(zones)
+    for zone in zones:
+        assert graph.adjacent(zone) == sorted(adjacent[zone])
+        assert all(graph.is_adjacent(zone, other) == (other in adjacent[zone]) for other in zones)
+
+
+def test_sea_zone_coasts_and_ports(hexmap, sea_zones):
+    graph, _ = sea_zones
+    for zone in graph.zone_ids.tolist():
+        coast = [q_r for q_r, cell in hexmap.items() if zone in cell.get("sz_adj", ())]
+        assert graph.coastal_hexes(zone) == coast
+        assert graph.ports(zone) == [q_r for q_r in coast if "prt" in hexmap[q_r]]
+    sea = next(q_r for q_r, cell in hexmap.items() if "sz_id" in cell)
+    assert graph.zones_of(sea) == [hexmap[sea]["sz_id"]]
+    with pytest.raises(KeyError):
+        graph.coastal_hexes(-5)
+
+
+def test_sea_zone_distances(sea_zones):
+    graph, adjacent = sea_zones
+    zones = graph.zone_ids.tolist()
+    for zone in zones:
+        expected = graph_bfs(adjacent, zone)
+        assert [graph.distance(zone, other) for other in zones] == [expected.get(other, -1) for other in zones]
+        assert graph.reach(zone, 1) == sorted(other for other in expected if expected[other] <= 1)
+
+
+def test_distances_match_bfs(hexmap, network):
+    graph, adjacent = network
+    sources = [(0, 0), (3, 4), (11, 7)]
+    targets = list(hexmap)
+    rval = graph.distances(sources, targets)
+    for i, source in enumerate(sources):
+        expected = graph_bfs(adjacent, source)
+        assert [rval[i, j] for j in range(len(targets))] == [expected.get(q_r, -1) for q_r in targets]
+
+
+def test_paths_follow_sections(hexmap, network):
+    graph, adjacent = network
+    orig = (3, 4)
+    reached = graph_bfs(adjacent, orig)
+    for dest in hexmap:
+        path = graph.path(orig, dest)
+        if dest not in reached:
+            assert path is None
+            assert not graph.connected(orig, dest) or orig == dest
+            continue
+        assert path[0] == orig and path[-1] == dest
+        assert len(path) == reached[dest] + 1
+        assert all(b in adjacent[a] for a, b in zip(path, path[1:]))
+
+
+def test_networks_are_connected_sets(hexmap, network):
+    graph, adjacent = network
+    for q_r in hexmap:
+        if not adjacent[q_r]:
+            assert graph.network_of(q_r) == -1
+        else:
+            assert set(graph.network_cells(graph.network_of(q_r))) == set(graph_bfs(adjacent, q_r))
+
+## EOF
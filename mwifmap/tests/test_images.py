@@ -0,0 +1,61 @@
+"""resampling of the bitmaps and the process wide scaled image cache"""
+
+## IMPORTS
+
+import threading
+
+from PIL import Image
+
+from mwifmap.sprites import get_scaled_image, get_scaled_images_cache
+from mwifmap.util import get_hex_dims, pil_img_resample, pil_img_resize
+
+
+## TESTS
+
+def test_pil_img_resize():
+    image = Image.new("RGB", tuple(int(v) for v in get_hex_dims(1.0)), (10, 20, 30))
+    assert pil_img_resample(0.5) == Image.LANCZOS
+    assert pil_img_resize(image, 0.5).size == (68, 76)
+    assert pil_img_resize(image, 2.0).size == (272, 304)
+    assert pil_img_resize(image, 1.0) is image
+
+
+def test_get_scaled_image_once_per_scale(tmp_path):
+    path = str(tmp_path / "hex.bmp")
+    Image.new("RGB", (136, 152), (10, 20, 30)).save(path)
+    opened = []
+
+    def source():
+        opened.append(path)
+        return Image.open(path)
+
+    for scale in (1.0, .75, .5, .75, 1.0, .5):
+        assert get_scaled_image(path, source, scale).size == (int(136 * scale), int(152 * scale))
+    assert len(opened) == 3
+    assert get_scaled_image(path, source, .5) is get_scaled_images_cache().get((path, .5, Image.LANCZOS))
+    assert get_scaled_image(path, source, .5, Image.NEAREST) is not get_scaled_image(path, source, .5)
+    assert len(opened) == 4
+
+
+def test_get_scaled_image_shared_by_threads(tmp_path):
+    path = str(tmp_path / "hex.bmp")
+    Image.new("RGB", (136, 152), (10, 20, 30)).save(path)
+    opened = []
+
+    def source():
+        opened.append(path)
+        return Image.open(path)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(get_scaled_image(path, source, 1.0)))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 1
+    assert all(image is results[0] for image in results)
+    assert results[0].getpixel((5, 5)) == (10, 20, 30)
+
+## EOF
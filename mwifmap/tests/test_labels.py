@@ -0,0 +1,140 @@
+"""label name index and label placement"""
+
+## IMPORTS
+
+import pytest
+
+from mwifmap.mwif_map_labels import LabelEntry, LabelIndex, normalise, place_labels, trigrams
+from mwifmap.mwif_map_raster import RasterDrawing, RasterLabelLayer
+from mwifmap.mwif_map_renderer import LabelLayer, MapDrawing, MultiScaleDrawing
+from mwifmap.tests.synthetic import COLS, make_map, make_reader
+
+
+## CONSTANTS
+
+LABELS = [
+    ("New York", (10, 4), (0, 0), 3, 0),
+    ("York", (30, 2), (0, 0), 1, 0),
+    ("Yorktown", (11, 5), (2, 1), 2, 0),
+    ("São Paulo", (40, 60), (0, 0), 3, 1),
+    ("Newcastle", (31, 1), (0, 0), 1, 0),
+    ("Paris", (33, 8), (0, 0), 4, 0),
+]
+
+
+BACKENDS = {
+    "svg": (MapDrawing, LabelLayer),
+    "raster": (RasterDrawing, RasterLabelLayer),
+}
+
+
+## HELPERS
+
+def make_index():
+    index = LabelIndex()
+    for label in LABELS:
+        index.add(*label)
+    return index
+
+
+def texts(entries):
+    return [entry.text for entry in entries]
+
+
+def draw_labels(hexmap, drawing_cls=MapDrawing, layer_cls=LabelLayer, region=(2, 1, 6, 5), layer_kwargs=None,
+                **kwargs):
+    drawing = drawing_cls(make_reader(hexmap), "labels", region=region, **kwargs)
+    drawing.add_layer(layer_cls, **(layer_kwargs or {}))
+    drawing.render(finalise=False)
+    return drawing.layers[0]
+
+
+## TESTS
+
+def test_normalise():
+    assert normalise("São  Paulo!") == "sao paulo"
+    assert normalise("St.-Pierre et Miquelon") == "st pierre et miquelon"
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_find():
+    index = make_index()
+    assert index.find("sao paulo") == [LabelEntry("São Paulo", (40, 60), (0, 0), 3, 1)]
+    assert index.find("york") == [LabelEntry("York", (30, 2), (0, 0), 1, 0)]
+    assert index.find("york town") == []
+
+
+def test_prefix():
+    index = make_index()
+    # names starting with the prefix first, then word matches, each by descending size
+    assert texts(index.prefix("york")) == ["Yorktown", "York", "New York"]
+    assert texts(index.prefix("NEW")) == ["New York", "Newcastle"]
+    assert texts(index.prefix("paul")) == ["São Paulo"]
+    assert texts(index.prefix("york", limit=1)) == ["Yorktown"]
+    assert index.prefix("") == [] and index.prefix("zzz") == []
+
+
+def test_fuzzy_and_search():
+    index = make_index()
+    scored = index.fuzzy("pariss")
+    assert scored[0][1].text == "Paris" and 0 < scored[0][0] < 1
+    assert all(a[0] >= b[0] for a, b in zip(scored, scored[1:]))
+    assert texts(entry for _, entry in index.fuzzy("sao paulo", limit=1)) == ["São Paulo"]
+    assert index.fuzzy("qqqq") == []
+    assert texts(index.search("pari")) == ["Paris"]
+    assert texts(index.search("sao pablo"))[0] == "São Paulo"
+
+
+def test_add_after_build():
+    index = make_index()
+    assert index.find("berlin") == []
+    index.add("Berlin", (35, 3), (0, 0), 4, 0)
+    assert texts(index.find("berlin")) == ["Berlin"] and len(index) == len(LABELS) + 1
+
+
+def test_place_labels():
+    labels = [(0, 20, "Small", 6, 2), (10, 22, "Large", 12, 4), (200, 20, "Apart", 6, 1)]
+    assert place_labels(labels) == [1, 2]
+    assert place_labels(labels[:1] + labels[2:]) == [0, 1]
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_cells_drawn_counts_labelled_cells(hexmap, backend):
+    drawing_cls, layer_cls = BACKENDS[backend]
+    for q_r in [(2, 1), (4, 3), (6, 5)]:
+        hexmap[q_r]["labels"] = [("Town", (0, 0), 4, 0), ("Hill", (10, 20), 2, 0)]
+    layer = draw_labels(hexmap, drawing_cls, layer_cls)
+    assert (layer.stats.elements, layer.stats.cells_drawn, layer.stats.cells_visited) == (6, 3, 25)
+
+
+def test_label_rules_by_scale(hexmap):
+    for q, r in hexmap:
+        hexmap[q, r]["labels"] = [("Crowded Town", (0, 0), 8, 0), ("Tiny", (0, 10), 2, 0)]
+    assert LabelLayer.rule(.8, LabelLayer.RULES) == {"min_size": 0, "cull": True}
+    full = draw_labels(hexmap)
+    assert (full.cull, full.n_dropped, full.stats.elements) == (False, 0, 50)
+    half = draw_labels(hexmap, scale=.5)
+    # the small labels are left out, overlapping large ones dropped
+    assert half.min_size == 6 and half.n_dropped > 0 and half.stats.elements == 25 - half.n_dropped
+    # the outputs of a multi scale drawing are scaled as a whole, all of them get the full scale rule
+    multi = draw_labels(hexmap, MultiScaleDrawing, scales=(1.0, .5))
+    assert (multi.min_size, multi.cull) == (0, False)
+
+
+@pytest.mark.parametrize("wrap", [False, True])
+def test_margin_labels_across_the_seam(wrap):
+    hexmap = make_map(wrap=wrap)
+    hexmap[COLS - 1, 2]["labels"] = [("Seam", (0, 0), 4, 0)]
+    hexmap[3, 2]["labels"] = [("Inside", (0, 0), 4, 0)]
+    layer = draw_labels(hexmap, region=(0, 0, 2, 4), layer_kwargs={"margin": 1})
+    placed = {text: (x, y) for _, x, y, text, _, _ in layer.placed_labels()}
+    inside_x = layer.hex_origin(3, 2)[0] + 2
+    if wrap:
+        assert sorted(placed) == ["Inside", "Seam"]
+        # drawn one column left of the region, where the seam column joins it
+        assert placed["Seam"] == (layer.hex_origin(-1, 2)[0] + 2, placed["Inside"][1])
+    else:
+        assert sorted(placed) == ["Inside"]
+    assert placed["Inside"][0] == inside_x
+
+## EOF
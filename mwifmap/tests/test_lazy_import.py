@@ -0,0 +1,57 @@
+"""deferred loading of the settings and the heavy packages"""
+
+## IMPORTS
+
+import subprocess
+import sys
+
+import pytest
+
+from mwifmap.import_bench import time_import
+from mwifmap.util import LazyModule, LazySettings
+
+
+## CONSTANTS
+
+# heavy packages each module may load at import time
+ALLOWED = {
+    "mwifmap.util": set(),
+    "mwifmap.mwif_hexmap": set(),
+    "mwifmap.mwif_map_reader": set(),
+    "mwifmap.map_daemon": set(),
+    "mwifmap.mwif_map_renderer": {"svgwrite"},
+}
+
+
+## TESTS
+
+@pytest.mark.parametrize("module", sorted(ALLOWED))
+def test_import_loads_no_heavy_packages(module):
+    _, loaded = time_import(module, repeat=1)
+    assert set(filter(None, loaded.split(","))) <= ALLOWED[module]
+
+
+def test_settings_read_on_first_access():
+    probe = "import mwifmap.util as u; print(u.SETTINGS._sections is None); u.SETTINGS['hex']; " \
+            "print(u.SETTINGS._sections is None)"
+    out = subprocess.run([sys.executable, "-c", probe], check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout.split()
+    assert out == ["True", "False"]
+
+
+def test_lazy_settings(tmp_path):
+    path = tmp_path / "settings.cfg"
+    path.write_text("[hex]\nprototype = 1,2\n")
+    settings = LazySettings([str(path)])
+    assert settings._sections is None
+    assert settings["hex"]["prototype"] == "1,2"
+    assert list(settings) == ["hex"] and len(settings) == 1
+
+
+def test_lazy_module():
+    module = LazyModule("colorsys")
+    assert module._module is None and "colorsys" in repr(module)
+    assert module.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1)
+    assert module._module is sys.modules["colorsys"]
+
+## EOF
@@ -0,0 +1,59 @@
+"""tile digests and the build manifest"""
+
+## IMPORTS
+
+from mwifmap import build_manifest
+from mwifmap.build_manifest import BuildManifest, cell_digest, layer_digest, tile_digest
+from mwifmap.mwif_map_renderer import BorderLayer, TerrainLayer
+from mwifmap.tests.synthetic import COLS, make_map
+
+
+## CONSTANTS
+
+LAYERS = [(TerrainLayer, {"simple": True}), (BorderLayer, {})]
+REGION = (3, 2, 6, 5)
+
+
+## TESTS
+
+def test_cell_digest_margin(hexmap):
+    digest = cell_digest(hexmap, REGION)
+    hexmap[REGION[2] + 3, 3]["ter_code"] = 7
+    assert cell_digest(hexmap, REGION) == digest
+    hexmap[REGION[2] + 2, 3]["ter_code"] = 7
+    assert cell_digest(hexmap, REGION) != digest
+
+
+def test_cell_digest_across_seam():
+    hexmap = make_map(wrap=True)
+    digest = cell_digest(hexmap, (0, 0, 3, 3))
+    hexmap[COLS - 1, 2]["ter_code"] = 7
+    assert cell_digest(hexmap, (0, 0, 3, 3)) != digest
+
+
+def test_layer_digest_source(monkeypatch):
+    digest = layer_digest(LAYERS)
+    assert layer_digest(LAYERS) == digest
+    assert layer_digest([(TerrainLayer, {"simple": False}), (BorderLayer, {})]) != digest
+    monkeypatch.setitem(build_manifest._SOURCE_DIGESTS, TerrainLayer.__module__, "changed")
+    assert layer_digest(LAYERS) != digest
+
+
+def test_manifest_skips_unchanged(hexmap, tmp_path):
+    file_name = str(tmp_path / "part01.svg")
+    path = str(tmp_path / "manifest.json")
+    digest = tile_digest(hexmap, REGION, 1.0, LAYERS, "assets", {"ext": ".svg"})
+    manifest = BuildManifest(path)
+    assert not manifest.is_current(file_name, digest)
+    with open(file_name, "w") as fp:
+        fp.write("<svg/>")
+    manifest.update(file_name, digest)
+    manifest.save()
+    manifest = BuildManifest(path)
+    assert manifest.is_current(file_name, tile_digest(hexmap, REGION, 1.0, LAYERS, "assets", {"ext": ".svg"}))
+    assert not manifest.is_current(file_name, tile_digest(hexmap, REGION, .5, LAYERS, "assets", {"ext": ".svg"}))
+    assert not manifest.is_current(file_name, tile_digest(hexmap, REGION, 1.0, LAYERS, "other", {"ext": ".svg"}))
+    hexmap[4, 3]["ter_code"] = 7
+    assert not manifest.is_current(file_name, tile_digest(hexmap, REGION, 1.0, LAYERS, "assets", {"ext": ".svg"}))
+
+## EOF
@@ -0,0 +1,83 @@
+"""cell masks and connected components against the cell by cell definitions"""
+
+## IMPORTS
+
+import numpy as np
+
+from mwifmap.mwif_hexmap import HexMap
+from mwifmap.mwif_map_metrics import cell_mask, components
+from mwifmap.tests.synthetic import bfs
+
+
+## HELPERS
+
+def is_land(hexmap):
+    return lambda q_r: hexmap[q_r]["ter_code"] >= 2
+
+
+## TESTS
+
+def test_masks_keep_lakes_apart(hexmap):
+    lakes = [(2, 2), (5, 5)]
+    for q_r in lakes:
+        hexmap[q_r]["ter_code"] = 1
+    land, sea, water = (cell_mask(hexmap, name) for name in ("land", "sea", "water"))
+    for q_r in hexmap:
+        idx, ter_code = hexmap.index(q_r), hexmap[q_r]["ter_code"]
+        assert (land[idx], sea[idx], water[idx]) == (ter_code >= 2, ter_code == 0, ter_code < 2)
+    assert not (land & water).any() and (land | water).all()
+    assert all(components(hexmap, "land").component_of(q_r) == -1 for q_r in lakes)
+
+
+def test_cell_mask_forms(hexmap):
+    keys = [(0, 0), (3, 4)]
+    from_keys = cell_mask(hexmap, keys)
+    assert np.flatnonzero(from_keys).tolist() == sorted(hexmap.index(q_r) for q_r in keys)
+    assert np.array_equal(cell_mask(hexmap, lambda cell: cell.key() in keys), from_keys)
+    assert cell_mask(hexmap, from_keys) is from_keys
+    assert cell_mask(hexmap, None).all()
+
+
+def test_components_match_flood_fill(hexmap):
+    land = components(hexmap, "land")
+    seen = set()
+    n_components = 0
+    for q_r in hexmap:
+        if not is_land(hexmap)(q_r):
+            assert land.component_of(q_r) == -1
+        elif q_r not in seen:
+            filled = set(bfs(hexmap, [q_r], is_land(hexmap)))
+            seen |= filled
+            n_components += 1
+            assert {land.component_of(key) for key in filled} == {land.component_of(q_r)}
+            assert set(land.cells(land.component_of(q_r))) == filled
+    assert len(land) == n_components
+    assert land.counts.sum() == len(seen)
+
+
+def test_component_bboxes_contain_their_cells(hexmap):
+    land = components(hexmap, "land")
+    for component, (q_min, r_min, q_max, r_max) in enumerate(land.bboxes):
+        assert q_min <= q_max
+        for q, r in land.cells(component):
+            assert (q - q_min) % hexmap.cols <= q_max - q_min
+            assert r_min <= r <= r_max
+
+
+def test_components_by_field(hexmap):
+    countries = components(hexmap, field="country_id")
+    for q_r in hexmap:
+        cell = hexmap[q_r]
+        if "country_id" not in cell:
+            assert countries.component_of(q_r) == -1
+            continue
+        assert countries.values[countries.component_of(q_r)] == cell["country_id"]
+        for nbr in hexmap.neighbors(q_r):
+            same = hexmap[nbr].get("country_id") == cell["country_id"]
+            assert (countries.component_of(nbr) == countries.component_of(q_r)) == same
+
+
+def test_components_of_all_cells():
+    assert np.array_equal(components(HexMap(10, 5), None).bboxes, [[0, 0, 9, 4]])
+
+## EOF
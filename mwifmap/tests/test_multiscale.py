@@ -0,0 +1,72 @@
+"""one render written at several scales"""
+
+## IMPORTS
+
+import base64
+import io
+from xml.etree import ElementTree
+
+from PIL import Image
+
+from mwifmap.mwif_map_renderer import BaseLayer, GridLayer, MultiScaleDrawing, TerrainLayer, scaled_file_name
+from mwifmap.tests.synthetic import make_reader
+
+
+## CONSTANTS
+
+SCALES = (1.0, .75, .5)
+XLINK = "{http://www.w3.org/1999/xlink}href"
+
+
+## HELPERS
+
+class ImageLayer(BaseLayer):
+    """embeds a bitmap per land cell with a source id and a marker bitmap without one"""
+
+    FIELDS = ("ter_code",)
+
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            if cell["ter_code"] != 0:
+                image = Image.new("RGB", (136, 152), (cell["ter_code"] * 40, 0, 0))
+                self.add(self.embed_image(image, ("ter", cell["ter_code"])))
+        self.add(self.embed_image(Image.new("RGB", (8, 8), (0, 0, 255))))
+
+
+def read_svg(file_name):
+    root = ElementTree.parse(file_name).getroot()
+    sizes = [Image.open(io.BytesIO(base64.b64decode(node.get(XLINK).split(",", 1)[1]))).size
+             for node in root.iter("{http://www.w3.org/2000/svg}image")]
+    return root, sizes
+
+
+## TESTS
+
+def test_scaled_file_name():
+    assert scaled_file_name("part01.svg", .75) == "part01_075.svg"
+    assert scaled_file_name("part01.svgz", 1.0) == "part01_100.svgz"
+
+
+def test_multi_scale_outputs(hexmap, tmp_path):
+    drawing = MultiScaleDrawing(make_reader(hexmap), str(tmp_path / "part.svg"), scales=SCALES, region=(1, 1, 6, 5))
+    drawing.add_layer(TerrainLayer, simple=True)
+    drawing.add_layer(GridLayer)
+    drawing.add_layer(ImageLayer)
+    drawing.render()
+    hrefs = [node["xlink:href"] for _, node, _, _ in drawing.images]
+    assert drawing.output_files() == [str(tmp_path / scaled_file_name("part.svg", scale)) for scale in SCALES]
+    full, full_sizes = read_svg(drawing.output_files()[0])
+    for scale, file_name in zip(SCALES, drawing.output_files()):
+        root, sizes = read_svg(file_name)
+        assert float(root.get("width")) == drawing.svg_width * scale
+        assert float(root.get("height")) == drawing.svg_height * scale
+        assert root.get("viewBox") == full.get("viewBox")
+        # the geometry is shared, only the bitmaps differ
+        assert len(root) == len(full) and [child.tag for child in root] == [child.tag for child in full]
+        assert sizes[:-1] == [(int(w * scale), int(h * scale)) for w, h in full_sizes[:-1]]
+        assert sizes[-1] == (8, 8)
+    # the document is left at unit scale
+    assert [node["xlink:href"] for _, node, _, _ in drawing.images] == hrefs
+    assert drawing.svg["width"] == drawing.svg_width
+
+## EOF
@@ -0,0 +1,57 @@
+"""pixel to hex picking as the inverse of `HexPicker.hex_origin`"""
+
+## IMPORTS
+
+import numpy as np
+import pytest
+
+from mwifmap.mwif_map_picking import HexPicker
+from mwifmap.mwif_map_renderer import GridLayer, MapDrawing
+from mwifmap.tests.synthetic import COLS, ROWS, make_reader
+
+
+## TESTS
+
+@pytest.mark.parametrize("scale, origin", [(1.0, (0, 0)), (0.5, (3, 2)), (0.25, (1, 1))])
+def test_pick_centres_and_vertices(scale, origin):
+    picker = HexPicker(scale, origin, COLS, ROWS)
+    q, r = np.meshgrid(np.arange(COLS), np.arange(ROWS), indexing="ij")
+    q, r = q.ravel(), r.ravel()
+    left, top = picker.hex_origin(q, r)
+    centre_q, centre_r = picker.pixel_to_hex(left + picker.hex_w / 2, top + picker.hex_h / 2)
+    assert np.array_equal(centre_q, q) and np.array_equal(centre_r, r)
+    # just inside the top and bottom vertices
+    for dy in (1e-3 * picker.hex_h, (1 - 1e-3) * picker.hex_h):
+        assert np.array_equal(picker.pixel_to_hex(left + picker.hex_w / 2, top + dy), (q, r))
+
+
+@pytest.mark.parametrize("scale", [1.0, 0.5])
+def test_picker_for_drawing(hexmap, scale):
+    drawing = MapDrawing(make_reader(hexmap), "tile.svg", scale=scale, region=(2, 1, 9, 6))
+    layer = GridLayer(drawing)
+    picker = HexPicker.for_drawing(drawing)
+    for q, r in [(2, 1), (5, 4), (9, 6)]:
+        assert np.allclose(picker.hex_origin(q, r), layer.hex_origin(q, r))
+        left, top = layer.hex_origin(q, r)
+        assert picker.pick(left + picker.hex_w / 2, top + picker.hex_h / 2) == (q, r)
+
+
+def test_pick_outside_of_the_map():
+    picker = HexPicker(1.0, (0, 0), COLS, ROWS)
+    assert picker.pick(-10, 80) is None
+    assert picker.pick(80, -200) is None
+
+
+def test_viewport_cells():
+    picker = HexPicker(1.0, (0, 0), COLS, ROWS)
+    left, top = picker.hex_origin(4, 3)
+    centre = left + picker.hex_w / 2, top + picker.hex_h / 2
+    assert picker.viewport_cells(centre[0] - 1, centre[1] - 1, centre[0] + 1, centre[1] + 1) == [(4, 3)]
+    every = sorted((q, r) for q in range(COLS) for r in range(ROWS))
+    assert picker.viewport_cells(-1000, -1000, 100000, 100000) == every
+    # every cell a point of the box is picked in intersects the box
+    xs, ys = np.meshgrid(np.linspace(150, 500, 60), np.linspace(100, 400, 60))
+    picked = set(zip(*(a.tolist() for a in picker.pixel_to_hex(xs.ravel(), ys.ravel()))))
+    assert picked <= set(picker.viewport_cells(150, 100, 500, 400))
+
+## EOF
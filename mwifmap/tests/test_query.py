@@ -0,0 +1,68 @@
+"""queries against the cell by cell evaluation of their conditions"""
+
+## IMPORTS
+
+import numpy as np
+import pytest
+
+from mwifmap.mwif_hexmap import feature_kind
+from mwifmap.mwif_map_query import Field, Predicate, field_index, query
+
+
+## CONSTANTS
+
+# (predicates, conditions, python test of a cell)
+CASES = [
+    ((Field("ter_code") == 3,), {}, lambda c: c["ter_code"] == 3),
+    ((), {"ter_code": "mountain"}, lambda c: c["ter_code"] == 5),
+    ((), {"country_id": [1, 3]}, lambda c: c.get("country_id") in (1, 3)),
+    ((), {"prt": True}, lambda c: feature_kind(c.get("prt", (0, 0))) != 0),
+    ((), {"prt": 2, "country_id": 2}, lambda c: c.get("prt", (0,))[0] == 2 and c.get("country_id") == 2),
+    (((Field("ter_code") > 2) & ~(Field("country_id") == 2),), {},
+     lambda c: c["ter_code"] > 2 and c.get("country_id") != 2),
+    (((Field("ter_code") == 0) | (Field("prt") >= 1),), {}, lambda c: c["ter_code"] == 0 or "prt" in c),
+    ((Field("country_id").exists(),), {"ter_code": lambda v: v % 2 == 0},
+     lambda c: "country_id" in c and c["ter_code"] % 2 == 0),
+]
+
+
+## TESTS
+
+@pytest.mark.parametrize("predicates, conditions, expected", CASES)
+def test_query_matches_cells(hexmap, predicates, conditions, expected):
+    keys = query(hexmap, *predicates, output="keys", **conditions)
+    assert keys == [q_r for q_r in hexmap if expected(hexmap[q_r])]
+    mask = query(hexmap, *predicates, output="mask", **conditions)
+    assert np.array_equal(np.flatnonzero(mask), query(hexmap, *predicates, output="indices", **conditions))
+
+
+def test_query_follows_changes(hexmap):
+    before = query(hexmap, country_id=2, output="keys")
+    hexmap[before[0]]["country_id"] = 3
+    assert query(hexmap, country_id=2, output="keys") == before[1:]
+
+
+def test_field_index(hexmap):
+    index = field_index(hexmap, "country_id")
+    assert field_index(hexmap, "country_id") is index
+    for country_id in (1, 2, 3, 9):
+        expected = [hexmap.index(q_r) for q_r, cell in hexmap.items() if cell.get("country_id") == country_id]
+        assert index.lookup(country_id).tolist() == expected and index.count(country_id) == len(expected)
+    hexmap[0, 0]["country_id"] = 9
+    assert field_index(hexmap, "country_id").lookup(9).tolist() == [hexmap.index((0, 0))]
+
+
+def test_query_rejects_bad_values(hexmap):
+    with pytest.raises(ValueError):
+        query(hexmap, country_id="x")
+    with pytest.raises(ValueError):
+        query(hexmap, ter_code="no such terrain")
+    with pytest.raises(ValueError):
+        query(hexmap, output="table")
+
+
+def test_predicate_is_abstract():
+    with pytest.raises(TypeError):
+        Predicate()
+
+## EOF
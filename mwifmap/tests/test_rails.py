@@ -0,0 +1,65 @@
+"""rail and road drawing at the edges of the map"""
+
+## IMPORTS
+
+import pytest
+
+from mwifmap.mwif_map_raster import RasterDrawing, RasterRailLayer
+from mwifmap.mwif_map_renderer import MapDrawing, RailLayer
+from mwifmap.tests.synthetic import COLS, ROWS, make_reader
+
+## CONSTANTS
+
+# west and east hexside bits
+W, E = 1, 8
+BACKENDS = {
+    "svg": (MapDrawing, RailLayer, "part.svg"),
+    "raster": (RasterDrawing, RasterRailLayer, "part.png"),
+}
+
+
+## HELPERS
+
+def add_edge_rails(hexmap):
+    """rails along the top and bottom rows, land without icons everywhere, returns the number of sections"""
+
+    for cell in hexmap.values():
+        cell["ter_code"] = 2
+        for field in ("cty", "prt", "res"):
+            cell[field] = 0, 0
+    n_sections = 0
+    for r in (0, ROWS - 1):
+        for q in range(COLS):
+            side = (W if q > 0 or hexmap.wrap else 0) | (E if q < COLS - 1 or hexmap.wrap else 0)
+            hexmap[q, r]["hexsides"] = [("Ra", side)]
+            n_sections += bin(side).count("1")
+    return n_sections
+
+
+## TESTS
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_rails_on_the_edge_rows(hexmap, tmp_path, backend):
+    drawing_cls, layer_cls, file_name = BACKENDS[backend]
+    n_sections = add_edge_rails(hexmap)
+    drawing = drawing_cls(make_reader(hexmap), str(tmp_path / file_name), region=(0, 0, COLS - 1, ROWS - 1))
+    drawing.add_layer(layer_cls)
+    stats = drawing.render()
+    assert (tmp_path / file_name).exists()
+    # every section is drawn, the svg layer draws a base and a dashed line for each
+    assert stats.layers[0].elements == n_sections * (2 if backend == "svg" else 1)
+    assert stats.layers[0].cells_drawn == 2 * COLS
+
+
+def test_rail_sections_follow_their_hexside(hexmap, tmp_path):
+    add_edge_rails(hexmap)
+    drawing = MapDrawing(make_reader(hexmap), str(tmp_path / "part.svg"), region=(0, 0, COLS - 1, ROWS - 1))
+    drawing.add_layer(RailLayer)
+    drawing.render()
+    hex_w = drawing.layers[0].hex_origin(1, 0)[0] - drawing.layers[0].hex_origin(0, 0)[0]
+    for line in drawing.layers[0].layer.elements:
+        (x0, y0), (x1, y1) = (line["x1"], line["y1"]), (line["x2"], line["y2"])
+        # W and E sections stay in their row and reach the next hex
+        assert y0 == y1 and 0 < abs(x1 - x0) < 2 * hex_w
+
+## EOF
@@ -0,0 +1,44 @@
+"""raster backend on synthetic maps"""
+
+## IMPORTS
+
+import math
+
+import pytest
+from PIL import Image
+
+from mwifmap.mwif_map_raster import (
+    RasterDrawing, RasterGridLayer, RasterLabelLayer, RasterTerrainLayer, get_font)
+from mwifmap.tests.synthetic import make_reader
+
+
+## TESTS
+
+@pytest.mark.parametrize("scale", [1.0, 0.5])
+def test_raster_drawing(hexmap, tmp_path, scale):
+    hexmap[3, 2]["labels"] = [("Tiny", (0, 0), 0, 0), ("Town", (4, 2), 4, 1)]
+    file_name = str(tmp_path / "tile.png")
+    drawing = RasterDrawing(make_reader(hexmap), file_name, scale=scale, region=(1, 1, 5, 4))
+    drawing.add_layer(RasterTerrainLayer, simple=True)
+    drawing.add_layer(RasterGridLayer, coords=True)
+    drawing.add_layer(RasterLabelLayer)
+    stats = drawing.render()
+    with Image.open(file_name) as image:
+        assert image.size == (math.ceil(drawing.svg_width), math.ceil(drawing.svg_height))
+    assert stats.layers[2].elements == 2
+
+
+def test_get_font_clamps_size():
+    assert get_font(0) is not None
+    assert get_font(-3) is not None
+
+
+@pytest.mark.parametrize("scale", [0.5, 0.25])
+def test_clock_offsets_scale(hexmap, scale):
+    full = RasterGridLayer(RasterDrawing(make_reader(hexmap), "tile.png", region=(0, 0, 5, 4)))
+    scaled = RasterGridLayer(RasterDrawing(make_reader(hexmap), "tile.png", scale=scale, region=(0, 0, 5, 4)))
+    for clock_pos in range(25):
+        (dx, dy), (full_dx, full_dy) = scaled.clock_offset(clock_pos), full.clock_offset(clock_pos)
+        assert abs(dx - full_dx * scale) <= 1 and abs(dy - full_dy * scale) <= 1
+
+## EOF
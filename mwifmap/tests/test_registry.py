@@ -0,0 +1,69 @@
+"""registries of the country and sea data files"""
+
+## IMPORTS
+
+import io
+
+import pytest
+
+from mwifmap.mwif_map_reader import REGISTRY_FILES, MWIFMapReader
+from mwifmap.mwif_map_registry import AdjRecord, CountryRecord, Registry, SeaRecord, parse_value
+
+
+## CONSTANTS
+
+CMA = "1,Germany,2,3.5\n2,\"France\",1,2.0\n2,France,0,0\nname,x\n\x1a\n"
+
+
+## TESTS
+
+def test_parse_value():
+    assert [parse_value(text) for text in (" 3", "2.5", " \"Baltic\" ")] == [3, 2.5, "Baltic"]
+
+
+def test_registry_records():
+    registry = Registry("cma", CountryRecord, "country_id")
+    assert registry.read(io.StringIO(CMA)) == [3]
+    assert (len(registry), registry.n_records) == (2, 3)
+    assert registry.first(1) == CountryRecord(1, "Germany", (2, 3.5))
+    assert [record.extra for record in registry[2]] == [(1, 2.0), (0, 0)]
+    assert registry.column("name") == {1: "Germany", 2: "France"}
+    assert registry.first(9) is None and 9 not in registry and list(registry) == [1, 2]
+
+
+def test_registry_columns_are_declared():
+    with pytest.raises(KeyError):
+        Registry("cma", CountryRecord).column("major")
+    with pytest.raises(ValueError):
+        Registry("sea", SeaRecord, "country_id")
+    registry = Registry("adj", AdjRecord, "sz_id")
+    # too few columns, and too many for a record type without extra columns
+    assert registry.read(io.StringIO("1\n1,2,3\n1,2\n")) == [0, 1]
+    assert registry[1] == [AdjRecord(1, 2)]
+    with pytest.raises(ValueError):
+        Registry("sea", SeaRecord).add((4,))
+
+
+def test_registry_cells(hexmap):
+    registry = Registry("cma", CountryRecord, "country_id")
+    registry.read(io.StringIO(CMA))
+    assert registry.cells(hexmap, 1) == [q_r for q_r, cell in hexmap.items() if cell.get("country_id") == 1]
+    hexmap[0, 0]["country_id"] = 2
+    assert (0, 0) in registry.cells(hexmap, 2)
+    with pytest.raises(ValueError):
+        Registry("rls", REGISTRY_FILES["rls"][1]).cells(hexmap, 1)
+
+
+def test_reader_loads_registries(tmp_path):
+    (tmp_path / "Test CMa.CSV").write_text(CMA)
+    (tmp_path / "Test SEA.CSV").write_text("1,North Sea,5\n")
+    reader = MWIFMapReader(map_dir=str(tmp_path), map_name="Test")
+    assert reader.load_registries() is False
+    assert reader.registry("cma").record_type is CountryRecord
+    assert reader.registry("sea").first(1).name == "North Sea"
+    with pytest.raises(KeyError):
+        reader.registry("cmi")
+    for file_fmt, record_type, link_field in REGISTRY_FILES.values():
+        assert link_field is None or link_field == record_type._fields[0]
+
+## EOF
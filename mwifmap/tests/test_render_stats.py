@@ -0,0 +1,43 @@
+"""per layer render metrics of `MapDrawing`"""
+
+## IMPORTS
+
+import json
+
+from mwifmap.mwif_map_renderer import GridLayer, MapDrawing, TerrainLayer
+from mwifmap.tests.synthetic import make_reader
+
+
+## TESTS
+
+def test_layer_stats(hexmap, tmp_path):
+    stats_file = str(tmp_path / "stats.jsonl")
+    drawing = MapDrawing(
+        make_reader(hexmap), str(tmp_path / "part.svg"), region=(2, 1, 6, 4), stats_file=stats_file)
+    drawing.add_layer(TerrainLayer, simple=True)
+    drawing.add_layer(GridLayer, coords=True)
+    stats = drawing.render()
+    n_cells = 5 * 4
+    assert [layer.name for layer in stats.layers] == ["TerrainLayer", "GridLayer"]
+    for layer in stats.layers:
+        assert layer.cells_visited == layer.cells_drawn == n_cells
+    assert stats.layers[0].elements == n_cells
+    assert stats.layers[1].elements == 2 * n_cells
+    assert stats.totals().elements == 3 * n_cells
+    assert stats.output_bytes == (tmp_path / "part.svg").stat().st_size
+    with open(stats_file) as fp:
+        records = [json.loads(line) for line in fp]
+    assert [record.get("name") for record in records[:2]] == ["TerrainLayer", "GridLayer"]
+    assert records[-1]["layers"] == ["TerrainLayer", "GridLayer"]
+    assert records[-1]["region"] == [2, 1, 6, 4]
+
+
+def test_rerender_resets_counters(hexmap, tmp_path):
+    drawing = MapDrawing(make_reader(hexmap), str(tmp_path / "part.svg"), region=(0, 0, 3, 3), background=None)
+    drawing.add_layer(GridLayer)
+    drawing.render(finalise=False)
+    drawing.layers[0].rerender()
+    assert drawing.layers[0].stats.cells_visited == 16
+    assert drawing.layers[0].stats.elements == 16
+
+## EOF
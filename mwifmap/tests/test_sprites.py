@@ -0,0 +1,88 @@
+"""the bitmap caches of the renderers"""
+
+## IMPORTS
+
+import numpy as np
+from PIL import Image
+
+from mwifmap.sprites import CoastalSprites, LRUCache
+from mwifmap.util import get_hex_dims
+
+
+## CONSTANTS
+
+HEX_W, HEX_H = (int(v) for v in get_hex_dims(1.0))
+
+
+## FIXTURES
+
+def make_pages(path, n_pages=2):
+    """coastal pages with random pixels, the last hex row runs past the bottom, odd rows past the right edge"""
+
+    rng = np.random.default_rng(1)
+    for page in range(1, n_pages + 1):
+        pixels = rng.integers(0, 256, (int(HEX_H * 2.5), HEX_W * 4, 3), dtype=np.uint8)
+        Image.fromarray(pixels, "RGB").save(str(path / "Page{:02d}.bmp".format(page)))
+    return str(path)
+
+
+def crop(path, page, row, idx):
+    """the hex the way the original renderer cut it, with PIL"""
+
+    x0 = (row % 2) * (HEX_W // 2) + idx * HEX_W
+    y0 = int(.75 * row * HEX_H)
+    with Image.open("{}/Page{:02d}.bmp".format(path, page)) as image:
+        return image.convert("RGB").crop((x0, y0, x0 + HEX_W, y0 + HEX_H))
+
+
+## TESTS
+
+def test_lru_cache_budget():
+    cache = LRUCache(10, size_of=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    assert cache.get("a") == "xxxx"
+    cache.put("c", "xxxx")
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.n_bytes == 8
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_cut_page_matches_crop(tmp_path):
+    path = make_pages(tmp_path)
+    sprites = CoastalSprites(coastal_dir=path)
+    for row, idx in [(0, 0), (1, 2), (2, 3), (3, 1)]:
+        sprite = sprites.sprite(1, row, idx)
+        assert sprite.size == (HEX_W, HEX_H)
+        assert np.array_equal(np.asarray(sprite), np.asarray(crop(path, 1, row, idx)))
+
+
+def test_cut_page_pads_black(tmp_path):
+    path = make_pages(tmp_path)
+    pixels = np.asarray(CoastalSprites(coastal_dir=path).sprite(1, 3, 3))
+    assert not pixels[-1].any() and not pixels[:, -1].any()
+
+
+def test_prepare_cuts_requested_cells(tmp_path):
+    path = make_pages(tmp_path)
+    sprites = CoastalSprites(coastal_dir=path)
+    cells = [{"coastal_bitmap": (2, 0, 1)}, {"coastal_bitmap": (2, 1, 0)}, {"ter_code": 0}]
+    sprites.prepare(cells, scale=.5)
+    assert len(sprites.cache) == 2 and sprites.pages_loaded == 1
+    assert sprites.sprite(2, 0, 1, .5).size == (HEX_W // 2, HEX_H // 2)
+    sprites.prepare(cells, scale=.5)
+    assert sprites.pages_loaded == 1
+
+
+def test_region_pass_holds_pages(tmp_path):
+    path = make_pages(tmp_path)
+    sprites = CoastalSprites(coastal_dir=path, max_page_bytes=1)
+    with sprites.region_pass():
+        sprites.page_data(1)
+        sprites.page_data(2)
+        sprites.page_data(1)
+        assert sprites.pages_loaded == 2
+    sprites.page_data(1)
+    assert sprites.pages_loaded == 3
+
+## EOF
@@ -0,0 +1,38 @@
+"""gzip compressed svg output"""
+
+## IMPORTS
+
+import gzip
+
+import pytest
+
+from mwifmap.mwif_map_renderer import GridLayer, MapDrawing, TerrainLayer
+from mwifmap.tests.synthetic import make_reader
+
+
+## HELPERS
+
+def draw(hexmap, file_name, **kwargs):
+    drawing = MapDrawing(make_reader(hexmap), file_name, region=(0, 0, 8, 6), **kwargs)
+    drawing.add_layer(TerrainLayer, simple=True)
+    drawing.add_layer(GridLayer, coords=True)
+    return drawing.render()
+
+
+## TESTS
+
+def test_svgz_matches_svg(hexmap, tmp_path):
+    draw(hexmap, str(tmp_path / "part.svg"))
+    stats = draw(hexmap, str(tmp_path / "part.svgz"))
+    with gzip.open(str(tmp_path / "part.svgz"), "rt", encoding="utf-8") as fp:
+        assert fp.read() == (tmp_path / "part.svg").read_text(encoding="utf-8")
+    assert stats.output_bytes == (tmp_path / "part.svgz").stat().st_size < (tmp_path / "part.svg").stat().st_size
+
+
+@pytest.mark.parametrize("compress_level", [1, 9])
+def test_svgz_compress_level(hexmap, tmp_path, compress_level):
+    draw(hexmap, str(tmp_path / "part.svgz"), compress_level=compress_level)
+    # the extra flags of the gzip header record the fastest (4) and best (2) compression
+    assert (tmp_path / "part.svgz").read_bytes()[8] == {1: 4, 9: 2}[compress_level]
+
+## EOF
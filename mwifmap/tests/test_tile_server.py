@@ -0,0 +1,81 @@
+"""request handling, caching and coalescing of the tile server"""
+
+## IMPORTS
+
+import asyncio
+import json
+import threading
+
+from mwifmap.tests.synthetic import COLS, ROWS, make_reader
+from mwifmap.tile_server import TileServer
+
+
+## HELPERS
+
+class FakeTileServer(TileServer):
+    """tile server that returns the tile key instead of rendering, once `release` is set"""
+
+    def __init__(self, *args, **kwargs):
+        super(FakeTileServer, self).__init__(*args, **kwargs)
+        self.release = threading.Event()
+        self.rendered = []
+
+    def render(self, region, scale, ext):
+        self.release.wait(5)
+        self.rendered.append((region, scale, ext))
+        return repr((region, scale, ext)).encode()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+## TESTS
+
+def test_parse_tile(hexmap):
+    server = TileServer(make_reader(hexmap), workers=1)
+    assert server.parse_tile("/0.5/1,2,3,4.svgz") == ((1, 2, 3, 4), .5, ".svgz")
+    assert server.parse_tile("/stats.svg") is None
+    for path in ("/0.5/1,2,3,4.gif", "/0/1,2,3,4.svg", "/1/3,2,1,4.svg", "/1/0,0,{},1.svg".format(COLS)):
+        status, body, _ = run(server.respond(["GET", path]))
+        assert status == 400 and body
+
+
+def test_respond_status(hexmap):
+    server = FakeTileServer(make_reader(hexmap), workers=1)
+    server.release.set()
+    assert run(server.respond(["POST", "/1/0,0,1,1.svg"]))[0] == 405
+    assert run(server.respond(["GET"]))[0] == 400
+    assert run(server.respond(["GET", "/nowhere"]))[0] == 404
+    status, body, headers = run(server.respond(["GET", "/1/0,0,1,{}.svgz?x=1".format(ROWS - 1)]))
+    assert status == 200 and headers == {"Content-Type": "image/svg+xml", "Content-Encoding": "gzip"}
+    assert body == repr(((0, 0, 1, ROWS - 1), 1.0, ".svgz")).encode()
+
+
+def test_coalesce_and_cache(hexmap):
+    server = FakeTileServer(make_reader(hexmap), workers=4)
+
+    async def requests():
+        tasks = [asyncio.ensure_future(server.get_tile(((0, 0, 2, 2), 1.0, ".svg"))) for _ in range(5)]
+        await asyncio.sleep(.05)
+        server.release.set()
+        rval = await asyncio.gather(*tasks)
+        rval.append(await server.get_tile(((0, 0, 2, 2), 1.0, ".svg")))
+        return rval
+
+    tiles = run(requests())
+    assert len(set(tiles)) == 1 and len(server.rendered) == 1
+    stats = json.loads(run(server.respond(["GET", "/stats"]))[1])
+    assert (stats["renders"], stats["coalesced"], stats["cache_tiles"], stats["pending"]) == (1, 4, 1, 0)
+    assert stats["cache_bytes"] == len(tiles[0])
+
+
+def test_cache_budget(hexmap):
+    server = FakeTileServer(make_reader(hexmap), cache_bytes=1, workers=1)
+    server.release.set()
+    for _ in range(2):
+        run(server.get_tile(((0, 0, 1, 1), 1.0, ".svg")))
+        run(server.get_tile(((0, 0, 2, 2), 1.0, ".svg")))
+    assert len(server.rendered) == 4 and len(server.cache) == 1
+
+## EOF
@@ -0,0 +1,88 @@
+"""change tracking of the map and partial re-rendering of drawings"""
+
+## IMPORTS
+
+from PIL import Image
+
+from mwifmap.mwif_map_renderer import (
+    BaseLayer, BorderLayer, GridLayer, LabelLayer, MapDrawing, MultiScaleDrawing, TerrainLayer)
+from mwifmap.tests.synthetic import make_reader
+
+
+## CONSTANTS
+
+LAYERS = [
+    (TerrainLayer, {"simple": True}),
+    (GridLayer, {"coords": True}),
+    (BorderLayer, {}),
+    (LabelLayer, {}),
+]
+
+
+## HELPERS
+
+class ImageLayer(BaseLayer):
+    """embeds a bitmap per land cell, to follow the images of a `MultiScaleDrawing`"""
+
+    FIELDS = ("ter_code",)
+
+    def _render(self, *args, **kwargs):
+        for cell in self.region_cells():
+            if cell["ter_code"] != 0:
+                image = Image.new("RGB", (136, 152), (cell["ter_code"] * 40, 0, 0))
+                self.add(self.embed_image(image, ("ter", cell["ter_code"])))
+
+
+def draw(reader, file_name, drawing_cls=MapDrawing, layers=LAYERS, **kwargs):
+    drawing = drawing_cls(reader, file_name, region=(1, 1, 8, 6), background=None, **kwargs)
+    for layer_cls, layer_kwargs in layers:
+        drawing.add_layer(layer_cls, **layer_kwargs)
+    drawing.render()
+    return drawing
+
+
+## TESTS
+
+def test_dirty_cells(hexmap):
+    hexmap.clear_dirty()
+    hexmap[4, 3]["ter_code"] = 5
+    assert hexmap.dirty_cells(expand=False) == {(4, 3)}
+    assert hexmap.dirty_cells(["country_id"]) == set()
+    for rings in (1, 2):
+        assert hexmap.dirty_cells(expand=rings) == {q_r for q_r in hexmap if hexmap.distance((4, 3), q_r) <= rings}
+    hexmap.clear_dirty()
+    version = hexmap.version
+    with hexmap.untracked():
+        hexmap[5, 3]["ter_code"] = 5
+    assert hexmap.dirty_cells() == set()
+    assert hexmap.version > version
+
+
+def test_update_matches_fresh_render(hexmap, tmp_path):
+    hexmap[3, 2]["labels"] = [("Town", (4, 2), 4, 1)]
+    reader = make_reader(hexmap)
+    reader.gen_border_data()
+    hexmap.clear_dirty()
+    drawing = draw(reader, str(tmp_path / "updated.svg"))
+    hexmap[4, 3]["ter_code"] = 5
+    hexmap[4, 3]["country_id"] = 9
+    hexmap[3, 2]["labels"].append(("Village", (0, 0), 2, 0))
+    hexmap[3, 2].touch("labels")
+    reader.gen_border_data(keys=hexmap.dirty_cells())
+    updated = drawing.update()
+    assert {layer.__class__ for layer in updated} == {TerrainLayer, BorderLayer, LabelLayer}
+    draw(reader, str(tmp_path / "fresh.svg"))
+    assert (tmp_path / "updated.svg").read_text() == (tmp_path / "fresh.svg").read_text()
+
+
+def test_update_replaces_images(hexmap, tmp_path):
+    reader = make_reader(hexmap)
+    drawing = draw(reader, str(tmp_path / "part.svg"), MultiScaleDrawing, [(ImageLayer, {})], scales=(1.0, .5))
+    hexmap.clear_dirty()
+    hexmap[4, 3]["ter_code"] = 0 if hexmap[4, 3]["ter_code"] else 5
+    assert drawing.update()
+    nodes = drawing.layers[0].layer.elements
+    assert len(drawing.images) == len(nodes) == sum(1 for cell in drawing.layers[0].region_cells() if cell["ter_code"])
+    assert all(any(node is element for element in nodes) for _, node, _, _ in drawing.images)
+
+## EOF
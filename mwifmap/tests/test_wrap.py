@@ -0,0 +1,88 @@
+"""hexside directions at the map edges and the east-west seam of wrapped maps"""
+
+## IMPORTS
+
+from mwifmap.mwif_hexmap import HexMap
+from mwifmap.mwif_map_metrics import components
+from mwifmap.mwif_map_picking import HexPicker
+from mwifmap.mwif_map_reader import get_border_line
+from mwifmap.tests.synthetic import COLS, ROWS
+
+
+## HELPERS
+
+def neighbor_by_side(hexmap, q, r, side):
+    """neighbor of (q, r) across hexside `side` (W, NW, NE, E, SE, SW), None off the map
+
+    Odd rows are shifted half a hex to the east.
+    """
+
+    shift = r % 2
+    dq, dr = [(-1, 0), (shift - 1, -1), (shift, -1), (1, 0), (shift, 1), (shift - 1, 1)][side]
+    nq, nr = q + dq, r + dr
+    if hexmap.wrap:
+        nq %= hexmap.cols
+    if 0 <= nq < hexmap.cols and 0 <= nr < hexmap.rows:
+        return nq, nr
+    return None
+
+
+## TESTS
+
+def test_neighbor_table_directions(hexmap):
+    table = hexmap.neighbor_table()
+    for q, r in hexmap:
+        row = table[hexmap.index((q, r))]
+        for side in range(6):
+            expected = neighbor_by_side(hexmap, q, r, side)
+            assert (hexmap.key_of(row[side]) if row[side] >= 0 else None) == expected
+
+
+def test_border_bits_on_the_edge_rows(hexmap):
+    for cell in hexmap.values():
+        cell["country_id"] = 1 if cell.q < COLS // 2 else 2
+    borders = dict(get_border_line(hexmap, "country_id"))
+    for q_r, cell in hexmap.items():
+        expected = sum(
+            2 ** side for side in range(6)
+            if neighbor_by_side(hexmap, q_r[0], q_r[1], side) is not None
+            and hexmap[neighbor_by_side(hexmap, q_r[0], q_r[1], side)]["country_id"] != cell["country_id"])
+        assert borders.get(q_r, 0) == expected
+    # the top and bottom rows have borders on their W and E sides
+    for r in (0, ROWS - 1):
+        assert borders[COLS // 2 - 1, r] & 8 and borders[COLS // 2, r] & 1
+
+
+def test_wrap_distance():
+    hexmap = HexMap(10, 5, wrap=True)
+    assert hexmap.distance((0, 2), (9, 2)) == 1
+    assert hexmap.distance((9, 2), (0, 2)) == 1
+    assert hexmap.distance((0, 2), (5, 2)) == 5
+    assert (9, 2) in set(hexmap.neighbors((0, 2)))
+    assert HexMap(10, 5).distance((0, 2), (9, 2)) == 9
+
+
+def test_wrapped_component_bbox():
+    hexmap = HexMap(10, 5, wrap=True)
+    for q, r in hexmap:
+        hexmap[q, r]["ter_code"] = 2 if r == 2 and q in (8, 9, 0, 1) else 0
+    land = components(hexmap, "land")
+    assert len(land) == 1
+    assert land.bboxes[0].tolist() == [8, 2, 11, 2]
+
+
+def test_pick_wrapped():
+    picker = HexPicker(1.0, (0, 0), COLS, ROWS, wrap=True)
+    left, top = picker.hex_origin(COLS + 1, 2)
+    assert picker.pick(left + picker.hex_w / 2, top + picker.hex_h / 2) == (1, 2)
+    left, top = picker.hex_origin(-1, 2)
+    assert picker.pick(left + picker.hex_w / 2, top + picker.hex_h / 2) == (COLS - 1, 2)
+
+
+def test_viewport_cells_wrapped():
+    picker = HexPicker(1.0, (0, 0), COLS, ROWS, wrap=True)
+    # odd rows are shifted by half a hex, so (0, 1) starts right of the box
+    assert picker.viewport_cells(-50, 100, 50, 120) == [(0, 0), (COLS - 1, 0), (COLS - 1, 1)]
+    assert picker.pick(-10, 80) == (COLS - 1, 0)
+
+## EOF
@@ -0,0 +1,255 @@
+"""multi resolution z/x/y tile pyramid of the map
+
+The pyramid is built depth first. Blocks of `2 ** meta_depth` by `2 ** meta_depth` tiles are rendered once at
+the highest zoom level with the raster backend, and every lower level is downsampled from the level below.
+The overlay layers are chosen per level by the level-of-detail rules, so labels, grid coordinates and minor
+features vanish at low zoom. They are drawn at the highest zoom level too and downsampled, as their icon sizes
+and offsets are fixed in pixels of the full scale.
+"""
+
+## IMPORTS
+
+import logging
+import math
+import os
+from PIL import Image
+
+from mwifmap.mwif_map_raster import (
+    RasterDrawing, RasterTerrainLayer, RasterCoastalLayer, RasterRVRLayer, RasterHexsideLayer, RasterGridLayer,
+    RasterRailLayer, RasterBorderLayer, RasterFeatureLayer, RasterLabelLayer)
+from mwifmap.mwif_map_reader import MWIFMapReader
+from mwifmap.mwif_map_renderer import LabelLayer
+from mwifmap.util import get_hex_dims
+
+## LOGGING
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+## CONSTANTS
+
+TILE_SIZE = 256
+
+# hexes around a drawn area whose labels may reach into it
+LABEL_MARGIN = 3
+
+BASE_LAYERS = [
+    (RasterTerrainLayer, {"simple": False}),
+    (RasterCoastalLayer, {"simple": False}),
+    (RasterRVRLayer, {}),
+    (RasterBorderLayer, {}),
+]
+
+# level of detail: levels below the highest zoom level -> overlay layers drawn at that level
+LOD_RULES = {
+    0: [
+        (RasterHexsideLayer, {}),
+        (RasterGridLayer, {"coords": True}),
+        (RasterRailLayer, {}),
+        (RasterFeatureLayer, {}),
+        (RasterLabelLayer, {}),
+    ],
+    1: [
+        (RasterGridLayer, {"coords": False}),
+        (RasterRailLayer, {}),
+        (RasterFeatureLayer, {"minor": False}),
+        (RasterLabelLayer, {"min_size": 6, "cull": True}),
+    ],
+    2: [
+        (RasterFeatureLayer, {"minor": False}),
+        (RasterLabelLayer, {"min_size": 10, "cull": True}),
+    ],
+}
+
+
+## CLASSES
+
+class TilePyramid(object):
+    """slippy map style tile pyramid generator"""
+
+    def __init__(self, map_reader, out_dir, max_zoom=8, min_zoom=0, scale=1.0, tile_size=TILE_SIZE,
+                 meta_depth=3, lod_rules=None, base_layers=None, ext=".png", background="default"):
+        self.map_reader = map_reader
+        self.out_dir = out_dir
+        self.max_zoom = int(max_zoom)
+        self.min_zoom = int(min_zoom)
+        self.scale = float(scale)
+        self.tile_size = int(tile_size)
+        self.meta_depth = int(meta_depth)
+        self.lod_rules = LOD_RULES if lod_rules is None else lod_rules
+        self.base_layers = BASE_LAYERS if base_layers is None else base_layers
+        self.ext = ext
+        self.background = background
+        self.n_tiles = 0
+        self._kept_labels = {}
+
+    ## geometry
+
+    def level_scale(self, z):
+        return self.scale / 2 ** (self.max_zoom - z)
+
+    def level_size(self, z):
+        """pixel size of the whole map at zoom level `z`"""
+
+        hex_w, hex_h = get_hex_dims(self.level_scale(z))
+        cols, rows = self.map_reader.map.cols, self.map_reader.map.rows
+        return (cols + .5) * hex_w + 1, (rows * .75 + .25) * hex_h + 1
+
+    def level_tiles(self, z):
+        """number of tiles in x and y at zoom level `z`"""
+
+        w, h = self.level_size(z)
+        return int(math.ceil(w / self.tile_size)), int(math.ceil(h / self.tile_size))
+
+    def valid_tile(self, z, x, y):
+        nx, ny = self.level_tiles(z)
+        return 0 <= x < nx and 0 <= y < ny
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.out_dir, str(z), str(x), "{}{}".format(y, self.ext))
+
+    ## rendering
+
+    def render_area(self, z, px_x, px_y, px_w, px_h, layers, background=None):
+        """render `layers` for the pixel box (px_x, px_y, px_w, px_h) of zoom level `z`"""
+
+        scale = self.level_scale(z)
+        hex_w, hex_h = get_hex_dims(scale)
+        cols, rows = self.map_reader.map.cols, self.map_reader.map.rows
+        region = (
+            max(int(math.floor(px_x / hex_w)) - 1, 0),
+            max(int(math.floor(px_y / (.75 * hex_h))) - 1, 0),
+            min(int(math.ceil((px_x + px_w) / hex_w)) + 1, cols - 1),
+            min(int(math.ceil((px_y + px_h) / (.75 * hex_h))) + 1, rows - 1),
+        )
+        drawing = RasterDrawing(
+            self.map_reader, "tile", scale=scale, region=region, background=background)
+        for layer_cls, kwargs in layers:
+            drawing.add_layer(layer_cls, **kwargs)
+        drawing.render(finalise=False)
+        # drawing origin in level pixel coordinates
+        left = int(round(px_x - region[0] * hex_w))
+        top = int(round(px_y - .75 * region[1] * hex_h))
+        return drawing.image.crop((left, top, left + int(px_w), top + int(px_h)))
+
+    def render_overlay(self, z, px_x, px_y, px_w, px_h):
+        """overlay layers of level `z` for its pixel box, drawn at the highest zoom level and downsampled
+
+        The cost grows with 4 ** (max_zoom - z), so overlay rules are meant for the few levels below the highest.
+        """
+
+        factor = 2 ** (self.max_zoom - z)
+        overlay = self.render_area(
+            self.max_zoom, px_x * factor, px_y * factor, px_w * factor, px_h * factor, self.overlays(z))
+        if factor > 1:
+            overlay = overlay.resize((int(px_w), int(px_h)), Image.LANCZOS)
+        return overlay
+
+    def overlays(self, z):
+        """overlay layers of level `z`, culled label layers get the labels kept over the whole level"""
+
+        rval = []
+        for layer_cls, kwargs in self.lod_rules.get(self.max_zoom - z, []):
+            if issubclass(layer_cls, RasterLabelLayer) and kwargs.get("cull") is True and "kept" not in kwargs:
+                kwargs = dict(kwargs, kept=self.kept_labels(z, kwargs), margin=LABEL_MARGIN)
+            rval.append((layer_cls, kwargs))
+        return rval
+
+    def kept_labels(self, z, kwargs):
+        """(key, pos) of the labels of level `z` kept by the placement over the whole map
+
+        The placement is decided once per level, so a label is kept or dropped the same in all its tiles. The
+        overlays are drawn at the highest zoom level, so are the label positions.
+        """
+
+        if z not in self._kept_labels:
+            hex_w, hex_h = get_hex_dims(self.scale)
+
+            def hex_origin(q, r):
+                return (hex_w / 2 if r % 2 else 0) + q * hex_w + 1, .75 * r * hex_h + 1
+
+            items = LabelLayer.label_items(
+                self.map_reader.map.values(), hex_origin, int(kwargs.get("min_size", 0)))
+            self._kept_labels[z] = LabelLayer.kept_labels(items, float(kwargs.get("padding", 2)))
+        return self._kept_labels[z]
+
+    def write_tile(self, z, x, y, base, overlay=None):
+        tile = base
+        if overlay is not None:
+            tile = Image.alpha_composite(base, overlay)
+        path = self.tile_path(z, x, y)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tile.save(path)
+        self.n_tiles += 1
+
+    def build_block(self, z, x, y):
+        """render tile z/x/y and all its descendants from one block rendered at the highest zoom level"""
+
+        t = self.tile_size
+        depth = self.max_zoom - z
+        block = self.render_area(
+            self.max_zoom, x * t * 2 ** depth, y * t * 2 ** depth, t * 2 ** depth, t * 2 ** depth,
+            self.base_layers, background=self.background)
+        for level in range(depth, -1, -1):
+            # level counts the levels above the highest zoom level
+            lz = self.max_zoom - level
+            n = 2 ** (depth - level)
+            size = t * n
+            base = block if size == block.size[0] else block.resize((size, size), Image.LANCZOS)
+            overlay = None
+            if self.overlays(lz):
+                overlay = self.render_overlay(lz, x * size, y * size, size, size)
+                base = Image.alpha_composite(base, overlay)
+            for dx in range(n):
+                for dy in range(n):
+                    if self.valid_tile(lz, x * n + dx, y * n + dy):
+                        self.write_tile(lz, x * n + dx, y * n + dy,
+                                        base.crop((dx * t, dy * t, (dx + 1) * t, (dy + 1) * t)))
+        return block.resize((t, t), Image.LANCZOS) if depth else block
+
+    def build_tile(self, z, x, y):
+        """build tile z/x/y and its descendants, returns the base image of the tile"""
+
+        t = self.tile_size
+        if self.max_zoom - z <= self.meta_depth:
+            return self.build_block(z, x, y)
+        base = Image.new("RGBA", (2 * t, 2 * t), (0, 0, 0, 0))
+        for dx in range(2):
+            for dy in range(2):
+                if self.valid_tile(z + 1, 2 * x + dx, 2 * y + dy):
+                    base.paste(self.build_tile(z + 1, 2 * x + dx, 2 * y + dy), (dx * t, dy * t))
+        base = base.reduce(2)
+        overlay = None
+        if self.overlays(z):
+            overlay = self.render_overlay(z, x * t, y * t, t, t)
+        self.write_tile(z, x, y, base, overlay)
+        return base
+
+    def build(self):
+        """build all tiles from `min_zoom` to `max_zoom`, returns the number of tiles written"""
+
+        self.n_tiles = 0
+        nx, ny = self.level_tiles(self.min_zoom)
+        for x in range(nx):
+            for y in range(ny):
+                logger.info("building tile %s/%s/%s", self.min_zoom, x, y)
+                self.build_tile(self.min_zoom, x, y)
+        return self.n_tiles
+
+
+## MAIN
+
+def gen_tiles(out_dir="tiles", max_zoom=8, min_zoom=0):
+    VERBOSE = True
+    m = MWIFMapReader().load_all(verbose=VERBOSE)
+    pyramid = TilePyramid(m, out_dir, max_zoom=max_zoom, min_zoom=min_zoom)
+    n_tiles = pyramid.build()
+    print("wrote {} tiles to \"{}\"".format(n_tiles, out_dir))
+    return pyramid
+
+
+if __name__ == "__main__":
+    gen_tiles()
+
+## EOF
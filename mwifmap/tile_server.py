@@ -0,0 +1,202 @@
+"""local http server rendering map regions on demand
+
+One `MWIFMapReader` is loaded at startup and shared by a pool of render threads. Rendered tiles are kept in
+a LRU cache with a byte budget, and concurrent requests for the same tile wait for a single render.
+
+Tiles are requested as
+
+    GET /<scale>/<q_min>,<r_min>,<q_max>,<r_max>.<ext>
+
+with `ext` one of svg, svgz, png or webp, e.g. http://127.0.0.1:8035/0.5/18,18,40,40.svgz. `GET /stats`
+returns the cache counters as json.
+"""
+
+## IMPORTS
+
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from mwifmap.mwif_map_raster import gen_raster
+from mwifmap.mwif_map_reader import MWIFMapReader
+from mwifmap.mwif_map_renderer import gen_svg
+from mwifmap.sprites import LRUCache
+
+## LOGGING
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+## CONSTANTS
+
+HOST = "127.0.0.1"
+PORT = 8035
+CACHE_BYTES = 256 * 2 ** 20
+
+CONTENT_TYPES = {
+    ".svg": "image/svg+xml",
+    ".svgz": "image/svg+xml",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+TILE_PATH = re.compile(r"^/(?P<scale>\d+(\.\d+)?)/(?P<region>\d+,\d+,\d+,\d+)(?P<ext>\.\w+)$")
+STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+## CLASSES
+
+class TileServer(object):
+    """asyncio http server for map tiles rendered on demand"""
+
+    def __init__(self, map_reader, host=HOST, port=PORT, cache_bytes=CACHE_BYTES, workers=None):
+        self.map_reader = map_reader
+        self.host = host
+        self.port = int(port)
+        self.cache = LRUCache(cache_bytes, size_of=len)
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.renders = 0
+        self.coalesced = 0
+        self._pending = {}
+
+    ## rendering
+
+    def parse_tile(self, path):
+        """tile key (region, scale, ext) for a request path, None if the path is no tile"""
+
+        match = TILE_PATH.match(path)
+        if match is None:
+            return None
+        scale = float(match.group("scale"))
+        region = tuple(int(v) for v in match.group("region").split(","))
+        ext = match.group("ext")
+        if ext not in CONTENT_TYPES:
+            raise ValueError("unknown tile format: {}".format(ext))
+        if not 0 < scale <= 4:
+            raise ValueError("scale out of range: {}".format(scale))
+        q_min, r_min, q_max, r_max = region
+        if not (q_min <= q_max < self.map_reader.map.cols and r_min <= r_max < self.map_reader.map.rows):
+            raise ValueError("region out of range: {}".format(region))
+        return region, scale, ext
+
+    def render(self, region, scale, ext):
+        """render a tile in a worker thread, returns the file content"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "tile" + ext)
+            if ext in (".png", ".webp"):
+                drawing = gen_raster(self.map_reader, file_name, region=region, scale=scale)
+            else:
+                drawing = gen_svg(self.map_reader, file_name, region=region, scale=scale)
+            with open(drawing.svg_name, "rb") as fp:
+                return fp.read()
+
+    async def get_tile(self, key):
+        """content of tile `key`, from the cache or rendered once for all concurrent requests"""
+
+        rval = self.cache.get(key)
+        if rval is not None:
+            return rval
+        if key in self._pending:
+            self.coalesced += 1
+            return await asyncio.shield(self._pending[key])
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.render, *key)
+        self._pending[key] = future
+        try:
+            rval = await future
+            self.renders += 1
+            self.cache.put(key, rval)
+        finally:
+            del self._pending[key]
+        return rval
+
+    def stats(self):
+        return {
+            "renders": self.renders,
+            "coalesced": self.coalesced,
+            "pending": len(self._pending),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_tiles": len(self.cache),
+            "cache_bytes": self.cache.n_bytes,
+        }
+
+    ## http
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            # skip the headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            status, body, headers = await self.respond(request)
+        except Exception as ex:
+            logger.exception("failed to handle request")
+            status, body, headers = 500, str(ex).encode(), {"Content-Type": "text/plain"}
+        head = ["HTTP/1.1 {} {}".format(status, STATUS[status])]
+        headers.update({"Content-Length": len(body), "Connection": "close"})
+        head.extend("{}: {}".format(k, v) for k, v in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, request):
+        """status, body and headers for a parsed request line"""
+
+        text = {"Content-Type": "text/plain"}
+        if len(request) < 2:
+            return 400, b"bad request", text
+        method, path = request[0], request[1].split("?")[0]
+        if method != "GET":
+            return 405, b"only GET is supported", text
+        if path == "/stats":
+            return 200, json.dumps(self.stats()).encode(), {"Content-Type": "application/json"}
+        try:
+            key = self.parse_tile(path)
+        except ValueError as ex:
+            return 400, str(ex).encode(), text
+        if key is None:
+            return 404, b"not found", text
+        headers = {"Content-Type": CONTENT_TYPES[key[2]]}
+        if key[2] == ".svgz":
+            headers["Content-Encoding"] = "gzip"
+        return 200, await self.get_tile(key), headers
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info("serving tiles on http://%s:%s/", self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.executor.shutdown()
+
+
+## MAIN
+
+def serve_tiles(host=HOST, port=PORT, cache_bytes=CACHE_BYTES, workers=None):
+    m = MWIFMapReader().load_all(verbose=True)
+    server = TileServer(m, host=host, port=port, cache_bytes=cache_bytes, workers=workers)
+    print("serving tiles on http://{}:{}/".format(host, port))
+    server.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve_tiles()
+
+## EOF
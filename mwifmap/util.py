@@ -4,30 +4,82 @@
 
 import math
 import base64
+import collections.abc
+import importlib
 from configparser import ConfigParser
 from io import BytesIO
-from PIL import Image
 
 ## CONSTANTS
 
 SQRT3 = math.sqrt(3.0)
 SQRT3BY2 = SQRT3 / 2.0
 
+SETTINGS_FILES = ["settings.cfg", "./settings.cfg", "./mwifmap/settings.cfg"]
+
+
+## LAZY LOADING
+
+class LazySettings(collections.abc.Mapping):
+    """settings sections of `SETTINGS_FILES`, read on first access"""
+
+    def __init__(self, file_names):
+        self.file_names = file_names
+        self._sections = None
+
+    def load(self):
+        if self._sections is None:
+            cp = ConfigParser()
+            cp.read(self.file_names)
+            self._sections = cp._sections
+        return self._sections
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+class LazyModule(object):
+    """stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return "<lazy module {!r}>".format(self._name)
+
+
 ## SETTINGS
 
-cp = ConfigParser()
-cp.read(["settings.cfg", "./settings.cfg", "./mwifmap/settings.cfg"])
-SETTINGS = cp._sections
-del cp
+SETTINGS = LazySettings(SETTINGS_FILES)
+
+# PIL is only needed by the renderers
+Image = LazyModule("PIL.Image")
 
 
 ## HELPERS
 
-def pil_img_resize(image, scale):
+def pil_img_resample(scale):
+    """the resampling filter used by `pil_img_resize` for `scale`"""
+
+    return Image.LANCZOS if scale < 1.0 else Image.BICUBIC
+
+
+def pil_img_resize(image, scale, resample=None):
     if scale == 1.0:
         return image
     dims = tuple(int(ii * scale) for ii in image.size)
-    return image.resize(dims, Image.ANTIALIAS if scale < 1.0 else Image.BICUBIC)
+    return image.resize(dims, pil_img_resample(scale) if resample is None else resample)
 
 
 def pil_img_to_b64_png(image):
@@ -68,6 +120,10 @@ def html2f(html_colour_str):
     return r, g, b
 
 
+def get_base_path():
+    return SETTINGS["filesystem"]["basepath"]
+
+
 def get_hex_proto(scale=1.0):
     """return the list of points that from a hex shape"""
 